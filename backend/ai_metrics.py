@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+AI调用计量模块
+
+记录每次AI调用（LLM文本、视觉分析、Docling转换）的阶段、模型、令牌数、耗时、
+缓存命中和结果，先放入内存缓冲区，由后台任务批量写入 AIProcessLog，
+调用路径上只做一次追加；并按阶段、按天汇总 p50/p95 耗时和令牌总量。
+"""
+
+import math
+import time
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+# 计量记录的阶段（AIProcessLog.task_type）
+METRIC_STAGES = ("llm_call", "text_analysis", "vision_analysis", "docling_convert")
+
+
+def normalize_usage(usage: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    """统一OpenAI（prompt/completion_tokens）与Anthropic（input/output_tokens）的用量字段"""
+    usage = usage or {}
+    prompt_tokens = int(usage.get("prompt_tokens") or usage.get("input_tokens") or 0)
+    completion_tokens = int(usage.get("completion_tokens") or usage.get("output_tokens") or 0)
+    total_tokens = int(usage.get("total_tokens") or prompt_tokens + completion_tokens)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": total_tokens
+    }
+
+
+def merge_usage(usages: List[Optional[Dict[str, Any]]]) -> Dict[str, int]:
+    """合并多次调用（如按页视觉请求）的用量"""
+    merged = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    for usage in usages:
+        for key, value in normalize_usage(usage).items():
+            merged[key] += value
+    return merged
+
+
+def percentile(values: List[float], ratio: float) -> Optional[float]:
+    """最近秩百分位数（values需已排序）"""
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, math.ceil(ratio * len(values)) - 1))
+    return values[index]
+
+
+class AIMetricsRecorder:
+    """AI调用计量：内存缓冲 + 后台批量写入 AIProcessLog"""
+
+    def __init__(self, enabled: bool = True, flush_interval: float = 5.0, batch_size: int = 200,
+                 max_buffer: int = 10000):
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._buffer: deque = deque(maxlen=max_buffer)
+        self._task: Optional[asyncio.Task] = None
+
+        # 指标
+        self._recorded = 0
+        self._written = 0
+        self._dropped = 0
+        self._write_errors = 0
+
+    def configure(self, enabled: bool, flush_interval: float):
+        self.enabled = enabled
+        self.flush_interval = max(0.5, flush_interval)
+
+    def record(
+        self,
+        stage: str,
+        started: float,
+        model: Optional[str] = None,
+        provider: Optional[str] = None,
+        usage: Optional[Dict[str, Any]] = None,
+        cache_hit: bool = False,
+        success: bool = True,
+        error: Optional[str] = None,
+        source_file: Optional[str] = None,
+        extra: Optional[Dict[str, Any]] = None
+    ):
+        """记录一次调用；started 为 time.perf_counter() 起始值。只追加到缓冲区，不访问数据库"""
+        if not self.enabled:
+            return
+        latency = time.perf_counter() - started
+        finished_at = datetime.now()
+        if len(self._buffer) == self._buffer.maxlen:
+            self._dropped += 1
+        self._buffer.append({
+            "task_type": stage,
+            "source_file": source_file,
+            "result": {
+                "model": model,
+                "provider": provider,
+                **normalize_usage(usage),
+                "cache_hit": bool(cache_hit),
+                **(extra or {})
+            },
+            "processing_time": round(latency, 4),
+            "status": "completed" if success else "failed",
+            "error_message": (str(error)[:1000] if error else None),
+            "created_at": finished_at - timedelta(seconds=latency),
+            "completed_at": finished_at
+        })
+        self._recorded += 1
+
+    # ---------- 后台写入 ----------
+
+    def start(self):
+        """启动后台批量写入任务（需在事件循环中调用）"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._flush_loop())
+
+    async def stop(self):
+        """停止后台任务并写入剩余记录"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"AI调用计量写入失败: {e}")
+
+    async def flush(self):
+        """把缓冲区中的记录分批写入数据库"""
+        loop = asyncio.get_event_loop()
+        while self._buffer:
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            await loop.run_in_executor(None, self._write_batch, batch)
+
+    def _write_batch(self, batch: List[Dict[str, Any]]):
+        from database import SessionLocal
+        from models import AIProcessLog
+
+        db = SessionLocal()
+        try:
+            db.bulk_insert_mappings(AIProcessLog, batch)
+            db.commit()
+            self._written += len(batch)
+        except Exception as e:
+            db.rollback()
+            self._write_errors += 1
+            self._dropped += len(batch)
+            logger.warning(f"写入AI调用计量失败，丢弃 {len(batch)} 条记录: {e}")
+        finally:
+            db.close()
+
+    # ---------- 汇总 ----------
+
+    def summarize(self, db, days: int = 7, stage: Optional[str] = None) -> Dict[str, Any]:
+        """按阶段、按天汇总调用次数、失败数、缓存命中率、p50/p95耗时和令牌总量"""
+        from models import AIProcessLog
+
+        since = datetime.now() - timedelta(days=days)
+        query = db.query(
+            AIProcessLog.task_type,
+            AIProcessLog.processing_time,
+            AIProcessLog.status,
+            AIProcessLog.result,
+            AIProcessLog.created_at
+        ).filter(AIProcessLog.created_at >= since)
+        query = query.filter(AIProcessLog.task_type == stage) if stage else \
+            query.filter(AIProcessLog.task_type.in_(METRIC_STAGES))
+
+        groups: Dict[str, Dict[str, Any]] = {}
+        daily: Dict[tuple, Dict[str, Any]] = {}
+        for task_type, processing_time, status, result, created_at in query.yield_per(1000):
+            day = created_at.date().isoformat() if created_at else None
+            for bucket in (groups.setdefault(task_type, {}), daily.setdefault((day, task_type), {})):
+                self._accumulate(bucket, processing_time, status, result or {})
+
+        return {
+            "days": days,
+            "since": since.isoformat(),
+            "stages": {name: self._finalize(bucket) for name, bucket in sorted(groups.items())},
+            "daily": [
+                {"date": day, "stage": name, **self._finalize(bucket)}
+                for (day, name), bucket in sorted(daily.items(), key=lambda item: (item[0][0] or "", item[0][1]))
+            ]
+        }
+
+    @staticmethod
+    def _accumulate(bucket: Dict[str, Any], processing_time: Optional[float], status: str, result: Dict[str, Any]):
+        bucket.setdefault("latencies", []).append(processing_time or 0.0)
+        bucket["calls"] = bucket.get("calls", 0) + 1
+        bucket["failed"] = bucket.get("failed", 0) + int(status == "failed")
+        bucket["cache_hits"] = bucket.get("cache_hits", 0) + int(bool(result.get("cache_hit")))
+        for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+            bucket[key] = bucket.get(key, 0) + int(result.get(key) or 0)
+
+    @staticmethod
+    def _finalize(bucket: Dict[str, Any]) -> Dict[str, Any]:
+        latencies = sorted(bucket.pop("latencies"))
+        calls = bucket["calls"]
+        return {
+            **bucket,
+            "cache_hit_rate": round(bucket["cache_hits"] / calls, 4),
+            "latency_p50": round(percentile(latencies, 0.5), 4),
+            "latency_p95": round(percentile(latencies, 0.95), 4),
+            "latency_avg": round(sum(latencies) / calls, 4)
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "flush_interval": self.flush_interval,
+            "buffered": len(self._buffer),
+            "recorded": self._recorded,
+            "written": self._written,
+            "dropped": self._dropped,
+            "write_errors": self._write_errors,
+        }
+
+
+# 全局AI调用计量实例
+ai_metrics = AIMetricsRecorder()
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+AI调用容错模块
+
+- 对429/5xx/超时/网络错误按带抖动的指数退避重试，并遵循Retry-After
+- 按提供商的熔断器：连续失败达到阈值后快速失败，冷却后放行一个探测请求
+- 后台任务因提供商暂时不可用而失败时，延迟后自动重新排队
+"""
+
+import time
+import random
+import asyncio
+import logging
+from typing import Dict, Any, Optional, Callable, Awaitable
+
+import aiohttp
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+# 可重试的HTTP状态码
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class RetryableError(Exception):
+    """可重试的提供商错误（限流、服务端错误、超时）"""
+
+    def __init__(self, message: str, status: Optional[int] = None, retry_after: Optional[float] = None,
+                 details: Any = None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.retry_after = retry_after
+        self.details = details
+
+
+class CircuitBreaker:
+    """单个提供商的熔断器（closed → open → half_open → closed）"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+
+        self.state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+        # 指标
+        self._opened_count = 0
+        self._rejected = 0
+
+    def configure(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+
+    def retry_in(self) -> float:
+        """距离允许探测还需等待的秒数"""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        """是否放行请求；熔断冷却结束后只放行一个探测请求"""
+        if self.state == self.OPEN and self.retry_in() <= 0:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+            logger.info(f"AI提供商 {self.name} 熔断冷却结束，放行探测请求")
+
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+
+        self._rejected += 1
+        return False
+
+    def release_probe(self):
+        """探测请求既未成功也未失败（如被取消）时释放探测名额，允许下一个请求探测"""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info(f"AI提供商 {self.name} 已恢复，关闭熔断")
+        self.state = self.CLOSED
+        self._consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self._consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self._opened_count += 1
+                logger.warning(f"AI提供商 {self.name} 连续失败 {self._consecutive_failures} 次，"
+                               f"熔断 {self.reset_timeout:.0f}s")
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_timeout": self.reset_timeout,
+            "retry_in": round(self.retry_in(), 2),
+            "opened_count": self._opened_count,
+            "rejected": self._rejected,
+        }
+
+
+class AIResilience:
+    """按提供商的重试与熔断策略"""
+
+    def __init__(self):
+        self.max_attempts = 3
+        self.base_delay = 1.0
+        self.max_delay = 30.0
+        self.failure_threshold = 5
+        self.reset_timeout = 30.0
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+        # 指标
+        self._retries = 0
+        self._exhausted = 0
+        self._fast_failed = 0
+
+    def configure(self, max_attempts: int, base_delay: float, max_delay: float,
+                  failure_threshold: int, reset_timeout: float):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = max(0.0, base_delay)
+        self.max_delay = max(self.base_delay, max_delay)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        for breaker in self._breakers.values():
+            breaker.configure(failure_threshold, reset_timeout)
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(name, self.failure_threshold, self.reset_timeout)
+            self._breakers[name] = breaker
+        return breaker
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """第 attempt 次失败后的等待时间：全抖动指数退避，不短于Retry-After"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after:
+            delay = max(delay, retry_after)
+        return delay
+
+    async def execute(self, provider: str, attempt: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """执行一次带重试和熔断的调用
+
+        attempt() 返回结果字典（成功或不可重试的失败）；可重试的失败抛出 RetryableError，
+        网络错误和超时同样视为可重试。重试耗尽或熔断时返回带 retryable=True 的错误字典。
+        """
+        breaker = self.breaker(provider)
+        last_error: Optional[RetryableError] = None
+        attempts = 0
+
+        while attempts < self.max_attempts:
+            if not breaker.allow():
+                self._fast_failed += 1
+                return {
+                    "success": False,
+                    "error": f"AI提供商 {provider} 暂不可用（熔断中）",
+                    "retryable": True,
+                    "circuit_open": True,
+                    "retry_after": round(breaker.retry_in(), 2) or self.reset_timeout
+                }
+
+            attempts += 1
+            try:
+                result = await attempt()
+            except RetryableError as e:
+                last_error = e
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                last_error = RetryableError(f"网络错误或超时: {e.__class__.__name__} {e}".strip())
+            except Exception:
+                # 解析响应等不可重试的异常：计为失败后抛给调用方
+                breaker.record_failure()
+                raise
+            except BaseException:
+                # 调用被取消（客户端断开、分片取消），不能说明提供商状态，只释放探测名额
+                breaker.release_probe()
+                raise
+            else:
+                # 收到响应（包括4xx等不可重试的错误）说明提供商可用
+                breaker.record_success()
+                return result
+
+            breaker.record_failure()
+            if attempts >= self.max_attempts:
+                break
+            # Retry-After超过最大等待时间时不在本次调用中等待，交由上层（如后台重新排队）处理
+            if last_error.retry_after and last_error.retry_after > self.max_delay:
+                break
+
+            delay = self.backoff_delay(attempts - 1, last_error.retry_after)
+            self._retries += 1
+            logger.warning(f"AI提供商 {provider} 调用失败 ({last_error.message})，"
+                           f"{delay:.1f}s 后第 {attempts + 1} 次尝试")
+            await asyncio.sleep(delay)
+
+        self._exhausted += 1
+        logger.error(f"AI提供商 {provider} 调用失败，已尝试 {attempts} 次: {last_error.message}")
+        return {
+            "success": False,
+            "error": last_error.message,
+            "details": last_error.details,
+            "status": last_error.status,
+            "retryable": True,
+            "retry_after": last_error.retry_after,
+            "attempts": attempts
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "max_attempts": self.max_attempts,
+            "base_delay": self.base_delay,
+            "max_delay": self.max_delay,
+            "retries": self._retries,
+            "exhausted": self._exhausted,
+            "fast_failed": self._fast_failed,
+            "circuit_breakers": {name: breaker.get_stats() for name, breaker in self._breakers.items()},
+        }
+
+
+class BackgroundRetryQueue:
+    """后台任务自动重新排队（按任务键去重，指数退避）"""
+
+    def __init__(self, max_requeues: int = 3, base_delay: float = 60.0):
+        self.max_requeues = max_requeues
+        self.base_delay = base_delay
+        self._pending: Dict[str, asyncio.TimerHandle] = {}
+        self._requeued = 0
+        self._abandoned = 0
+
+    def configure(self, max_requeues: int, base_delay: float):
+        self.max_requeues = max(0, max_requeues)
+        self.base_delay = max(1.0, base_delay)
+
+    def requeue(self, job_key: str, factory: Callable[[], Awaitable[Any]], attempt: int,
+                retry_after: Optional[float] = None) -> Optional[float]:
+        """attempt 次重新排队后再次执行 factory()；超过上限返回None，否则返回延迟秒数"""
+        if attempt >= self.max_requeues:
+            self._abandoned += 1
+            logger.warning(f"后台任务 {job_key} 已重新排队 {attempt} 次，不再重试")
+            return None
+
+        delay = self.base_delay * (2 ** attempt) * random.uniform(0.8, 1.2)
+        if retry_after:
+            delay = max(delay, retry_after)
+
+        existing = self._pending.pop(job_key, None)
+        if existing is not None:
+            existing.cancel()
+
+        loop = asyncio.get_running_loop()
+        self._pending[job_key] = loop.call_later(delay, self._start, job_key, factory)
+        self._requeued += 1
+        logger.info(f"后台任务 {job_key} 将在 {delay:.0f}s 后第 {attempt + 1} 次重新执行")
+        return delay
+
+    def _start(self, job_key: str, factory: Callable[[], Awaitable[Any]]):
+        self._pending.pop(job_key, None)
+        asyncio.ensure_future(factory())
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "max_requeues": self.max_requeues,
+            "base_delay": self.base_delay,
+            "pending": sorted(self._pending.keys()),
+            "requeued": self._requeued,
+            "abandoned": self._abandoned,
+        }
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+AI请求调度模块
+
+按服务提供商限制AI调用：最大并发数、每分钟请求数(RPM)、每分钟Token数(TPM)。
+等待中的请求按优先级排队（交互请求优先于后台重新分析），同优先级先进先出。
+收到429时暂停该提供商的派发，并记录队列深度和等待时间指标。
+"""
+
+import json
+import time
+import heapq
+import asyncio
+import logging
+import contextvars
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, List
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+# 请求优先级（数值越小越优先）
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+# 当前请求的优先级（后台任务中设置为 PRIORITY_BACKGROUND）
+_request_priority: contextvars.ContextVar[int] = contextvars.ContextVar("ai_request_priority", default=PRIORITY_INTERACTIVE)
+
+
+def set_background_priority():
+    """将当前任务（及其创建的子任务）标记为后台优先级"""
+    _request_priority.set(PRIORITY_BACKGROUND)
+
+
+def estimate_tokens(messages: List[Dict[str, Any]], max_tokens: int = 0) -> int:
+    """粗略估算请求Token数（中文约每2字符1个Token，每张图片按1000计）"""
+    text_chars = 0
+    images = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            for part in content:
+                if isinstance(part, dict) and part.get("type") == "image_url":
+                    images += 1
+                else:
+                    text_chars += len(json.dumps(part, ensure_ascii=False))
+        elif content is not None:
+            text_chars += len(str(content))
+    return text_chars // 2 + images * 1000 + max_tokens // 2
+
+
+class TokenBucket:
+    """令牌桶（capacity为每分钟额度，0表示不限制）"""
+
+    def __init__(self, per_minute: float):
+        self.configure(per_minute)
+
+    def configure(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """获取 amount 个令牌需要等待的秒数（0表示可立即获取）"""
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * 60.0 / self.capacity
+
+    def consume(self, amount: float):
+        if not self.unlimited:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta: float):
+        """按实际用量修正（delta为实际减去预估，允许透支）"""
+        if not self.unlimited:
+            self.tokens -= delta
+
+
+class _Ticket:
+    """一次已获准的请求，用于回报实际Token用量和限流信号"""
+
+    def __init__(self, scheduler: "ProviderScheduler", estimated_tokens: int):
+        self._scheduler = scheduler
+        self.estimated_tokens = estimated_tokens
+
+    def record_usage(self, usage: Optional[Dict[str, Any]]):
+        """根据响应中的usage修正TPM令牌桶"""
+        if not usage:
+            return
+        actual = usage.get("total_tokens") or (
+            (usage.get("prompt_tokens") or usage.get("input_tokens") or 0) +
+            (usage.get("completion_tokens") or usage.get("output_tokens") or 0)
+        )
+        if actual:
+            self._scheduler.token_bucket.adjust(actual - self.estimated_tokens)
+
+    def throttled(self, retry_after: Optional[float] = None):
+        """提供商返回429时暂停派发"""
+        self._scheduler.pause(retry_after or self._scheduler.default_backoff)
+
+
+class ProviderScheduler:
+    """单个提供商的并发与速率调度器"""
+
+    def __init__(self, name: str, max_in_flight: int, requests_per_minute: int, tokens_per_minute: int,
+                 default_backoff: float = 5.0):
+        self.name = name
+        self.max_in_flight = max(1, max_in_flight)
+        self.default_backoff = default_backoff
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+
+        self._queue: List[tuple] = []
+        self._sequence = 0
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+        # 指标
+        self._completed = 0
+        self._throttled = 0
+        self._wait_times = deque(maxlen=500)
+
+    def configure(self, max_in_flight: int, requests_per_minute: int, tokens_per_minute: int):
+        self.max_in_flight = max(1, max_in_flight)
+        if self.request_bucket.capacity != requests_per_minute:
+            self.request_bucket.configure(requests_per_minute)
+        if self.token_bucket.capacity != tokens_per_minute:
+            self.token_bucket.configure(tokens_per_minute)
+        self._dispatch()
+
+    def pause(self, seconds: float):
+        self._throttled += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        logger.warning(f"AI提供商 {self.name} 触发限流，暂停派发 {seconds:.1f}s")
+
+    @asynccontextmanager
+    async def slot(self, estimated_tokens: int, priority: Optional[int] = None):
+        """排队获取执行槽位"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        priority = _request_priority.get() if priority is None else priority
+        enqueued_at = time.monotonic()
+
+        self._sequence += 1
+        heapq.heappush(self._queue, (priority, self._sequence, future, estimated_tokens))
+        self._dispatch()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 已派发但调用方被取消时归还槽位
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+
+        self._wait_times.append(time.monotonic() - enqueued_at)
+        try:
+            yield _Ticket(self, estimated_tokens)
+        finally:
+            self._completed += 1
+            self._release()
+
+    def _release(self):
+        self._in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """按优先级派发等待中的请求，额度不足时定时重试"""
+        while self._queue and self._in_flight < self.max_in_flight:
+            priority, sequence, future, estimated_tokens = self._queue[0]
+            if future.done():
+                heapq.heappop(self._queue)
+                continue
+
+            wait = max(
+                self._paused_until - time.monotonic(),
+                self.request_bucket.wait_time(1),
+                self.token_bucket.wait_time(estimated_tokens)
+            )
+            if wait > 0:
+                self._schedule_retry(wait)
+                return
+
+            heapq.heappop(self._queue)
+            self.request_bucket.consume(1)
+            self.token_bucket.consume(estimated_tokens)
+            self._in_flight += 1
+            future.set_result(None)
+
+    def _schedule_retry(self, delay: float):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 不在事件循环中（如同步重载配置），由下一次获取/释放槽位时派发
+            return
+        if self._timer is not None and not self._timer.cancelled():
+            self._timer.cancel()
+        self._timer = loop.call_later(delay, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    def get_stats(self) -> Dict[str, Any]:
+        waits = sorted(self._wait_times)
+        pending = [entry for entry in self._queue if not entry[2].done()]
+        return {
+            "max_in_flight": self.max_in_flight,
+            "requests_per_minute": int(self.request_bucket.capacity),
+            "tokens_per_minute": int(self.token_bucket.capacity),
+            "in_flight": self._in_flight,
+            "queue_depth": len(pending),
+            "queue_depth_background": sum(1 for entry in pending if entry[0] >= PRIORITY_BACKGROUND),
+            "completed": self._completed,
+            "throttled": self._throttled,
+            "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 2),
+            "wait_avg_ms": round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0,
+            "wait_p95_ms": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 1) if waits else 0.0,
+            "wait_max_ms": round(waits[-1] * 1000, 1) if waits else 0.0,
+        }
+
+
+class AIRequestScheduler:
+    """按提供商划分的AI请求调度器"""
+
+    def __init__(self):
+        self.max_in_flight = 4
+        self.requests_per_minute = 0
+        self.tokens_per_minute = 0
+        self.overrides: Dict[str, Dict[str, int]] = {}
+        self._providers: Dict[str, ProviderScheduler] = {}
+
+    def configure(self, max_in_flight: int, requests_per_minute: int, tokens_per_minute: int,
+                  overrides: Optional[Dict[str, Dict[str, int]]] = None):
+        """更新默认限制及按提供商覆盖的限制"""
+        self.max_in_flight = max_in_flight
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.overrides = overrides or {}
+        for name, provider in self._providers.items():
+            provider.configure(**self._limits_for(name))
+
+    def _limits_for(self, name: str) -> Dict[str, int]:
+        override = self.overrides.get(name, {})
+        return {
+            "max_in_flight": int(override.get("max_in_flight", self.max_in_flight)),
+            "requests_per_minute": int(override.get("requests_per_minute", self.requests_per_minute)),
+            "tokens_per_minute": int(override.get("tokens_per_minute", self.tokens_per_minute)),
+        }
+
+    def provider(self, name: str) -> ProviderScheduler:
+        scheduler = self._providers.get(name)
+        if scheduler is None:
+            scheduler = ProviderScheduler(name, **self._limits_for(name))
+            self._providers[name] = scheduler
+        return scheduler
+
+    def slot(self, name: str, estimated_tokens: int, priority: Optional[int] = None):
+        """获取指定提供商的执行槽位（async with）"""
+        return self.provider(name).slot(estimated_tokens, priority)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {name: provider.get_stats() for name, provider in self._providers.items()}
@@ -1,8 +1,10 @@
 import os
 import json
+import time
 import logging
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, AsyncIterator
 import asyncio
+from contextlib import AsyncExitStack
 import aiohttp
 import fitz  # PyMuPDF
 from mcp_client import MCPClient, MCPSettings
@@ -11,6 +13,19 @@ import re
 from models import AITask
 from sqlalchemy.orm import Session
 from config_manager import config_manager
+from settings_cache import settings_snapshot
+from http_pool import http_client_pool
+from llm_cache import LLMResponseCache, make_cache_key
+from ai_scheduler import AIRequestScheduler, estimate_tokens
+from single_flight import SingleFlight, make_flight_key
+from docling_cache import compute_file_hash
+from chunked_analysis import split_into_chunks, select_chunks, merge_chunk_extractions
+from vision_images import rasterize_pdf_pages, encode_image_file, SUPPORTED_IMAGE_EXTENSIONS
+from local_classifier import LocalDocumentClassifier
+from ai_resilience import AIResilience, BackgroundRetryQueue, RetryableError, RETRYABLE_STATUS_CODES
+from tool_executor import tool_executor as shared_tool_executor
+from ai_metrics import ai_metrics, merge_usage
+from pathlib import Path
 
 # 设置日志
 logger = logging.getLogger(__name__)
@@ -50,31 +65,40 @@ class AIService:
         # 配置管理器
         self.config_manager = config_manager
         
+        # 共享HTTP连接池（应用启动时创建会话，关闭时释放）
+        self.http_pool = http_client_pool
+        
+        # 按提供商的并发与速率调度器
+        self.scheduler = AIRequestScheduler()
+        
+        # 重试退避、按提供商熔断，以及后台任务自动重新排队
+        self.resilience = AIResilience()
+        self.background_retries = BackgroundRetryQueue()
+        
+        # 相同文件的并发分析合并
+        self._analysis_flight = SingleFlight("智能文档分析")
+        self._vision_flight = SingleFlight("视觉分析")
+        
+        # LLM响应缓存（启用状态和TTL随配置重载更新，大小上限需重启生效）
+        cache_dir = Path(os.getenv("AI_RESPONSE_CACHE_DIR", str(Path(__file__).parent / "cache" / "llm")))
+        self.response_cache = LLMResponseCache(
+            db_path=cache_dir / "responses.db",
+            max_size_bytes=int(self._get_setting_value("ai_response_cache_max_size_mb", "256")) * 1024 * 1024,
+            ttl_seconds=float(self._get_setting_value("ai_response_cache_ttl_hours", "168")) * 3600,
+            enabled=self._get_setting_value("ai_response_cache_enabled", "true").lower() == "true"
+        )
+        
+        # 本地文档分类器（样本库与LLM响应缓存同目录）
+        self.local_classifier = LocalDocumentClassifier(cache_dir / "classifier.db")
+        
         self.reload_config()
         logger.info("AI服务初始化完成")
     
     def _get_setting_value(self, key: str, default: str = "") -> str:
-        """从数据库获取设置值，如果不存在则返回环境变量或默认值"""
-        try:
-            from database import get_db
-            from models import SystemSettings
-            
-            db = next(get_db())
-            setting = db.query(SystemSettings).filter(
-                SystemSettings.setting_key == key
-            ).first()
-            
-            if setting and setting.setting_value:
-                return setting.setting_value
-                
-        except Exception as e:
-            logger.warning(f"无法从数据库获取设置 {key}: {str(e)}")
-        finally:
-            try:
-                if 'db' in locals():
-                    db.close()
-            except:
-                pass
+        """从数据库获取设置值，如果不存在则返回环境变量或默认值（读取进程内设置快照）"""
+        value = settings_snapshot.get(key)
+        if value:
+            return value
         
         return os.getenv(key.upper(), default)
     
@@ -91,6 +115,83 @@ class AIService:
         # 业务领域
         self.business_fields = self._load_business_fields()
         
+        # LLM响应缓存
+        self.response_cache.configure(
+            enabled=self._get_setting_value("ai_response_cache_enabled", "true").lower() == "true",
+            ttl_seconds=float(self._get_setting_value("ai_response_cache_ttl_hours", "168")) * 3600
+        )
+        
+        # 提供商并发与速率限制（ai_provider_rate_limits 可按提供商覆盖）
+        try:
+            rate_limit_overrides = json.loads(self._get_setting_value("ai_provider_rate_limits", "{}") or "{}")
+        except json.JSONDecodeError:
+            logger.warning("ai_provider_rate_limits 不是有效的JSON，忽略按提供商覆盖")
+            rate_limit_overrides = {}
+        self.scheduler.configure(
+            max_in_flight=int(self._get_setting_value("ai_max_concurrent_requests", "4")),
+            requests_per_minute=int(self._get_setting_value("ai_requests_per_minute", "0")),
+            tokens_per_minute=int(self._get_setting_value("ai_tokens_per_minute", "0")),
+            overrides=rate_limit_overrides
+        )
+        
+        # 重试与熔断
+        self.resilience.configure(
+            max_attempts=int(self._get_setting_value("ai_retry_max_attempts", "3")),
+            base_delay=float(self._get_setting_value("ai_retry_base_delay_seconds", "1")),
+            max_delay=float(self._get_setting_value("ai_retry_max_delay_seconds", "30")),
+            failure_threshold=int(self._get_setting_value("ai_circuit_failure_threshold", "5")),
+            reset_timeout=float(self._get_setting_value("ai_circuit_reset_seconds", "30"))
+        )
+        self.background_retries.configure(
+            max_requeues=int(self._get_setting_value("ai_background_max_requeues", "3")),
+            base_delay=float(self._get_setting_value("ai_background_requeue_delay_seconds", "60"))
+        )
+        
+        # AI工具并发执行（ai_tool_timeouts 可按工具覆盖超时秒数）
+        try:
+            tool_timeouts = json.loads(self._get_setting_value("ai_tool_timeouts", "{}") or "{}")
+        except json.JSONDecodeError:
+            logger.warning("ai_tool_timeouts 不是有效的JSON，忽略按工具覆盖")
+            tool_timeouts = {}
+        shared_tool_executor.configure(
+            max_concurrency=int(self._get_setting_value("ai_tool_max_concurrency", "4")),
+            default_timeout=float(self._get_setting_value("ai_tool_timeout_seconds", "30")),
+            timeouts=tool_timeouts
+        )
+        
+        # AI调用计量（批量写入AIProcessLog）
+        ai_metrics.configure(
+            enabled=self._get_setting_value("ai_metrics_enabled", "true").lower() == "true",
+            flush_interval=float(self._get_setting_value("ai_metrics_flush_interval_seconds", "5"))
+        )
+        
+        # 本地文档分类器：置信度达到阈值时跳过LLM分类
+        self.local_classifier.configure(
+            enabled=self._get_setting_value("ai_local_classifier_enabled", "true").lower() == "true",
+            threshold=float(self._get_setting_value("ai_local_classifier_threshold", "0.85")),
+            min_samples=int(self._get_setting_value("ai_local_classifier_min_samples", "20")),
+            audit_rate=float(self._get_setting_value("ai_local_classifier_audit_rate", "0.1"))
+        )
+        
+        # 长文档分块分析
+        self.chunked_analysis_enabled = self._get_setting_value("ai_chunked_analysis_enabled", "true").lower() == "true"
+        self.chunk_size_chars = max(500, int(self._get_setting_value("ai_chunk_size_chars", "2000")))
+        self.chunk_max_chunks = max(1, int(self._get_setting_value("ai_chunk_max_chunks", "6")))
+        
+        # 视觉分析图片预处理
+        self.vision_max_pages = max(1, int(self._get_setting_value("vision_max_pages", "4")))
+        self.vision_max_side = max(256, int(self._get_setting_value("vision_max_side", "1600")))
+        self.vision_image_format = self._get_setting_value("vision_image_format", "jpeg").lower()
+        self.vision_image_quality = min(95, max(30, int(self._get_setting_value("vision_image_quality", "80"))))
+        self.vision_multi_page_mode = self._get_setting_value("vision_multi_page_mode", "multi_image").lower()
+        
+        # HTTP连接池限制
+        self.http_pool.configure(
+            limit=int(self._get_setting_value("ai_http_pool_limit", "100")),
+            limit_per_host=int(self._get_setting_value("ai_http_pool_limit_per_host", "20")),
+            keepalive_timeout=float(self._get_setting_value("ai_http_keepalive_timeout", "60"))
+        )
+        
         # 加载MCP配置
         mcp_server_url = self._get_setting_value("mcp_server_url")
         mcp_api_key = self._get_setting_value("mcp_api_key")
@@ -109,13 +210,33 @@ class AIService:
         
         logger.info(f"配置重载完成: AI={self.enable_ai}, Provider={self.ai_provider}, MCP={mcp_enabled}")
     
-    async def smart_document_analysis(self, file_path: str, enable_vision: bool = True, enable_ocr: bool = True) -> Dict[str, Any]:
+    async def smart_document_analysis(self, file_path: str, enable_vision: bool = True, enable_ocr: bool = True, use_cache: bool = True) -> Dict[str, Any]:
         """
         智能文档分析 - 使用Docling进行文档转换和OCR提取
+        use_cache=False 时跳过LLM响应缓存，强制重新调用AI
+        相同文件内容和选项的并发分析只执行一次，其余调用方共享结果
         """
         if not os.path.exists(file_path):
             return {"success": False, "error": "文件不存在"}
         
+        file_hash = await asyncio.get_event_loop().run_in_executor(None, compute_file_hash, file_path)
+        flight_key = make_flight_key(
+            file_hash,
+            suffix=os.path.splitext(file_path)[1].lower(),
+            enable_vision=enable_vision,
+            enable_ocr=enable_ocr,
+            use_cache=use_cache
+        )
+        result = await self._analysis_flight.run(
+            flight_key,
+            lambda: self._smart_document_analysis(file_path, file_hash, enable_vision, enable_ocr, use_cache)
+        )
+        # 合并的请求可能来自不同路径的相同文件
+        result["file_path"] = file_path
+        return result
+    
+    async def _smart_document_analysis(self, file_path: str, file_hash: str, enable_vision: bool, enable_ocr: bool, use_cache: bool) -> Dict[str, Any]:
+        """执行一次完整的文档分析链（Docling → 视觉 → LLM）"""
         results = {
             "text_extraction_result": {"text": "", "extracted_content": {}},
             "vision_analysis_result": {"success": False, "error": "未启用"},
@@ -123,9 +244,37 @@ class AIService:
             "final_classification": {}
         }
         
+        retryable_failure = False
+        
         # 1. 使用DoclingService进行文档转换和OCR提取
         text_content = ""
-        if enable_ocr and self.docling_service:
+        docling_result = {}
+        text_extracted = False
+        
+        # 1.1 PDF原生文本快速通道：有文本层的页面直接提取，仅无文本页面走OCR
+        # （启用Docling图片描述时需要完整转换，不走快速通道）
+        if (enable_ocr and self.docling_service and file_path.lower().endswith(".pdf")
+                and self.docling_service.config.native_text_fast_path
+                and self._get_setting_value("ai_analysis_enable_picture_description", "false").lower() != "true"):
+            try:
+                routed_result = await self.docling_service.extract_text_routed(file_path)
+                if routed_result.get("success") and routed_result.get("text_content", "").strip():
+                    text_content = routed_result["text_content"]
+                    results["text_extraction_result"]["text"] = text_content
+                    results["text_extraction_result"]["extracted_content"]["text"] = text_content
+                    results["text_extraction_result"]["method"] = routed_result["method"]
+                    results["text_extraction_result"]["routing"] = routed_result["metadata"]
+                    docling_result = routed_result
+                    text_extracted = True
+                    logger.info(f"PDF文本路由提取: {len(text_content)} 字符 (方法: {routed_result['method']}, "
+                                f"文本层 {routed_result['metadata']['text_layer_pages']} 页, "
+                                f"OCR {routed_result['metadata']['ocr_pages']} 页)")
+                elif not routed_result.get("success"):
+                    logger.warning(f"PDF文本路由提取失败，回退完整转换: {routed_result.get('error')}")
+            except Exception as e:
+                logger.warning(f"PDF文本路由提取异常，回退完整转换: {e}")
+        
+        if enable_ocr and self.docling_service and not text_extracted:
             try:
                 if not os.path.exists(file_path):
                     return {"success": False, "error": "文件不存在"}
@@ -139,13 +288,20 @@ class AIService:
                     text_content = ""
                     extraction_method = "unknown"
                     
+                    # 方法0: 使用转换缓存中已导出的文本
+                    cached_text = (docling_result.get("exports") or {}).get("text")
+                    if cached_text and len(cached_text.strip()) > 0:
+                        text_content = cached_text
+                        extraction_method = "cached_export" if docling_result.get("cache_hit") else "export_to_text"
+                    
                     # 方法1: 使用export_to_text()
-                    try:
-                        text_content = doc.export_to_text()
-                        if text_content and len(text_content.strip()) > 0:
-                            extraction_method = "export_to_text"
-                    except Exception as e:
-                        logger.warning(f"export_to_text()失败: {e}")
+                    if not text_content or len(text_content.strip()) == 0:
+                        try:
+                            text_content = doc.export_to_text()
+                            if text_content and len(text_content.strip()) > 0:
+                                extraction_method = "export_to_text"
+                        except Exception as e:
+                            logger.warning(f"export_to_text()失败: {e}")
                     
                     # 方法2: 如果export_to_text()返回空，尝试从文本元素直接提取
                     if not text_content or len(text_content.strip()) == 0:
@@ -248,7 +404,7 @@ class AIService:
                                 # Docling未能生成图片描述，使用独立视觉分析作为备用
                                 logger.info("Docling图片描述为空，使用独立视觉分析作为备用")
                                 vision_prompt = self._get_setting_value("vision_prompt", "请分析这个法律相关文档图像，提取关键信息和类型，以JSON格式返回。")
-                                vision_result = await self.analyze_vision(file_path, vision_prompt)
+                                vision_result = await self.analyze_vision(file_path, vision_prompt, use_cache=use_cache)
                                 results["vision_analysis_result"] = vision_result
                                 results["vision_analysis_result"]["source"] = "fallback_independent_vision"
                         else:
@@ -263,7 +419,7 @@ class AIService:
                         # Docling转换失败，使用独立视觉分析
                         logger.info("Docling转换失败，使用独立视觉分析")
                         vision_prompt = self._get_setting_value("vision_prompt", "请分析这个法律相关文档图像，提取关键信息和类型，以JSON格式返回。")
-                        vision_result = await self.analyze_vision(file_path, vision_prompt)
+                        vision_result = await self.analyze_vision(file_path, vision_prompt, use_cache=use_cache)
                         results["vision_analysis_result"] = vision_result
                         results["vision_analysis_result"]["source"] = "fallback_docling_failed"
                 else:
@@ -274,7 +430,7 @@ class AIService:
                         self._get_setting_value("vision_base_url", self._get_setting_value("ai_base_url", "https://api.openai.com/v1"))
                     ))
                     vision_prompt = self._get_setting_value("vision_prompt", "请分析这个法律相关文档图像，提取关键信息和类型，以JSON格式返回。")
-                    vision_result = await self.analyze_vision(file_path, vision_prompt)
+                    vision_result = await self.analyze_vision(file_path, vision_prompt, use_cache=use_cache)
                     results["vision_analysis_result"] = vision_result
                     results["vision_analysis_result"]["source"] = "independent_vision"
                 
@@ -320,7 +476,7 @@ class AIService:
                 
                 # 添加OCR文本内容
                 if text_content and len(text_content.strip()) > 0:
-                    analysis_content.append(f"OCR提取的文本内容：\n{text_content[:2000]}")
+                    analysis_content.append(f"OCR提取的文本内容：\n{text_content[:self.chunk_size_chars]}")
                     content_sources.append("OCR文本")
                 
                 # 添加视觉分析结果
@@ -347,9 +503,16 @@ class AIService:
                             analysis_content.append(vision_content)
                             content_sources.append("独立视觉分析")
                 
+                # 长文本分块分析，避免只分析前2000字符；视觉结果作为首块的上下文
+                chunked_mode = self.chunked_analysis_enabled and len(text_content or "") > self.chunk_size_chars
+                chunk_document = docling_result.get("document") if chunked_mode else None
+                vision_context = "\n\n".join(
+                    content for content, source in zip(analysis_content, content_sources) if source != "OCR文本"
+                )
+                
                 # 如果有任何可分析的内容，则进行AI文本分析
                 if analysis_content:
-                    logger.info(f"开始AI综合分析 - 数据源: {', '.join(content_sources)}")
+                    logger.info(f"开始AI综合分析 - 数据源: {', '.join(content_sources)}" + (" (分块分析)" if chunked_mode else ""))
                     
                     # 构建综合分析提示词 - 使用动态配置
                     combined_content = "\n\n".join(analysis_content)
@@ -362,9 +525,25 @@ class AIService:
                             {"text_content": combined_content}
                         )
                         
-                        if classification_prompt:
+                        # 本地分类器先行，置信度达到阈值时不再调用LLM分类（推理和样本写入在线程池中执行）
+                        local_prediction = await asyncio.get_event_loop().run_in_executor(
+                            None, self._predict_locally, file_hash, text_content
+                        )
+                        
+                        if local_prediction and local_prediction["accepted"]:
+                            doc_type = local_prediction["document_type"]
+                            confidence = local_prediction["confidence"]
+                            reason = f"本地分类器判定（置信度 {confidence}）"
+                            logger.info(f"本地分类结果: {doc_type} (置信度: {confidence}, 耗时 {local_prediction['elapsed_ms']}ms)，跳过LLM分类")
+                        elif classification_prompt:
                             # 使用动态配置的分类prompt
-                            classification_result = await self.analyze_text(classification_prompt)
+                            if chunked_mode:
+                                classification_result = await self.analyze_text_chunked(
+                                    "document_classification", text_content,
+                                    document=chunk_document, context=vision_context, use_cache=use_cache
+                                )
+                            else:
+                                classification_result = await self.analyze_text(classification_prompt, use_cache=use_cache)
                             
                             if classification_result.get("success"):
                                 # 解析分类结果
@@ -385,6 +564,8 @@ class AIService:
                                     reason = classification_data.get("reasoning", "")
                                     
                                     logger.info(f"动态分类结果: {doc_type} (置信度: {confidence})")
+                                    if local_prediction:
+                                        self.local_classifier.record_agreement(local_prediction["document_type"], doc_type)
                                 except (json.JSONDecodeError, KeyError) as e:
                                     logger.warning(f"分类解析失败: {e}")
                                     doc_type = "unknown"
@@ -394,6 +575,7 @@ class AIService:
                                 doc_type = "unknown"
                                 confidence = 0.0
                                 reason = "分类API调用失败"
+                                retryable_failure = bool(classification_result.get("retryable"))
                         else:
                             # 没有配置动态prompt，使用回退方案
                             doc_type = "unknown"
@@ -411,7 +593,13 @@ class AIService:
                         )
                         
                         if business_prompt:
-                            business_result = await self.analyze_text(business_prompt)
+                            if chunked_mode:
+                                business_result = await self.analyze_text_chunked(
+                                    "business_field_classification", text_content,
+                                    document=chunk_document, context=vision_context, use_cache=use_cache
+                                )
+                            else:
+                                business_result = await self.analyze_text(business_prompt, use_cache=use_cache)
                             if business_result.get("success"):
                                 try:
                                     business_content = business_result.get("result", "")
@@ -468,7 +656,9 @@ class AIService:
                             "business_field": business_field,
                             "summary": parsed_result.get("analysis_summary", ""),
                             "data_sources": content_sources,
-                            "method": "dynamic_config"
+                            "method": "dynamic_config",
+                            "type_source": "local_classifier" if local_prediction and local_prediction["accepted"] else "llm",
+                            "local_prediction": local_prediction
                         }
                         
                         logger.info(f"AI综合分析完成:")
@@ -523,7 +713,7 @@ class AIService:
                         # 应用学习改进
                         prompt = self.improve_classification_with_learning(prompt)
                         
-                        ai_result = await self.analyze_text(prompt)
+                        ai_result = await self.analyze_text(prompt, use_cache=use_cache)
                         if ai_result.get("success"):
                             try:
                                 # 解析AI返回的JSON
@@ -573,6 +763,7 @@ class AIService:
                         else:
                             logger.error(f"AI分析失败: {ai_result.get('error')}")
                             results["ai_text_analysis"] = {"success": False, "error": ai_result.get("error")}
+                            retryable_failure = bool(ai_result.get("retryable"))
                             results["final_classification"] = {"type": "unknown", "confidence": 0.0}
                 else:
                     # 没有任何可分析的内容
@@ -587,6 +778,7 @@ class AIService:
                         }
                     }
                     results["final_classification"] = {"type": "unknown", "confidence": 0.0}
+                    retryable_failure = bool(vision_result.get("retryable"))
                     
             except Exception as e:
                 logger.error(f"AI分析异常: {e}")
@@ -607,7 +799,9 @@ class AIService:
         return {
             "success": True,
             "results": results,
-            "file_path": file_path
+            "file_path": file_path,
+            # AI提供商暂时不可用导致分类失败，后台任务可稍后重新分析
+            "retryable_failure": retryable_failure
         }
     
     def _is_image_or_pdf(self, file_path: str) -> bool:
@@ -976,17 +1170,13 @@ class AIService:
                 # 回退到硬编码分类
                 return self._classify_content_fallback(text_content, file_path)
             
-            # 计算每种文档类型的匹配分数
+            # 计算每种文档类型的匹配分数（单次扫描得到所有类型的命中）
             type_scores = {}
-            text_lower = text_content.lower()
+            matches = self.config_manager.match_keywords("document_types", text_content)
             
             for type_code, type_info in doc_types.items():
                 keywords = type_info.get("keywords", [])
-                matched_keywords = []
-                
-                for keyword in keywords:
-                    if keyword.lower() in text_lower:
-                        matched_keywords.append(keyword)
+                matched_keywords = matches[type_code].matched(keywords)
                 
                 # 计算匹配分数
                 if keywords:
@@ -994,6 +1184,7 @@ class AIService:
                     type_scores[type_code] = {
                         "score": score,
                         "matched_keywords": matched_keywords,
+                        "match_count": matches[type_code].count,
                         "name": type_info.get("name", ""),
                         "confidence_threshold": type_info.get("confidence_threshold", 0.7)
                     }
@@ -1213,7 +1404,8 @@ class AIService:
             ai_response = await self._call_ai_api(
                 messages=messages,
                 model=self.ai_model,
-                tools=tools
+                tools=tools,
+                use_cache=False
             )
             
             if not ai_response.get("success"):
@@ -1222,47 +1414,23 @@ class AIService:
             response_data = ai_response["response"]
             ai_message = response_data.get("choices", [{}])[0].get("message", {})
             
-            # 处理工具调用
+            # 处理工具调用（同一轮的多个调用并发执行，结果按原顺序加入对话）
             tools_used = []
             if ai_message.get("tool_calls") and tool_executor:
-                for tool_call in ai_message["tool_calls"]:
-                    try:
-                        tool_name = tool_call["function"]["name"]
-                        tool_args = json.loads(tool_call["function"]["arguments"])
-                        
-                        # 执行工具
-                        if tool_name.startswith('mcp_') and self.mcp_client.is_available():
-                            # 调用MCP工具
-                            mcp_tool_name = tool_name[4:]
-                            tool_result = await self.mcp_client.call_tool(mcp_tool_name, **tool_args)
-                        else:
-                            # 调用本地工具
-                            tool_result = await tool_executor(tool_name, tool_args)
-                        tools_used.append({
-                            "tool_name": tool_name,
-                            "arguments": tool_args,
-                            "result": tool_result
-                        })
-                        
-                        # 将工具结果加入对话
-                        messages.append({
-                            "role": "tool",
-                            "tool_call_id": tool_call["id"],
-                            "content": json.dumps(tool_result, ensure_ascii=False)
-                        })
-                        
-                    except Exception as tool_err:
-                        logger.warning(f"工具调用失败: {tool_err}")
-                        tools_used.append({
-                            "tool_name": tool_call["function"]["name"],
-                            "error": str(tool_err)
-                        })
+                tool_calls = ai_message["tool_calls"]
+                session = self._tool_session(tool_executor)
+                tools_used = list(await asyncio.gather(*(
+                    self._run_tool_call(session, index, tool_call)
+                    for index, tool_call in enumerate(tool_calls)
+                )))
+                self._append_tool_results(messages, ai_message, tool_calls, tools_used)
                 
                 # 如果有工具调用，再次调用AI获取最终回复
                 if tools_used:
                     final_response = await self._call_ai_api(
                         messages=messages,
-                        model=self.ai_model
+                        model=self.ai_model,
+                        use_cache=False
                     )
                     if final_response.get("success"):
                         final_message = final_response["response"].get("choices", [{}])[0].get("message", {})
@@ -1284,7 +1452,142 @@ class AIService:
                 "response": "抱歉，AI服务暂时不可用。"
             }
 
-    async def analyze_text(self, prompt: str, model: str = None) -> Dict[str, Any]:
+    async def stream_chat_with_tools(
+        self,
+        user_message: str,
+        system_prompt: str = "",
+        tools: List[Dict] = None,
+        tool_executor=None,
+        max_tool_rounds: int = 1
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式对话，支持工具调用
+        产出事件 {"event", "data"}：token（模型输出增量）、tool_call_start、tool_call_end、done、error
+        同一轮回复中的多个工具调用并发执行，结果按原顺序加入对话
+        """
+        if not self.enable_ai or not self.ai_api_key:
+            yield {"event": "error", "data": {"error": "AI服务未配置或未启用"}}
+            return
+        
+        started = time.monotonic()
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": user_message})
+        
+        tools_used = []
+        message: Dict[str, Any] = {}
+        session = None
+        pending: List[asyncio.Future] = []
+        try:
+            for round_index in range(max_tool_rounds + 1):
+                # 最后一轮不再提供工具，要求模型给出最终回复
+                round_tools = tools if tool_executor and round_index < max_tool_rounds else None
+                message = {}
+                async for item in self._stream_ai_api(messages, self.ai_model, tools=round_tools):
+                    if item["type"] == "delta":
+                        yield {"event": "token", "data": {"content": item["content"]}}
+                    elif item["type"] == "message":
+                        message = item["message"]
+                    else:
+                        yield {"event": "error", "data": {key: value for key, value in item.items() if key != "type"}}
+                        return
+                
+                tool_calls = message.get("tool_calls") if round_tools else None
+                if not tool_calls:
+                    break
+                
+                for index, tool_call in enumerate(tool_calls):
+                    yield {"event": "tool_call_start", "data": {
+                        "index": index,
+                        "id": tool_call.get("id"),
+                        "tool_name": tool_call.get("function", {}).get("name")
+                    }}
+                
+                # 并发执行本轮的全部工具调用，按完成顺序产出完成事件
+                records: Dict[int, Dict[str, Any]] = {}
+                session = self._tool_session(tool_executor)
+                pending = [
+                    asyncio.ensure_future(self._run_tool_call(session, index, tool_call))
+                    for index, tool_call in enumerate(tool_calls)
+                ]
+                for finished in asyncio.as_completed(pending):
+                    record = await finished
+                    records[record["index"]] = record
+                    yield {"event": "tool_call_end", "data": record}
+                
+                round_records = [records[index] for index in range(len(tool_calls))]
+                tools_used.extend(round_records)
+                self._append_tool_results(messages, message, tool_calls, round_records)
+            
+            yield {"event": "done", "data": {
+                "response": message.get("content") or "抱歉，我无法理解您的请求。",
+                "tools_used": tools_used,
+                "model": self.ai_model,
+                "provider": self.ai_provider,
+                "elapsed_ms": round((time.monotonic() - started) * 1000)
+            }}
+        
+        except Exception as e:
+            logger.error(f"AI流式对话失败: {str(e)}")
+            yield {"event": "error", "data": {"error": str(e)}}
+        
+        finally:
+            # 客户端断开（生成器被关闭或取消）时取消仍在执行的工具调用，释放调度槽位
+            unfinished = [task for task in pending if not task.done()]
+            for task in unfinished:
+                task.cancel()
+            if unfinished:
+                await asyncio.gather(*unfinished, return_exceptions=True)
+            if session is not None:
+                await session.cancel()
+
+    def _tool_session(self, tool_executor):
+        """创建一次对话的工具调用会话；mcp_ 前缀的工具转发给MCP客户端"""
+        async def dispatch(tool_name: str, tool_args: Dict[str, Any]) -> Any:
+            if tool_name.startswith('mcp_') and self.mcp_client.is_available():
+                # 调用MCP工具
+                return await self.mcp_client.call_tool(tool_name[4:], **tool_args)
+            # 调用本地工具
+            return await tool_executor(tool_name, tool_args)
+        
+        return shared_tool_executor.session(dispatch)
+
+    async def _run_tool_call(self, session, index: int, tool_call: Dict[str, Any]) -> Dict[str, Any]:
+        """执行模型返回的一个工具调用，返回带耗时的调用记录"""
+        tool_name = tool_call.get("function", {}).get("name", "")
+        try:
+            tool_args = json.loads(tool_call.get("function", {}).get("arguments") or "{}")
+        except json.JSONDecodeError as e:
+            logger.warning(f"工具 {tool_name} 参数解析失败: {e}")
+            return {"index": index, "id": tool_call.get("id"), "tool_name": tool_name,
+                    "success": False, "error": f"工具参数不是有效的JSON: {e}", "elapsed_ms": 0.0}
+        
+        record = await session.call(index, tool_name, tool_args)
+        record["id"] = tool_call.get("id")
+        record["arguments"] = record.pop("parameters")
+        return record
+
+    @staticmethod
+    def _append_tool_results(messages: List[Dict], assistant_message: Dict[str, Any],
+                             tool_calls: List[Dict[str, Any]], records: List[Dict[str, Any]]):
+        """将助手的工具调用消息及各工具结果（按原顺序）加入对话"""
+        messages.append({
+            "role": "assistant",
+            "content": assistant_message.get("content") or "",
+            "tool_calls": tool_calls
+        })
+        for tool_call, record in zip(tool_calls, records):
+            messages.append({
+                "role": "tool",
+                "tool_call_id": tool_call.get("id"),
+                "content": json.dumps(
+                    record["result"] if record.get("success") else {"error": record.get("error")},
+                    ensure_ascii=False, default=str
+                )
+            })
+
+    async def analyze_text(self, prompt: str, model: str = None, use_cache: bool = True) -> Dict[str, Any]:
         """调用AI进行文本分析"""
         try:
             if not self.enable_ai or not self.ai_api_key:
@@ -1308,7 +1611,9 @@ class AIService:
             
             ai_response = await self._call_ai_api(
                 messages=messages,
-                model=use_model
+                model=use_model,
+                use_cache=use_cache,
+                stage="text_analysis"
             )
             
             if not ai_response.get("success"):
@@ -1345,8 +1650,122 @@ class AIService:
                 "error": str(e)
             }
 
-    async def analyze_vision(self, image_path: str, prompt: str) -> Dict[str, Any]:
-        """调用AI进行图像分析"""
+    async def analyze_text_chunked(
+        self,
+        prompt_name: str,
+        text_content: str,
+        document: Any = None,
+        context: str = "",
+        use_cache: bool = True
+    ) -> Dict[str, Any]:
+        """长文档分块分析：按结构切分文本，各分块并行调用同一提示词，再按字段合并结果
+        
+        prompt_name 为 config_manager 中的提示词名称（变量 text_content）；
+        context（如视觉分析结果）只附加在第一个分块前；文本不超过一个分块时等同于 analyze_text。
+        """
+        chunks = split_into_chunks(text_content, self.chunk_size_chars, document) if text_content else []
+        if not chunks:
+            chunks = [text_content or ""]
+        selected = select_chunks(chunks, self.chunk_max_chunks)
+        
+        prompts = []
+        for position, (index, chunk) in enumerate(selected):
+            chunk_content = f"{context}\n\n{chunk}" if context and position == 0 else chunk
+            prompt = self.config_manager.build_prompt(prompt_name, {"text_content": chunk_content})
+            if not prompt:
+                return {
+                    "success": False,
+                    "error": f"未配置提示词: {prompt_name}"
+                }
+            prompts.append((index, prompt))
+        
+        if len(prompts) == 1:
+            return await self.analyze_text(prompts[0][1], use_cache=use_cache)
+        
+        logger.info(f"分块分析 {prompt_name}: 共 {len(chunks)} 块，分析 {len(prompts)} 块 (每块≤{self.chunk_size_chars}字符)")
+        
+        # 并行调用，并发和速率由提供商调度器控制
+        chunk_responses = await asyncio.gather(
+            *(self.analyze_text(prompt, use_cache=use_cache) for _, prompt in prompts),
+            return_exceptions=True
+        )
+        
+        chunk_results = []
+        retryable = False
+        for (index, _), response in zip(prompts, chunk_responses):
+            if isinstance(response, Exception):
+                logger.warning(f"分块 {index} 分析异常: {response}")
+                continue
+            if response.get("success") and isinstance(response.get("result"), dict):
+                chunk_results.append((index, response["result"]))
+            else:
+                retryable = retryable or bool(response.get("retryable"))
+                logger.warning(f"分块 {index} 分析失败: {response.get('error', '结果不是JSON')}")
+        
+        if not chunk_results:
+            return {
+                "success": False,
+                "error": "所有分块分析均失败",
+                "retryable": retryable
+            }
+        
+        merged = merge_chunk_extractions(chunk_results)
+        return {
+            "success": True,
+            "result": merged,
+            "raw_content": json.dumps(merged, ensure_ascii=False),
+            "model": self.ai_model,
+            "provider": self.ai_provider,
+            "chunked": {
+                "total_chunks": len(chunks),
+                "analyzed_chunks": len(prompts),
+                "succeeded_chunks": len(chunk_results),
+                "field_confidence": merged.get("field_confidence", {})
+            }
+        }
+
+    async def analyze_vision(self, image_path: str, prompt: str, use_cache: bool = True) -> Dict[str, Any]:
+        """调用AI进行图像分析（相同图片和提示词的并发请求只调用一次）"""
+        try:
+            file_hash = await asyncio.get_event_loop().run_in_executor(None, compute_file_hash, image_path)
+        except OSError as e:
+            return {
+                "success": False,
+                "error": f"读取图片失败: {e}"
+            }
+        
+        flight_key = make_flight_key(
+            file_hash,
+            suffix=os.path.splitext(image_path)[1].lower(),
+            prompt=prompt,
+            model=self.ai_vision_model,
+            use_cache=use_cache
+        )
+        return await self._vision_flight.run(
+            flight_key,
+            lambda: self._measured_vision(image_path, prompt, use_cache)
+        )
+    
+    async def _measured_vision(self, image_path: str, prompt: str, use_cache: bool) -> Dict[str, Any]:
+        """执行视觉分析并记录令牌用量和耗时（合并的并发请求只记录一次）"""
+        started = time.perf_counter()
+        result = await self._analyze_vision(image_path, prompt, use_cache)
+        ai_metrics.record(
+            "vision_analysis",
+            started,
+            model=self.ai_vision_model,
+            provider=result.get("provider") or self._get_setting_value("vision_provider", "") or self.ai_provider,
+            usage=result.get("usage"),
+            cache_hit=bool(result.get("cache_hit")),
+            success=bool(result.get("success")),
+            error=result.get("error"),
+            source_file=image_path,
+            extra={"pages": result.get("pages_analyzed")}
+        )
+        return result
+    
+    async def _analyze_vision(self, image_path: str, prompt: str, use_cache: bool) -> Dict[str, Any]:
+        """执行一次视觉分析调用"""
         try:
             # 检查是否有独立的视觉服务配置
             vision_provider = self._get_setting_value("vision_provider", "")
@@ -1378,88 +1797,10 @@ class AIService:
                     "error": "视觉分析服务未配置API密钥"
                 }
             
-            # 检查文件类型，如果是PDF需要转换为图片
-            file_ext = os.path.splitext(image_path)[1].lower()
-            actual_image_path = image_path
-            
-            if file_ext == '.pdf':
-                try:
-                    # 将PDF转换为图片
-                    import fitz  # PyMuPDF
-                    import tempfile
-                    
-                    doc = fitz.open(image_path)
-                    page = doc.load_page(0)  # 只分析第一页
-                    pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))  # 提高分辨率
-                    
-                    # 创建临时图片文件
-                    temp_dir = tempfile.gettempdir()
-                    temp_image_path = os.path.join(temp_dir, f"temp_vision_{os.getpid()}_{hash(image_path)}.png")
-                    pix.save(temp_image_path)
-                    
-                    actual_image_path = temp_image_path
-                    doc.close()
-                    
-                    logger.info(f"PDF转换为图片成功: {temp_image_path}")
-                    
-                except Exception as e:
-                    logger.error(f"PDF转图片失败: {e}")
-                    return {
-                        "success": False,
-                        "error": f"PDF转图片失败: {e}"
-                    }
-            
-            elif file_ext not in ['.jpg', '.jpeg', '.png', '.bmp', '.gif']:
-                return {
-                    "success": False,
-                    "error": f"不支持的图片格式: {file_ext}"
-                }
-            
-            # 读取图像并转换为base64
-            import base64
-            with open(actual_image_path, "rb") as image_file:
-                image_data = base64.b64encode(image_file.read()).decode('utf-8')
-            
-            # 清理临时文件
-            if file_ext == '.pdf' and actual_image_path != image_path:
-                try:
-                    os.remove(actual_image_path)
-                except:
-                    pass
-            
-            messages = [
-                {
-                    "role": "system",
-                    "content": "你是一个专业的法律文档图像分析助手。请仔细分析图像内容，并按照要求提取相关信息。"
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{image_data}"
-                            }
-                        }
-                    ]
-                }
-            ]
-            
-            # 构建请求数据
-            request_data = {
-                "model": self.ai_vision_model,
-                "messages": messages,
-                "max_tokens": 4000,
-                "temperature": 0.1
-            }
-            
-            # 构建请求头
+            # 根据视觉服务提供商设置认证和URL
             headers = {
                 "Content-Type": "application/json"
             }
-            
-            # 根据视觉服务提供商设置认证和URL
             if vision_provider == "ollama":
                 # Ollama通常不需要API密钥
                 url = f"{vision_base_url}/chat/completions"
@@ -1475,32 +1816,77 @@ class AIService:
                     "error": f"不支持的视觉服务提供商: {vision_provider}"
                 }
             
-            # 发送请求 - 增加超时时间为600秒（10分钟）
-            timeout = aiohttp.ClientTimeout(total=600)  # 增加到10分钟
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.post(url, json=request_data, headers=headers) as response:
-                    if response.status == 200:
-                        response_data = await response.json()
-                        ai_message = response_data.get("choices", [{}])[0].get("message", {})
-                        content = ai_message.get("content", "")
-                        
-                        logger.info(f"视觉分析成功: {len(content)} 字符")
-                        
-                        return {
-                            "success": True,
-                            "result": content,
-                            "raw_content": content,
-                            "model": self.ai_vision_model,
-                            "provider": vision_provider
-                        }
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"视觉分析API调用失败: {response.status} - {error_text}")
-                        return {
-                            "success": False,
-                            "error": f"视觉分析API调用失败: {response.status}",
-                            "details": error_text
-                        }
+            # 在内存中栅格化/缩放并重新编码图片
+            file_ext = os.path.splitext(image_path)[1].lower()
+            loop = asyncio.get_event_loop()
+            try:
+                if file_ext == '.pdf':
+                    images, page_count = await loop.run_in_executor(
+                        None, rasterize_pdf_pages, image_path,
+                        self.vision_max_pages, self.vision_max_side, self.vision_image_format, self.vision_image_quality
+                    )
+                    logger.info(f"PDF栅格化完成: 分析 {len(images)}/{page_count} 页")
+                elif file_ext in SUPPORTED_IMAGE_EXTENSIONS:
+                    image = await loop.run_in_executor(
+                        None, encode_image_file, image_path,
+                        self.vision_max_side, self.vision_image_format, self.vision_image_quality
+                    )
+                    images = [image]
+                else:
+                    return {
+                        "success": False,
+                        "error": f"不支持的图片格式: {file_ext}"
+                    }
+            except Exception as e:
+                logger.error(f"图片预处理失败: {e}")
+                return {
+                    "success": False,
+                    "error": f"图片预处理失败: {e}"
+                }
+            
+            if not images:
+                return {
+                    "success": False,
+                    "error": "文档没有可分析的页面"
+                }
+            
+            # 多页：一次多图请求，或按页并行请求后合并
+            if len(images) == 1 or self.vision_multi_page_mode == "multi_image":
+                page_results = [await self._post_vision_request(
+                    vision_provider, url, headers, prompt, images, use_cache
+                )]
+            else:
+                page_results = await asyncio.gather(*(
+                    self._post_vision_request(
+                        vision_provider, url, headers,
+                        f"{prompt}\n\n（本图为文档第{index + 1}页，共{len(images)}页）", [image], use_cache
+                    )
+                    for index, image in enumerate(images)
+                ))
+            
+            failed = [result for result in page_results if not result.get("success")]
+            if len(failed) == len(page_results):
+                return failed[0]
+            
+            if len(page_results) == 1:
+                content = page_results[0]["content"]
+            else:
+                content = "\n\n".join(
+                    f"【第{index + 1}页】\n{result['content']}"
+                    for index, result in enumerate(page_results) if result.get("success")
+                )
+            
+            logger.info(f"视觉分析成功: {len(images)} 张图片, {len(content)} 字符")
+            return {
+                "success": True,
+                "result": content,
+                "raw_content": content,
+                "model": self.ai_vision_model,
+                "provider": vision_provider,
+                "pages_analyzed": len(images),
+                "cache_hit": all(result.get("cache_hit") for result in page_results),
+                "usage": merge_usage([result.get("usage") for result in page_results])
+            }
             
         except asyncio.TimeoutError:
             logger.error(f"视觉分析超时: 处理时间超过180秒")
@@ -1517,15 +1903,138 @@ class AIService:
                 "error": str(e)
             }
 
+    async def _post_vision_request(
+        self,
+        vision_provider: str,
+        url: str,
+        headers: Dict[str, str],
+        prompt: str,
+        images: List[tuple],
+        use_cache: bool
+    ) -> Dict[str, Any]:
+        """发送一次视觉请求（可包含多张图片），返回 {"success", "content"}"""
+        messages = [
+            {
+                "role": "system",
+                "content": "你是一个专业的法律文档图像分析助手。请仔细分析图像内容，并按照要求提取相关信息。"
+            },
+            {
+                "role": "user",
+                "content": [{"type": "text", "text": prompt}] + [
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:{mime_type};base64,{image_data}"
+                        }
+                    }
+                    for mime_type, image_data in images
+                ]
+            }
+        ]
+        
+        # 构建请求数据
+        request_data = {
+            "model": self.ai_vision_model,
+            "messages": messages,
+            "max_tokens": 4000,
+            "temperature": 0.1
+        }
+        
+        # 查询响应缓存（键包含图片摘要）
+        cache_key = make_cache_key(
+            vision_provider, url, self.ai_vision_model, request_data["temperature"], messages,
+            extra={"max_tokens": request_data["max_tokens"]}
+        )
+        if use_cache:
+            cached = await asyncio.get_event_loop().run_in_executor(None, self.response_cache.get, cache_key)
+            if cached is not None:
+                logger.info(f"视觉分析命中响应缓存: {len(cached.get('content', ''))} 字符")
+                return {
+                    "success": True,
+                    "content": cached.get("content", ""),
+                    "cache_hit": True
+                }
+        else:
+            self.response_cache.record_bypass()
+        
+        # 发送请求 - 增加超时时间为600秒（10分钟）
+        timeout = aiohttp.ClientTimeout(total=600)  # 增加到10分钟
+        estimated_tokens = estimate_tokens(messages, request_data["max_tokens"])
+        
+        async def attempt() -> Dict[str, Any]:
+            session = await self.http_pool.get_session(vision_provider)
+            async with self.scheduler.slot(vision_provider, estimated_tokens) as ticket:
+                async with session.post(url, json=request_data, headers=headers, timeout=timeout) as response:
+                    if response.status == 200:
+                        response_data = await response.json()
+                        ticket.record_usage(response_data.get("usage"))
+                        ai_message = response_data.get("choices", [{}])[0].get("message", {})
+                        content = ai_message.get("content", "")
+                        
+                        if use_cache and content:
+                            await asyncio.get_event_loop().run_in_executor(
+                                None, self.response_cache.put, cache_key, {"content": content}
+                            )
+                        
+                        return {
+                            "success": True,
+                            "content": content,
+                            "usage": response_data.get("usage")
+                        }
+                    
+                    retry_after = self._parse_retry_after(response)
+                    if response.status == 429:
+                        ticket.throttled(retry_after)
+                    error_text = await response.text()
+                    if response.status in RETRYABLE_STATUS_CODES:
+                        raise RetryableError(f"视觉分析API调用失败: {response.status}", response.status, retry_after, error_text)
+                    
+                    logger.error(f"视觉分析API调用失败: {response.status} - {error_text}")
+                    return {
+                        "success": False,
+                        "error": f"视觉分析API调用失败: {response.status}",
+                        "details": error_text
+                    }
+        
+        return await self.resilience.execute(vision_provider, attempt)
+
     async def _call_ai_api(
         self, 
         messages: List[Dict], 
         model: str, 
         tools: List[Dict] = None,
         max_tokens: int = 4000,
-        temperature: float = 0.1
+        temperature: float = 0.1,
+        use_cache: bool = True,
+        stage: str = "llm_call"
     ) -> Dict[str, Any]:
-        """调用AI API的底层方法"""
+        """调用AI API的底层方法（use_cache=False 时跳过响应缓存），按 stage 记录令牌用量和耗时"""
+        started = time.perf_counter()
+        result = await self._request_ai_api(messages, model, tools, max_tokens, temperature, use_cache)
+        cache_hit = bool(result.get("cache_hit"))
+        ai_metrics.record(
+            stage,
+            started,
+            model=model,
+            provider=self.ai_provider,
+            # 命中缓存时未消耗令牌
+            usage=None if cache_hit else (result.get("response") or {}).get("usage"),
+            cache_hit=cache_hit,
+            success=bool(result.get("success")),
+            error=result.get("error")
+        )
+        return result
+
+    async def _request_ai_api(
+        self,
+        messages: List[Dict],
+        model: str,
+        tools: List[Dict],
+        max_tokens: int,
+        temperature: float,
+        use_cache: bool
+    ) -> Dict[str, Any]:
+        """发送一次聊天补全请求（查询响应缓存、重试与熔断）"""
         try:
             # 构建请求数据
             request_data = {
@@ -1539,52 +2048,67 @@ class AIService:
                 request_data["tools"] = tools
                 request_data["tool_choice"] = "auto"
             
-            # 构建请求头
-            headers = {
-                "Content-Type": "application/json"
-            }
-            
-            # 根据提供商设置认证头
-            if self.ai_provider == "openai":
-                headers["Authorization"] = f"Bearer {self.ai_api_key}"
-                url = f"{self.ai_base_url}/chat/completions"
-            elif self.ai_provider == "azure":
-                headers["api-key"] = self.ai_api_key
-                url = f"{self.ai_base_url}/{model}/chat/completions?api-version=2024-02-01"
-            elif self.ai_provider == "anthropic":
-                headers["x-api-key"] = self.ai_api_key
-                headers["anthropic-version"] = "2023-06-01"
-                url = f"https://api.anthropic.com/v1/messages"
-                # Anthropic API格式不同，需要转换
-                request_data = self._convert_to_anthropic_format(request_data)
-            elif self.ai_provider == "custom":
-                headers["Authorization"] = f"Bearer {self.ai_api_key}"
-                url = f"{self.ai_base_url}/chat/completions"
-            else:
+            prepared = self._prepare_chat_request(model, request_data)
+            if prepared is None:
                 return {
                     "success": False,
                     "error": f"不支持的AI提供商: {self.ai_provider}"
                 }
+            url, headers, request_data = prepared
             
-            # 发送请求
+            # 查询响应缓存
+            cache_key = make_cache_key(
+                self.ai_provider, url, model, temperature, messages,
+                extra={"max_tokens": max_tokens, "tools": tools}
+            )
+            if use_cache:
+                cached = await asyncio.get_event_loop().run_in_executor(None, self.response_cache.get, cache_key)
+                if cached is not None:
+                    logger.info(f"AI API命中响应缓存: {model}")
+                    return {
+                        "success": True,
+                        "response": cached,
+                        "cache_hit": True
+                    }
+            else:
+                self.response_cache.record_bypass()
+            
+            # 发送请求（可重试错误按退避重试，提供商持续失败时熔断）
             timeout = aiohttp.ClientTimeout(total=60)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.post(url, json=request_data, headers=headers) as response:
-                    if response.status == 200:
-                        response_data = await response.json()
-                        return {
-                            "success": True,
-                            "response": response_data
-                        }
-                    else:
+            estimated_tokens = estimate_tokens(messages, max_tokens)
+            
+            async def attempt() -> Dict[str, Any]:
+                session = await self.http_pool.get_session(self.ai_provider)
+                async with self.scheduler.slot(self.ai_provider, estimated_tokens) as ticket:
+                    async with session.post(url, json=request_data, headers=headers, timeout=timeout) as response:
+                        if response.status == 200:
+                            response_data = await response.json()
+                            ticket.record_usage(response_data.get("usage"))
+                            if use_cache:
+                                await asyncio.get_event_loop().run_in_executor(
+                                    None, self.response_cache.put, cache_key, response_data
+                                )
+                            return {
+                                "success": True,
+                                "response": response_data
+                            }
+                        
+                        retry_after = self._parse_retry_after(response)
+                        if response.status == 429:
+                            ticket.throttled(retry_after)
                         error_text = await response.text()
+                        if response.status in RETRYABLE_STATUS_CODES:
+                            raise RetryableError(f"AI API调用失败: {response.status}", response.status, retry_after, error_text)
+                        
                         logger.error(f"AI API调用失败: {response.status} - {error_text}")
                         return {
                             "success": False,
                             "error": f"AI API调用失败: {response.status}",
                             "details": error_text
                         }
-                        
+            
+            return await self.resilience.execute(self.ai_provider, attempt)
+                    
         except Exception as e:
             logger.error(f"AI API调用异常: {str(e)}")
             import traceback
@@ -1594,6 +2118,215 @@ class AIService:
                 "error": str(e)
             }
 
+    async def _stream_ai_api(
+        self,
+        messages: List[Dict],
+        model: str,
+        tools: List[Dict] = None,
+        max_tokens: int = 4000,
+        temperature: float = 0.1,
+        stage: str = "llm_stream"
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式调用AI API（OpenAI兼容的SSE）
+        产出 {"type": "delta", "content"} 文本增量，最后产出 {"type": "message", "message", "usage"} 完整助手消息；
+        失败时产出 {"type": "error", ...}。按 stage 记录令牌用量和从排队到流结束的耗时
+        """
+        if self.ai_provider == "anthropic":
+            # Anthropic的流式事件格式不同，退回非流式调用并一次性产出
+            result = await self._call_ai_api(messages, model, tools, max_tokens, temperature, use_cache=False, stage=stage)
+            if not result.get("success"):
+                yield {"type": "error", **result}
+                return
+            message = result["response"].get("choices", [{}])[0].get("message", {})
+            if message.get("content"):
+                yield {"type": "delta", "content": message["content"]}
+            yield {"type": "message", "message": message, "usage": result["response"].get("usage")}
+            return
+        
+        request_data = {
+            "model": model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": True
+        }
+        if tools:
+            request_data["tools"] = tools
+            request_data["tool_choice"] = "auto"
+        
+        prepared = self._prepare_chat_request(model, request_data)
+        if prepared is None:
+            yield {"type": "error", "success": False, "error": f"不支持的AI提供商: {self.ai_provider}"}
+            return
+        url, headers, request_data = prepared
+        started = time.perf_counter()
+        
+        # 总时长放宽，但两段数据之间最多等待60秒
+        timeout = aiohttp.ClientTimeout(total=600, sock_read=60)
+        
+        # 每次尝试单独获取调度槽位，退避等待期间不占用；成功后占用到流式响应结束。仅在收到首字节前重试
+        estimated_tokens = estimate_tokens(messages, max_tokens)
+        
+        async def attempt() -> Dict[str, Any]:
+            slot = AsyncExitStack()
+            ticket = await slot.enter_async_context(self.scheduler.slot(self.ai_provider, estimated_tokens))
+            try:
+                session = await self.http_pool.get_session(self.ai_provider)
+                response = await session.post(url, json=request_data, headers=headers, timeout=timeout)
+            except BaseException:
+                await slot.aclose()
+                raise
+            if response.status == 200:
+                return {"success": True, "response": response, "slot": slot, "ticket": ticket}
+            
+            try:
+                retry_after = self._parse_retry_after(response)
+                if response.status == 429:
+                    ticket.throttled(retry_after)
+                error_text = await response.text()
+            finally:
+                response.release()
+                await slot.aclose()
+            if response.status in RETRYABLE_STATUS_CODES:
+                raise RetryableError(f"AI API调用失败: {response.status}", response.status, retry_after, error_text)
+            
+            logger.error(f"AI流式API调用失败: {response.status} - {error_text}")
+            return {
+                "success": False,
+                "error": f"AI API调用失败: {response.status}",
+                "details": error_text
+            }
+        
+        opened = await self.resilience.execute(self.ai_provider, attempt)
+        if not opened.get("success"):
+            ai_metrics.record(
+                stage,
+                started,
+                model=model,
+                provider=self.ai_provider,
+                success=False,
+                error=opened.get("error"),
+                extra={"stream": True}
+            )
+            yield {"type": "error", **opened}
+            return
+        
+        response, ticket = opened["response"], opened["ticket"]
+        async with opened["slot"]:
+            content_parts: List[str] = []
+            tool_calls: Dict[int, Dict[str, Any]] = {}
+            usage = None
+            completed = False
+            try:
+                async for raw_line in response.content:
+                    line = raw_line.decode("utf-8", errors="ignore").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    payload = line[5:].strip()
+                    if payload == "[DONE]":
+                        break
+                    try:
+                        chunk = json.loads(payload)
+                    except json.JSONDecodeError:
+                        continue
+                    
+                    usage = chunk.get("usage") or usage
+                    for choice in chunk.get("choices") or []:
+                        delta = choice.get("delta") or {}
+                        if delta.get("content"):
+                            content_parts.append(delta["content"])
+                            yield {"type": "delta", "content": delta["content"]}
+                        
+                        # 工具调用参数按index分段下发，逐段拼接
+                        for call_delta in delta.get("tool_calls") or []:
+                            call = tool_calls.setdefault(call_delta.get("index", 0), {
+                                "id": "",
+                                "type": "function",
+                                "function": {"name": "", "arguments": ""}
+                            })
+                            if call_delta.get("id"):
+                                call["id"] = call_delta["id"]
+                            function = call_delta.get("function") or {}
+                            call["function"]["name"] += function.get("name") or ""
+                            call["function"]["arguments"] += function.get("arguments") or ""
+                completed = True
+            finally:
+                response.release()
+                # 提供商未在最后的数据块中返回用量时按已收到的内容估算；客户端断开时同样记录已产生的部分
+                recorded_usage = usage
+                if recorded_usage is None:
+                    completion_chars = sum(len(part) for part in content_parts) + sum(
+                        len(call["function"]["arguments"]) for call in tool_calls.values()
+                    )
+                    prompt_tokens = estimate_tokens(messages)
+                    recorded_usage = {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_chars // 2,
+                        "total_tokens": prompt_tokens + completion_chars // 2
+                    }
+                ai_metrics.record(
+                    stage,
+                    started,
+                    model=model,
+                    provider=self.ai_provider,
+                    usage=recorded_usage,
+                    success=completed,
+                    error=None if completed else "流式响应中断",
+                    extra={"stream": True, "usage_estimated": usage is None}
+                )
+            
+            ticket.record_usage(usage)
+            message = {"role": "assistant", "content": "".join(content_parts)}
+            if tool_calls:
+                message["tool_calls"] = [tool_calls[index] for index in sorted(tool_calls)]
+            yield {"type": "message", "message": message, "usage": usage}
+
+    def _prepare_chat_request(self, model: str, request_data: Dict[str, Any]) -> Optional[tuple]:
+        """按提供商构建 (url, 请求头, 请求数据)，不支持的提供商返回None"""
+        # 构建请求头
+        headers = {
+            "Content-Type": "application/json"
+        }
+        
+        # 根据提供商设置认证头
+        if self.ai_provider == "openai":
+            headers["Authorization"] = f"Bearer {self.ai_api_key}"
+            url = f"{self.ai_base_url}/chat/completions"
+        elif self.ai_provider == "azure":
+            headers["api-key"] = self.ai_api_key
+            url = f"{self.ai_base_url}/{model}/chat/completions?api-version=2024-02-01"
+        elif self.ai_provider == "anthropic":
+            headers["x-api-key"] = self.ai_api_key
+            headers["anthropic-version"] = "2023-06-01"
+            url = f"https://api.anthropic.com/v1/messages"
+            # Anthropic API格式不同，需要转换
+            request_data = self._convert_to_anthropic_format(request_data)
+        elif self.ai_provider == "custom":
+            headers["Authorization"] = f"Bearer {self.ai_api_key}"
+            url = f"{self.ai_base_url}/chat/completions"
+        else:
+            return None
+        
+        return url, headers, request_data
+
+    @staticmethod
+    def _parse_retry_after(response) -> Optional[float]:
+        """解析429/503响应的Retry-After头（秒）"""
+        try:
+            return float(response.headers.get("Retry-After", ""))
+        except (TypeError, ValueError):
+            return None
+    
+    async def start_http_pool(self):
+        """创建AI和视觉服务提供商的共享HTTP会话"""
+        vision_provider = self._get_setting_value("vision_provider", self.ai_provider)
+        await self.http_pool.start({self.ai_provider, vision_provider})
+    
+    async def close_http_pool(self):
+        """关闭共享HTTP会话"""
+        await self.http_pool.close()
+
     def _convert_to_anthropic_format(self, openai_data: Dict) -> Dict:
         """将OpenAI格式转换为Anthropic格式"""
         # Anthropic API格式转换逻辑
@@ -1890,6 +2623,19 @@ class AIService:
                     "text_analysis": bool(self.ai_api_key),
                     "vision_analysis": bool(self.ai_api_key),
                     "document_classification": bool(self.ai_api_key)
+                },
+                "settings_cache": settings_snapshot.get_stats(),
+                "http_pool": self.http_pool.get_stats(),
+                "response_cache": self.response_cache.get_stats(),
+                "scheduler": self.scheduler.get_stats(),
+                "resilience": self.resilience.get_stats(),
+                "background_retries": self.background_retries.get_stats(),
+                "tool_executor": shared_tool_executor.get_stats(),
+                "metrics": ai_metrics.get_stats(),
+                "local_classifier": self.local_classifier.get_stats(),
+                "single_flight": {
+                    "smart_document_analysis": self._analysis_flight.get_stats(),
+                    "analyze_vision": self._vision_flight.get_stats()
                 }
             }
         except Exception as e:
@@ -1900,11 +2646,22 @@ class AIService:
                 "error": str(e)
             }
 
+    def _predict_locally(self, file_hash: str, text_content: str) -> Optional[Dict[str, Any]]:
+        """本地分类器预测并记录文档文本（sklearn推理和SQLite写入均为阻塞操作）"""
+        local_prediction = self.local_classifier.predict(text_content)
+        self.local_classifier.remember_document(
+            file_hash, text_content, local_prediction["document_type"] if local_prediction else None
+        )
+        return local_prediction
+
     def record_user_correction(self, learning_data: Dict[str, Any]):
-        """记录用户修正数据供AI学习"""
+        """记录用户修正数据供AI学习，并作为本地分类器的训练样本"""
         try:
-            config_manager = ConfigManager()
-            config_manager.add_learning_data("user_corrections", learning_data)
+            self.config_manager.add_learning_data("user_corrections", learning_data)
+            
+            file_path = learning_data.get("file_path")
+            if file_path and os.path.exists(file_path):
+                self.local_classifier.add_correction(compute_file_hash(file_path), learning_data.get("user_correction"))
             
             logger.info(f"AI学习数据已记录: {learning_data.get('original_classification')} -> {learning_data.get('user_correction')}")
             
@@ -1914,43 +2671,40 @@ class AIService:
     def get_user_corrections_for_learning(self) -> List[Dict[str, Any]]:
         """获取用户修正数据用于改进AI分类"""
         try:
-            config_manager = ConfigManager()
-            return config_manager.get_learning_data("user_corrections")
+            return self.config_manager.get_learning_data("user_corrections")
             
         except Exception as e:
             logger.error(f"获取AI学习数据失败: {e}")
             return []
 
+    def rebuild_local_classifier(self) -> Dict[str, Any]:
+        """从已验证的业绩和律师证记录同步训练样本，并重新训练本地分类器（同步执行，耗时操作请放入线程）"""
+        from database import SessionLocal
+        from models import Performance, LawyerCertificate
+        
+        db = SessionLocal()
+        try:
+            samples = []
+            for model, label in ((Performance, "performance"), (LawyerCertificate, "lawyer_certificate")):
+                records = db.query(model.id, model.extracted_text).filter(
+                    model.is_verified == True,
+                    model.extracted_text.isnot(None)
+                ).all()
+                samples.extend((f"{label}:{record_id}", label, text) for record_id, text in records)
+            
+            self.local_classifier.replace_verified_samples(samples)
+            logger.info(f"本地分类器已同步 {len(samples)} 条已验证记录")
+            return self.local_classifier.train()
+        except Exception as e:
+            logger.error(f"重建本地分类器失败: {e}")
+            return {"success": False, "error": str(e)}
+        finally:
+            db.close()
+
     def improve_classification_with_learning(self, prompt: str) -> str:
-        """基于用户修正数据改进分类提示词"""
+        """基于用户修正数据改进分类提示词（学习提醒按学习数据版本缓存）"""
         try:
-            corrections = self.get_user_corrections_for_learning()
-            
-            if not corrections:
-                return prompt
-            
-            # 构建学习改进提示
-            learning_notes = []
-            
-            for correction in corrections[-10:]:  # 只使用最近10条学习数据
-                if correction.get("specific_correction") == "law_firm_license_vs_personal_certificate":
-                    learning_notes.append(
-                        "重要提醒：律师事务所执业许可证应归类为qualification_certificate（资质证照），"
-                        "而非lawyer_certificate（个人律师证）。机构资质与个人证书要严格区分。"
-                    )
-                
-                original = correction.get("original_classification")
-                corrected = correction.get("user_correction")
-                if original and corrected:
-                    learning_notes.append(
-                        f"学习案例：{original} 类型文档被用户修正为 {corrected}"
-                    )
-            
-            if learning_notes:
-                learning_section = "\n\n基于用户反馈的重要改进提醒：\n" + "\n".join(learning_notes)
-                prompt = prompt + learning_section
-            
-            return prompt
+            return prompt + self.config_manager.get_learning_section()
             
         except Exception as e:
             logger.error(f"改进分类提示词失败: {e}")
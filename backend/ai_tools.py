@@ -18,6 +18,7 @@ import re
 import os
 
 from database import SessionLocal
+from http_pool import http_client_pool
 from models import Award, Performance, Project, SearchTask, SearchResult
 
 # 配置日志
@@ -36,24 +37,33 @@ except ImportError as e:
 class WebReader:
     """网页读取工具"""
     
-    def __init__(self):
+    def __init__(self, use_shared_pool: bool = True):
         self.session = None
+        self.use_shared_pool = use_shared_pool
+        self._owns_session = False
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
     
     async def __aenter__(self):
-        self.session = aiohttp.ClientSession(headers=self.headers)
+        if self.use_shared_pool:
+            # 复用AIService管理的共享连接池，不在退出时关闭
+            self.session = await http_client_pool.get_session("web")
+            self._owns_session = False
+        else:
+            self.session = aiohttp.ClientSession(headers=self.headers)
+            self._owns_session = True
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.session:
+        if self.session and self._owns_session:
             await self.session.close()
+        self.session = None
     
     async def read_webpage(self, url: str, timeout: int = 30) -> Dict[str, Any]:
         """读取网页内容"""
         try:
-            async with self.session.get(url, timeout=timeout) as response:
+            async with self.session.get(url, timeout=aiohttp.ClientTimeout(total=timeout), headers=self.headers) as response:
                 if response.status == 200:
                     content = await response.text()
                     soup = BeautifulSoup(content, 'html.parser')
@@ -262,6 +272,15 @@ class DatabaseTool:
 class AIToolManager:
     """AI工具管理器"""
     
+    # 在线程池中执行的数据库工具
+    DATABASE_TOOLS = {
+        "execute_database_query",
+        "get_awards_by_firm",
+        "get_performances_by_firm",
+        "search_similar_awards",
+        "get_database_statistics"
+    }
+    
     def __init__(self):
         self.web_reader = None
         self.db_tool = None
@@ -343,37 +362,11 @@ class AIToolManager:
                         parameters.get("source", "chambers")
                     )
             
-            elif tool_name == "execute_database_query":
-                with DatabaseTool() as db:
-                    return db.execute_query(
-                        parameters["query"],
-                        parameters.get("params", {})
-                    )
-            
-            elif tool_name == "get_awards_by_firm":
-                with DatabaseTool() as db:
-                    return db.get_awards_by_firm(
-                        parameters["law_firm"],
-                        parameters.get("year")
-                    )
-            
-            elif tool_name == "get_performances_by_firm":
-                with DatabaseTool() as db:
-                    return db.get_performances_by_firm(
-                        parameters["law_firm"],
-                        parameters.get("year")
-                    )
-            
-            elif tool_name == "search_similar_awards":
-                with DatabaseTool() as db:
-                    return db.search_similar_awards(
-                        parameters["award_title"],
-                        parameters.get("business_field")
-                    )
-            
-            elif tool_name == "get_database_statistics":
-                with DatabaseTool() as db:
-                    return db.get_statistics()
+            elif tool_name in self.DATABASE_TOOLS:
+                # 同步数据库查询放到线程池执行，避免阻塞事件循环，多个工具调用可并发
+                return await asyncio.get_event_loop().run_in_executor(
+                    None, self._execute_database_tool, tool_name, parameters
+                )
             
             else:
                 return {
@@ -387,6 +380,36 @@ class AIToolManager:
                 "success": False,
                 "error": str(e)
             }
+    
+    def _execute_database_tool(self, tool_name: str, parameters: Dict[str, Any]) -> Any:
+        """执行数据库工具（在线程中运行，每次使用独立会话）"""
+        with DatabaseTool() as db:
+            if tool_name == "execute_database_query":
+                return db.execute_query(
+                    parameters["query"],
+                    parameters.get("params", {})
+                )
+            
+            elif tool_name == "get_awards_by_firm":
+                return db.get_awards_by_firm(
+                    parameters["law_firm"],
+                    parameters.get("year")
+                )
+            
+            elif tool_name == "get_performances_by_firm":
+                return db.get_performances_by_firm(
+                    parameters["law_firm"],
+                    parameters.get("year")
+                )
+            
+            elif tool_name == "search_similar_awards":
+                return db.search_similar_awards(
+                    parameters["award_title"],
+                    parameters.get("business_field")
+                )
+            
+            else:
+                return db.get_statistics()
 
 # 全局工具管理器实例
 tool_manager = AIToolManager() 
\ No newline at end of file
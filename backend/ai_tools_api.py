@@ -1,14 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Body
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
 import json
+import asyncio
 import logging
 from datetime import datetime
 import re
 
 from database import get_db
 from ai_tools import tool_manager, WebReader, DatabaseTool
+from tool_executor import tool_executor
 from ai_service import ai_service
 from config_manager import config_manager
 
@@ -56,18 +59,9 @@ async def execute_tool(
         logger.error(f"执行工具 {tool_name} 失败: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/ai-assistant")
-async def ai_assistant_with_tools(
-    request: AIAssistantRequest,
-    db: Session = Depends(get_db)
-):
-    """AI助手（支持工具调用）"""
-    try:
-        # 获取可用工具
-        tools = await tool_manager.get_tools()
-        
-        # 构建系统提示词
-        system_prompt = f"""
+def _build_assistant_system_prompt(tools: List[Dict[str, Any]], context: Optional[Dict[str, Any]]) -> str:
+    """构建AI助手的系统提示词"""
+    return f"""
 你是一个专业的法律行业投标助手，拥有以下工具可以使用：
 
 可用工具：
@@ -81,11 +75,24 @@ async def ai_assistant_with_tools(
 5. 可以连续调用多个工具来完成复杂任务
 6. 始终用中文回复用户
 
-当前上下文：{json.dumps(request.context or {}, ensure_ascii=False)}
+当前上下文：{json.dumps(context or {}, ensure_ascii=False)}
 
 请根据用户的问题，选择合适的工具来帮助用户。
 """
 
+@router.post("/ai-assistant")
+async def ai_assistant_with_tools(
+    request: AIAssistantRequest,
+    db: Session = Depends(get_db)
+):
+    """AI助手（支持工具调用）"""
+    try:
+        # 获取可用工具
+        tools = await tool_manager.get_tools()
+        
+        # 构建系统提示词
+        system_prompt = _build_assistant_system_prompt(tools, request.context)
+
         # 调用AI服务
         response = await ai_service.chat_with_tools(
             user_message=request.user_message,
@@ -104,35 +111,58 @@ async def ai_assistant_with_tools(
         logger.error(f"AI助手调用失败: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/ai-assistant/stream")
+async def ai_assistant_with_tools_stream(request: AIAssistantRequest):
+    """AI助手流式版本（SSE）：逐段返回模型输出，并推送工具调用开始/完成事件"""
+    tools = await tool_manager.get_tools()
+    system_prompt = _build_assistant_system_prompt(tools, request.context)
+    
+    async def event_stream():
+        async for event in ai_service.stream_chat_with_tools(
+            user_message=request.user_message,
+            system_prompt=system_prompt,
+            tools=tools,
+            tool_executor=tool_manager.execute_tool
+        ):
+            payload = json.dumps(event["data"], ensure_ascii=False, default=str)
+            yield f"event: {event['event']}\ndata: {payload}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # 关闭Nginx代理缓冲，保证事件即时送达
+            "X-Accel-Buffering": "no"
+        }
+    )
+
 @router.post("/batch-execute")
 async def batch_execute_tools(
     tool_calls: List[Dict[str, Any]],
+    memoize: bool = True,
     db: Session = Depends(get_db)
 ):
-    """批量执行工具"""
+    """批量执行工具（并发执行，按提交顺序返回结果及每次调用耗时）"""
     try:
-        results = []
-        for tool_call in tool_calls:
-            tool_name = tool_call.get("tool_name")
-            parameters = tool_call.get("parameters", {})
-            
-            if not tool_name:
-                results.append({
+        session = tool_executor.session(tool_manager.execute_tool, memoize=memoize)
+        
+        async def run(index: int, tool_call: Dict[str, Any]) -> Dict[str, Any]:
+            if not tool_call.get("tool_name"):
+                return {
+                    "index": index,
                     "success": False,
                     "error": "缺少工具名称"
-                })
-                continue
-            
-            result = await tool_manager.execute_tool(tool_name, parameters)
-            results.append({
-                "tool_name": tool_name,
-                "parameters": parameters,
-                "result": result
-            })
+                }
+            return await session.call(index, tool_call["tool_name"], tool_call.get("parameters", {}))
+        
+        started = datetime.now()
+        results = await asyncio.gather(*(run(index, tool_call) for index, tool_call in enumerate(tool_calls)))
         
         return {
             "success": True,
-            "results": results
+            "results": results,
+            "elapsed_ms": round((datetime.now() - started).total_seconds() * 1000, 1)
         }
         
     except Exception as e:
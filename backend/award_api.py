@@ -11,6 +11,10 @@ from datetime import datetime
 
 from database import get_db
 from models import Award
+from upload_ingest import UploadTooLargeError
+from blob_store import blob_store
+from ai_scheduler import set_background_priority
+from pagination import paginate_query, page_info, InvalidCursorError
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -63,9 +67,11 @@ async def list_awards(
     year: Optional[int] = None,
     business_type: Optional[str] = None,
     is_verified: Optional[bool] = None,
+    cursor: Optional[str] = None,  # 游标分页：传入上一页返回的 next_cursor（忽略 page）
+    include_total: Optional[bool] = None,  # 是否返回总数：页码分页默认返回，游标分页传 true 时返回缓存的总数
     db: Session = Depends(get_db)
 ):
-    """获取奖项列表"""
+    """获取奖项列表（支持页码分页和游标分页）"""
     try:
         query = db.query(Award)
         
@@ -92,12 +98,11 @@ async def list_awards(
         if is_verified is not None:
             query = query.filter(Award.is_verified == is_verified)
         
-        # 总数
-        total = query.count()
-        
-        # 分页
-        offset = (page - 1) * page_size
-        awards = query.order_by(desc(Award.created_at)).offset(offset).limit(page_size).all()
+        # 按创建时间倒序分页（创建时间 + id 作为游标，游标模式不使用OFFSET）
+        awards, next_cursor = paginate_query(
+            query, Award.created_at, Award.id, True, "created_at:desc",
+            lambda item: item.created_at, page_size, cursor=cursor, page=page
+        )
         
         return {
             "success": True,
@@ -117,14 +122,11 @@ async def list_awards(
                 }
                 for award in awards
             ],
-            "pagination": {
-                "page": page,
-                "page_size": page_size,
-                "total": total,
-                "pages": (total + page_size - 1) // page_size
-            }
+            "pagination": page_info(page, page_size, next_cursor, cursor, query, include_total, pages_key="pages")
         }
         
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"获取奖项列表失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"获取奖项列表失败: {str(e)}")
@@ -141,15 +143,8 @@ async def upload_award_file(
 ):
     """上传奖项文件并进行AI分析"""
     try:
-        # 保存文件
-        upload_dir = os.path.join(os.path.dirname(__file__), "uploads", "awards")
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        file_path = os.path.join(upload_dir, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{file.filename}")
-        
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        # 流式写入blob存储（相同内容只保存一份）
+        blob = await blob_store.store_upload(db, file, max_size=100 * 1024 * 1024)
         
         # TODO: 集成AI分析
         # 这里应该调用AI服务进行文档分析
@@ -161,7 +156,8 @@ async def upload_award_file(
             year=year or datetime.now().year,
             business_type=business_type or "待AI分析",
             description="通过文件上传创建",
-            is_verified=False
+            is_verified=False,
+            source_document=blob.path
         )
         
         db.add(award)
@@ -176,6 +172,8 @@ async def upload_award_file(
             "award_id": award.id
         }
         
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         db.rollback()
         logger.error(f"上传奖项文件失败: {str(e)}")
@@ -192,6 +190,8 @@ async def upload_award_files_batch(
     db: Session = Depends(get_db)
 ):
     """批量上传奖项文件并进行AI分析"""
+    # 批量分析的AI请求让位于交互请求（只影响本次请求的上下文）
+    set_background_priority()
     try:
         import json
         
@@ -207,10 +207,6 @@ async def upload_award_files_batch(
             except:
                 titles_list = []
         
-        # 保存文件目录
-        upload_dir = os.path.join(os.path.dirname(__file__), "uploads", "awards")
-        os.makedirs(upload_dir, exist_ok=True)
-        
         for i, file in enumerate(files):
             try:
                 if not file.filename:
@@ -220,24 +216,17 @@ async def upload_award_files_batch(
                     })
                     continue
                 
-                # 检查文件大小
-                content = await file.read()
-                file_size = len(content)
-                
-                if file_size > 100 * 1024 * 1024:  # 100MB限制
+                # 流式写入blob存储（相同内容只保存一份，超过100MB立即中止）
+                try:
+                    blob = await blob_store.store_upload(db, file, max_size=100 * 1024 * 1024)
+                except UploadTooLargeError as size_err:
                     failed_files.append({
                         "filename": file.filename,
-                        "error": "文件大小超过限制(100MB)"
+                        "error": str(size_err)
                     })
                     continue
-                
-                # 生成文件路径
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                file_path = os.path.join(upload_dir, f"{timestamp}_{i}_{file.filename}")
-                
-                # 保存文件
-                with open(file_path, "wb") as buffer:
-                    buffer.write(content)
+                file_path = blob.path
+                file_size = blob.file_size
                 
                 # 确定标题
                 title = titles_list[i] if i < len(titles_list) else os.path.splitext(file.filename)[0]
@@ -350,6 +339,9 @@ async def delete_award(
         if not award:
             raise HTTPException(status_code=404, detail="奖项记录不存在")
         
+        # 释放源文档引用（blob存储中的文件在无引用后由垃圾回收删除）
+        blob_store.discard_path(db, award.source_document)
+        
         db.delete(award)
         db.commit()
         
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+内容寻址文件存储模块
+
+所有上传文件按内容SHA-256存储一份（<根目录>/ab/cd/<sha256><扩展名>，扩展名取首次上传时的），
+文件管理、奖项、业绩、律师证、章节文档的记录都直接保存blob路径；
+blobs表记录每个blob的引用计数，垃圾回收按各表实际引用重新计数，
+删除无引用且超过宽限期的blob以及残留的临时文件。
+blob文件名即内容哈希，基于文件哈希的各类缓存无需重新计算哈希。
+"""
+
+import os
+import re
+import time
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, List
+
+from upload_ingest import ingest_upload
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = os.environ.get("UPLOAD_PATH", "/app/uploads")
+BLOB_STORE_PATH = os.environ.get("BLOB_STORE_PATH", os.path.join(UPLOAD_DIR, "blobs"))
+
+_BLOB_NAME = re.compile(r"^([0-9a-f]{64})(\.[0-9a-z]{1,10})?$")
+
+
+def blob_hash_from_path(file_path) -> Optional[str]:
+    """blob路径直接返回其SHA-256（文件名即哈希），其他路径返回None"""
+    try:
+        path = os.path.abspath(str(file_path))
+        if not path.startswith(os.path.abspath(BLOB_STORE_PATH) + os.sep):
+            return None
+        match = _BLOB_NAME.match(os.path.basename(path))
+        return match.group(1) if match else None
+    except (TypeError, ValueError):
+        return None
+
+
+class StoredBlob:
+    """一次写入blob存储的结果"""
+
+    def __init__(self, sha256: str, path: str, file_size: int, filename: Optional[str], deduplicated: bool):
+        self.sha256 = sha256
+        self.path = path
+        self.file_size = file_size
+        self.filename = filename
+        self.deduplicated = deduplicated
+
+
+class BlobStore:
+    """按SHA-256去重的文件存储（引用计数 + 垃圾回收）"""
+
+    def __init__(self, root: str = BLOB_STORE_PATH):
+        self.root = os.path.abspath(root)
+        self.tmp_dir = os.path.join(self.root, "tmp")
+
+        # 指标
+        self._stored = 0
+        self._deduplicated = 0
+        self._bytes_saved = 0
+        self._last_gc: Optional[Dict[str, Any]] = None
+
+    def blob_path(self, sha256: str, extension: str = "") -> str:
+        return os.path.join(self.root, sha256[:2], sha256[2:4], f"{sha256}{extension}")
+
+    def is_blob(self, file_path: Optional[str]) -> bool:
+        return bool(file_path) and blob_hash_from_path(file_path) is not None
+
+    @staticmethod
+    def _extension(filename: Optional[str]) -> str:
+        extension = os.path.splitext(filename or "")[1].lower()
+        # 扩展名决定文档转换和视觉分析的处理方式，需保留；异常的扩展名丢弃
+        return extension if re.fullmatch(r"\.[0-9a-z]{1,10}", extension) else ""
+
+    # ---------- 写入与引用 ----------
+
+    async def store_upload(self, db, upload, max_size: Optional[int] = None) -> StoredBlob:
+        """流式写入上传文件并登记一个引用（与调用方的记录在同一事务中提交）
+
+        blob按内容SHA-256唯一登记：内容已存在时（包括扩展名写法不同，如 .jpg/.jpeg）删除临时文件
+        并复用已有blob及其路径。超过 max_size 时抛出 UploadTooLargeError。
+        """
+        from sqlalchemy.exc import IntegrityError
+        from models import Blob
+
+        ingested = await ingest_upload(upload, self.tmp_dir, max_size=max_size, hash_algorithm="sha256")
+        with ingested:
+            blob = db.query(Blob).filter(Blob.sha256 == ingested.file_hash).first()
+
+            if blob is not None and os.path.exists(blob.storage_path):
+                return self._reuse(db, blob, ingested.file_size, upload.filename)
+
+            # 记录存在但文件丢失时按原路径重新写入
+            extension = self._extension(upload.filename)
+            path = blob.storage_path if blob is not None else self.blob_path(ingested.file_hash, extension)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            ingested.commit(path)
+
+            if blob is not None:
+                self._add_reference(blob)
+                db.flush()
+            else:
+                try:
+                    with db.begin_nested():
+                        db.add(Blob(
+                            sha256=ingested.file_hash,
+                            extension=extension,
+                            storage_path=path,
+                            file_size=ingested.file_size,
+                            ref_count=1
+                        ))
+                except IntegrityError:
+                    # 并发的首次上传已登记相同内容：复用对方的blob，扩展名不同时删除本次写入的文件
+                    blob = db.query(Blob).filter(Blob.sha256 == ingested.file_hash).one()
+                    if blob.storage_path != path:
+                        self._remove_file(path)
+                    return self._reuse(db, blob, ingested.file_size, upload.filename)
+
+            self._stored += 1
+            return StoredBlob(ingested.file_hash, path, ingested.file_size, upload.filename, False)
+
+    def _reuse(self, db, blob, file_size: int, filename: Optional[str]) -> StoredBlob:
+        """上传内容已存在：增加已有blob的引用计数"""
+        self._add_reference(blob)
+        db.flush()
+        self._deduplicated += 1
+        self._bytes_saved += file_size
+        logger.info(f"上传内容已存在，复用blob: {filename} -> {blob.sha256[:16]}...")
+        return StoredBlob(blob.sha256, blob.storage_path, file_size, filename, True)
+
+    @staticmethod
+    def _add_reference(blob):
+        # 在数据库中递增（UPDATE ... SET ref_count = ref_count + 1），并发引用不会相互覆盖
+        blob.ref_count = type(blob).ref_count + 1
+        blob.updated_at = datetime.now()
+
+    def acquire(self, db, file_path: Optional[str]):
+        """新记录引用已有的blob路径时增加引用计数（非blob路径忽略）"""
+        if not self.is_blob(file_path):
+            return
+        from models import Blob
+        blob = db.query(Blob).filter(Blob.storage_path == os.path.abspath(file_path)).first()
+        if blob is not None:
+            self._add_reference(blob)
+
+    def release(self, db, file_path: Optional[str]) -> bool:
+        """记录不再引用该路径时减少引用计数；返回是否为blob路径
+
+        blob文件本身由垃圾回收在宽限期后删除，避免与并发写入同一内容竞争。
+        """
+        if not self.is_blob(file_path):
+            return False
+        from models import Blob
+        blob = db.query(Blob).filter(Blob.storage_path == os.path.abspath(file_path)).first()
+        if blob is not None:
+            blob.ref_count = max(0, (blob.ref_count or 0) - 1)
+            blob.updated_at = datetime.now()
+        return True
+
+    def discard_path(self, db, file_path: Optional[str]):
+        """释放记录对文件的引用：blob路径减少引用计数，旧的非blob路径直接删除文件"""
+        if not file_path or self.release(db, file_path):
+            return
+        try:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        except OSError as e:
+            logger.warning(f"删除文件失败 {file_path}: {e}")
+
+    # ---------- 垃圾回收 ----------
+
+    def _count_references(self, db) -> Dict[str, int]:
+        """按各表实际保存的路径统计blob引用数"""
+        from sqlalchemy import func, or_
+        from models import (
+            ManagedFile, Award, AwardFile, Performance, PerformanceFile,
+            LawyerCertificate, LawyerCertificateFile, SectionDocument
+        )
+
+        prefix = self.root + os.sep + "%"
+        now = datetime.now()
+        columns = [
+            # 已过期归档的临时文件不再占用物理文件
+            (ManagedFile.storage_path, or_(
+                ManagedFile.is_archived == False,
+                ManagedFile.expires_at == None,
+                ManagedFile.expires_at >= now
+            )),
+            (Award.source_document, None),
+            (AwardFile.file_path, None),
+            (Performance.source_document, None),
+            (PerformanceFile.file_path, None),
+            (LawyerCertificate.source_document, None),
+            (LawyerCertificateFile.file_path, None),
+            (SectionDocument.storage_path, None),
+        ]
+
+        references: Dict[str, int] = {}
+        for column, condition in columns:
+            query = db.query(column, func.count()).filter(column.like(prefix))
+            if condition is not None:
+                query = query.filter(condition)
+            for path, count in query.group_by(column):
+                references[path] = references.get(path, 0) + count
+        return references
+
+    def collect_garbage(self, db, grace_seconds: float = 3600, dry_run: bool = False) -> Dict[str, Any]:
+        """按实际引用修正引用计数，删除无引用且超过宽限期的blob及残留的临时/孤立文件"""
+        from models import Blob
+
+        started = time.perf_counter()
+        cutoff = datetime.now() - timedelta(seconds=grace_seconds)
+        references = self._count_references(db)
+
+        corrected = 0
+        removed: List[str] = []
+        freed_bytes = 0
+        known_paths = set()
+        for blob in db.query(Blob).all():
+            known_paths.add(blob.storage_path)
+            actual = references.get(blob.storage_path, 0)
+            if blob.ref_count != actual:
+                corrected += 1
+                if not dry_run:
+                    blob.ref_count = actual
+                    blob.updated_at = datetime.now()
+            if actual == 0 and blob.updated_at and blob.updated_at < cutoff:
+                removed.append(blob.storage_path)
+                freed_bytes += blob.file_size or 0
+
+        if not dry_run:
+            db.commit()
+            deleted = []
+            for path in removed:
+                # 条件删除：期间有新上传复用该blob（更新了updated_at）时保留
+                if db.query(Blob).filter(
+                    Blob.storage_path == path,
+                    Blob.ref_count <= 0,
+                    Blob.updated_at < cutoff
+                ).delete(synchronize_session=False):
+                    deleted.append(path)
+            db.commit()
+            for path in deleted:
+                self._remove_file(path)
+            removed = deleted
+
+        # 没有登记的blob文件（事务回滚后残留）和中断上传留下的临时文件
+        orphan_files = 0
+        cutoff_ts = time.time() - grace_seconds
+        if os.path.isdir(self.root):
+            for directory, _, filenames in os.walk(self.root):
+                for filename in filenames:
+                    path = os.path.join(directory, filename)
+                    if path in known_paths:
+                        continue
+                    try:
+                        if os.path.getmtime(path) >= cutoff_ts:
+                            continue
+                        orphan_files += 1
+                        freed_bytes += os.path.getsize(path)
+                    except OSError:
+                        continue
+                    if not dry_run:
+                        self._remove_file(path)
+
+        result = {
+            "success": True,
+            "dry_run": dry_run,
+            "referenced_blobs": len(references),
+            "corrected_ref_counts": corrected,
+            "removed_blobs": len(removed),
+            "removed_orphan_files": orphan_files,
+            "freed_bytes": freed_bytes,
+            "seconds": round(time.perf_counter() - started, 3),
+            "finished_at": datetime.now().isoformat()
+        }
+        if not dry_run:
+            self._last_gc = result
+        logger.info(f"blob垃圾回收完成: 删除 {len(removed)} 个blob, {orphan_files} 个孤立文件, "
+                    f"释放 {freed_bytes / 1024 / 1024:.1f}MB")
+        return result
+
+    @staticmethod
+    def _remove_file(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"删除blob文件失败 {path}: {e}")
+
+    def get_stats(self, db=None) -> Dict[str, Any]:
+        stats = {
+            "root": self.root,
+            "stored": self._stored,
+            "deduplicated": self._deduplicated,
+            "bytes_saved": self._bytes_saved,
+            "last_gc": self._last_gc,
+        }
+        if db is not None:
+            from sqlalchemy import func
+            from models import Blob
+            count, total_size = db.query(func.count(Blob.id), func.coalesce(func.sum(Blob.file_size), 0)).one()
+            unreferenced = db.query(func.count(Blob.id)).filter(Blob.ref_count <= 0).scalar()
+            stats.update({"blobs": count, "total_size": int(total_size), "unreferenced": unreferenced})
+        return stats
+
+
+# 全局blob存储实例
+blob_store = BlobStore()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+长文档分块分析模块
+
+按文档结构（DoclingDocument的标题/段落，或文本中的条款编号、空行）切分长文本，
+限定分块大小和数量以控制Token用量，并将各分块的抽取结果按字段确定性合并：
+标量字段按分块置信度加权投票（平票取靠前分块），列表字段取并集，嵌套字典递归合并，
+同时给出每个字段的一致度作为字段置信度。
+"""
+
+import re
+import logging
+from typing import Dict, Any, List, Tuple
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+# 常见的中文合同/文书结构标题：第X条/章/节、一、（一）、1. 等
+_HEADING_PATTERN = re.compile(
+    r"^\s*(第[一二三四五六七八九十百零〇\d]+[条章节部分]|[一二三四五六七八九十]+、|[（(][一二三四五六七八九十\d]+[）)]|\d+(\.\d+)*[\.、\s])"
+)
+
+# Docling中表示结构边界的文本标签
+_DOCLING_HEADING_LABELS = {"title", "section_header", "page_header"}
+
+# 合并时不参与投票的元信息字段
+_META_FIELDS = {"confidence", "reasoning", "classification_reasoning"}
+
+
+def _units_from_document(document: Any) -> List[str]:
+    """按DoclingDocument的标题切分结构单元"""
+    units: List[str] = []
+    current: List[str] = []
+    for text_item in getattr(document, "texts", []):
+        text = (getattr(text_item, "text", "") or "").strip()
+        if not text:
+            continue
+        label = getattr(getattr(text_item, "label", None), "value", str(getattr(text_item, "label", "")))
+        if label in _DOCLING_HEADING_LABELS and current:
+            units.append("\n".join(current))
+            current = []
+        current.append(text)
+    if current:
+        units.append("\n".join(current))
+    return units
+
+
+def _units_from_text(text: str) -> List[str]:
+    """按空行和条款编号切分结构单元"""
+    units: List[str] = []
+    current: List[str] = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            if current:
+                units.append("\n".join(current))
+                current = []
+            continue
+        if _HEADING_PATTERN.match(stripped) and current:
+            units.append("\n".join(current))
+            current = []
+        current.append(stripped)
+    if current:
+        units.append("\n".join(current))
+    return units
+
+
+def _split_oversized(unit: str, chunk_chars: int) -> List[str]:
+    """超长单元按句子切分，仍超长时硬切"""
+    pieces: List[str] = []
+    current = ""
+    for sentence in re.split(r"(?<=[。；;！!？?\n])", unit):
+        while len(sentence) > chunk_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:chunk_chars])
+            sentence = sentence[chunk_chars:]
+        if len(current) + len(sentence) > chunk_chars and current:
+            pieces.append(current)
+            current = ""
+        current += sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_into_chunks(text: str, chunk_chars: int, document: Any = None) -> List[str]:
+    """按结构边界将文本打包为不超过 chunk_chars 的分块"""
+    units: List[str] = []
+    if document is not None:
+        try:
+            units = _units_from_document(document)
+        except Exception as e:
+            logger.warning(f"按文档结构切分失败，改用文本切分: {e}")
+    if not units:
+        units = _units_from_text(text)
+
+    chunks: List[str] = []
+    current = ""
+    for unit in units:
+        for piece in (_split_oversized(unit, chunk_chars) if len(unit) > chunk_chars else [unit]):
+            if current and len(current) + len(piece) + 2 > chunk_chars:
+                chunks.append(current)
+                current = ""
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def select_chunks(chunks: List[str], max_chunks: int) -> List[Tuple[int, str]]:
+    """分块过多时保留首尾并在中间均匀抽取，返回 (原序号, 分块)"""
+    if len(chunks) <= max_chunks:
+        return list(enumerate(chunks))
+    if max_chunks <= 1:
+        return [(0, chunks[0])]
+    step = (len(chunks) - 1) / (max_chunks - 1)
+    indexes = sorted({round(i * step) for i in range(max_chunks)})
+    return [(index, chunks[index]) for index in indexes]
+
+
+def _normalize(value: Any) -> str:
+    return re.sub(r"\s+", "", str(value)).lower()
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or (isinstance(value, str) and value.strip() in ("", "未知", "未识别", "unknown", "null", "None"))
+
+
+def _chunk_weight(result: Dict[str, Any]) -> float:
+    try:
+        return max(0.05, min(1.0, float(result.get("confidence", 0.5))))
+    except (TypeError, ValueError):
+        return 0.5
+
+
+def _merge_values(values: List[Tuple[int, float, Any]]) -> Tuple[Any, float]:
+    """合并同一字段的多个分块取值，返回 (取值, 一致度)"""
+    values = [(index, weight, value) for index, weight, value in values if not _is_empty(value)]
+    if not values:
+        return None, 0.0
+
+    if all(isinstance(value, dict) for _, _, value in values):
+        merged, field_confidence = merge_chunk_results([(index, weight, value) for index, weight, value in values])
+        scores = list(field_confidence.values())
+        return merged, round(sum(scores) / len(scores), 3) if scores else 0.0
+
+    if all(isinstance(value, list) for _, _, value in values):
+        seen, union = set(), []
+        for _, _, value in sorted(values, key=lambda item: item[0]):
+            for element in value:
+                key = _normalize(element)
+                if key not in seen:
+                    seen.add(key)
+                    union.append(element)
+        return union, 1.0
+
+    # 标量：置信度加权投票，平票取最靠前的分块
+    tally: Dict[str, Dict[str, Any]] = {}
+    for index, weight, value in values:
+        key = _normalize(value)
+        entry = tally.setdefault(key, {"weight": 0.0, "first": index, "value": value})
+        entry["weight"] += weight
+        if index < entry["first"]:
+            entry["first"], entry["value"] = index, value
+    winner = max(tally.values(), key=lambda entry: (entry["weight"], -entry["first"]))
+    total = sum(entry["weight"] for entry in tally.values())
+    return winner["value"], round(winner["weight"] / total, 3)
+
+
+def merge_chunk_results(results: List[Tuple[int, float, Dict[str, Any]]]) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """合并多个分块的抽取结果 [(分块序号, 权重, 结果字典)]，返回 (合并结果, 字段置信度)"""
+    field_names: List[str] = []
+    for _, _, result in sorted(results, key=lambda item: item[0]):
+        for name in result:
+            if name not in field_names and name not in _META_FIELDS:
+                field_names.append(name)
+
+    merged: Dict[str, Any] = {}
+    field_confidence: Dict[str, float] = {}
+    for name in field_names:
+        value, agreement = _merge_values([(index, weight, result.get(name)) for index, weight, result in results])
+        if value is not None:
+            merged[name] = value
+            field_confidence[name] = agreement
+    return merged, field_confidence
+
+
+def merge_chunk_extractions(chunk_results: List[Tuple[int, Dict[str, Any]]]) -> Dict[str, Any]:
+    """合并各分块的顶层抽取结果，附带 field_confidence 和总体 confidence
+
+    总体置信度 = 分块中最高置信度 × 各字段平均一致度；理由取置信度最高的分块。
+    """
+    weighted = [(index, _chunk_weight(result), result) for index, result in chunk_results]
+    if not weighted:
+        return {}
+
+    merged, field_confidence = merge_chunk_results(weighted)
+    best_index, best_weight, best_result = max(weighted, key=lambda item: (item[1], -item[0]))
+    agreement = sum(field_confidence.values()) / len(field_confidence) if field_confidence else 1.0
+
+    merged["confidence"] = round(best_weight * agreement, 3)
+    for name in ("reasoning", "classification_reasoning"):
+        if best_result.get(name):
+            merged[name] = best_result[name]
+    merged["field_confidence"] = field_confidence
+    return merged
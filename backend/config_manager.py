@@ -5,9 +5,11 @@
 import json
 import os
 import logging
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from datetime import datetime
 from pathlib import Path
+from keyword_matcher import KeywordMatcher, KeywordMatch
+from prompt_compiler import CompiledPrompt
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +33,13 @@ class ConfigManager:
         self._ai_analysis_config_cache = None
         self._cache_timestamps = {}
         
+        # 编译后的关键词匹配器：名称 -> (配置版本, 匹配器)
+        self._keyword_matchers: Dict[str, Tuple[float, KeywordMatcher]] = {}
+        
+        # 预编译的提示词：类型 -> 编译结果（版本为配置文件的加载时间）
+        self._compiled_prompts: Dict[str, CompiledPrompt] = {}
+        self._learning_section: Tuple[float, str] = (-1, "")
+        
         # 初始化配置文件
         self._init_config_files()
     
@@ -224,31 +233,71 @@ class ConfigManager:
             formatted.append(f"- {info.get('name', '')}: {info.get('description', '')} (关键词: {keywords})")
         return "\n".join(formatted)
     
-    def build_prompt(self, prompt_type: str, variables: Dict[str, Any] = None) -> str:
-        """构建完整的prompt"""
-        if variables is None:
-            variables = {}
-            
+    def _static_prompt_variables(self, prompt_type: str) -> Dict[str, str]:
+        """提示词类型对应的配置表（不随文档变化的部分）"""
+        if prompt_type == "document_classification":
+            return {"document_types": self.format_document_types_for_prompt()}
+        if prompt_type == "business_field_classification":
+            return {"business_fields": self.format_business_fields_for_prompt()}
+        if prompt_type == "project_type_classification":
+            return {"project_types": self.format_project_types_for_prompt()}
+        return {}
+    
+    def get_compiled_prompt(self, prompt_type: str) -> Optional[CompiledPrompt]:
+        """获取预编译的提示词，配置文件重新加载后自动重新编译"""
         template = self.get_prompt_template(prompt_type)
         if not template:
+            return None
+        
+        version = self._cache_timestamps.get(str(self.ai_analysis_config_file), 0)
+        compiled = self._compiled_prompts.get(prompt_type)
+        if compiled and compiled.version == version:
+            return compiled
+        
+        compiled = CompiledPrompt(prompt_type, template, self._static_prompt_variables(prompt_type), version)
+        self._compiled_prompts[prompt_type] = compiled
+        logger.info(f"提示词已预编译: {prompt_type} (动态字段: {', '.join(compiled.fields) or '无'})")
+        return compiled
+    
+    def build_prompt(self, prompt_type: str, variables: Dict[str, Any] = None) -> str:
+        """构建完整的prompt（静态部分预编译，只填入文档内容等动态变量）"""
+        compiled = self.get_compiled_prompt(prompt_type)
+        if compiled is None:
             logger.warning(f"未找到prompt模板: {prompt_type}")
             return ""
         
-        # 根据prompt类型添加特定的格式化数据
-        if prompt_type == "document_classification":
-            variables["document_types"] = self.format_document_types_for_prompt()
-        elif prompt_type == "business_field_classification":
-            variables["business_fields"] = self.format_business_fields_for_prompt()
-        elif prompt_type == "project_type_classification":
-            variables["project_types"] = self.format_project_types_for_prompt()
-        
         # 格式化prompt
         try:
-            formatted_prompt = template.format(**variables)
-            return formatted_prompt
+            return compiled.render(variables)
         except KeyError as e:
             logger.warning(f"格式化prompt失败，缺少参数: {e}")
-            return template
+            return compiled.template
+    
+    def get_learning_section(self) -> str:
+        """基于最近用户修正的学习提醒（学习数据重新加载后重新生成）"""
+        corrections = self.get_learning_data("user_corrections")
+        version = self._cache_timestamps.get(str(self.ai_learning_file), 0)
+        if self._learning_section[0] == version:
+            return self._learning_section[1]
+        
+        learning_notes = []
+        for correction in corrections[-10:]:  # 只使用最近10条学习数据
+            if correction.get("specific_correction") == "law_firm_license_vs_personal_certificate":
+                learning_notes.append(
+                    "重要提醒：律师事务所执业许可证应归类为qualification_certificate（资质证照），"
+                    "而非lawyer_certificate（个人律师证）。机构资质与个人证书要严格区分。"
+                )
+            
+            original = correction.get("original_classification")
+            corrected = correction.get("user_correction")
+            if original and corrected:
+                learning_notes.append(
+                    f"学习案例：{original} 类型文档被用户修正为 {corrected}"
+                )
+        
+        section = "\n\n基于用户反馈的重要改进提醒：\n" + "\n".join(learning_notes) if learning_notes else ""
+        self._learning_section = (version, section)
+        return section
     
     def get_confidence_threshold(self, analysis_type: str) -> float:
         """获取指定分析类型的置信度阈值"""
@@ -256,21 +305,53 @@ class ConfigManager:
         settings = config.get("analysis_settings", {})
         return settings.get("confidence_threshold", 0.7)
     
+    def _keyword_groups(self, name: str) -> Tuple[Dict[str, List[str]], Path]:
+        """获取指定关键词表的 {分类: 关键词列表} 及其配置文件"""
+        if name == "document_types":
+            return {code: info.get("keywords", []) for code, info in self.get_document_types().items()}, self.ai_analysis_config_file
+        if name == "business_field_classifications":
+            return {code: info.get("keywords", []) for code, info in self.get_business_field_classifications().items()}, self.ai_analysis_config_file
+        if name == "performance_types":
+            items, file_path = self.get_performance_types(), self.performance_types_file
+        elif name == "business_fields":
+            items, file_path = self.get_business_fields(), self.business_fields_file
+        else:
+            raise ValueError(f"未知的关键词表: {name}")
+        
+        groups: Dict[str, List[str]] = {}
+        for item in items:
+            if item.get("is_active", True):
+                groups.setdefault(item.get("name"), []).extend(item.get("keywords", []))
+        return groups, file_path
+    
+    def get_keyword_matcher(self, name: str) -> KeywordMatcher:
+        """获取关键词表编译后的匹配器，配置文件重新加载后自动重建"""
+        groups, file_path = self._keyword_groups(name)
+        version = self._cache_timestamps.get(str(file_path), 0)
+        cached = self._keyword_matchers.get(name)
+        if cached and cached[0] == version:
+            return cached[1]
+        
+        matcher = KeywordMatcher(groups)
+        self._keyword_matchers[name] = (version, matcher)
+        logger.info(f"关键词匹配器已编译: {name} ({len(groups)} 个分类, {matcher.pattern_count} 个关键词)")
+        return matcher
+    
+    def match_keywords(self, name: str, text: str) -> Dict[str, KeywordMatch]:
+        """单次扫描文本，返回关键词表中每个分类的命中次数和位置"""
+        return self.get_keyword_matcher(name).scan(text or "")
+    
     def classify_business_field_by_keywords(self, text: str) -> Optional[tuple[str, str, float]]:
         """根据关键词分类业务领域"""
         fields = self.get_business_field_classifications()
-        text_lower = text.lower()
+        matches = self.match_keywords("business_field_classifications", text)
         
         best_match = None
         best_score = 0
         
         for code, info in fields.items():
             keywords = info.get("keywords", [])
-            matched_keywords = []
-            
-            for keyword in keywords:
-                if keyword.lower() in text_lower:
-                    matched_keywords.append(keyword)
+            matched_keywords = matches[code].matched(keywords)
             
             if matched_keywords:
                 # 计算匹配分数（匹配关键词数量 / 总关键词数量）
@@ -284,18 +365,14 @@ class ConfigManager:
     def classify_document_type_by_keywords(self, text: str) -> Optional[tuple[str, str, float]]:
         """根据关键词分类文档类型"""
         doc_types = self.get_document_types()
-        text_lower = text.lower()
+        matches = self.match_keywords("document_types", text)
         
         best_match = None
         best_score = 0
         
         for code, info in doc_types.items():
             keywords = info.get("keywords", [])
-            matched_keywords = []
-            
-            for keyword in keywords:
-                if keyword.lower() in text_lower:
-                    matched_keywords.append(keyword)
+            matched_keywords = matches[code].matched(keywords)
             
             if matched_keywords:
                 # 计算匹配分数（匹配关键词数量 / 总关键词数量）
@@ -385,34 +462,30 @@ class ConfigManager:
     def suggest_performance_type(self, text: str) -> Optional[str]:
         """根据文本建议业绩类型"""
         types = self.get_performance_types()
-        text_lower = text.lower()
+        matches = self.match_keywords("performance_types", text)
         
         for type_info in types:
             if not type_info.get("is_active", True):
                 continue
             
             # 检查关键词匹配
-            keywords = type_info.get("keywords", [])
-            for keyword in keywords:
-                if keyword.lower() in text_lower:
-                    return type_info.get("name")
+            if matches[type_info.get("name")].matched(type_info.get("keywords", [])):
+                return type_info.get("name")
         
         return None
     
     def suggest_business_field(self, text: str) -> Optional[str]:
         """根据文本建议业务领域"""
         fields = self.get_business_fields()
-        text_lower = text.lower()
+        matches = self.match_keywords("business_fields", text)
         
         for field_info in fields:
             if not field_info.get("is_active", True):
                 continue
             
             # 检查关键词匹配
-            keywords = field_info.get("keywords", [])
-            for keyword in keywords:
-                if keyword.lower() in text_lower:
-                    return field_info.get("name")
+            if matches[field_info.get("name")].matched(field_info.get("keywords", [])):
+                return field_info.get("name")
         
         return None
     
@@ -1,8 +1,11 @@
 import os
+import logging
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+logger = logging.getLogger(__name__)
+
 # 获取数据库URL，如果没有设置则使用SQLite
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./bidder.db")
 
@@ -40,4 +43,14 @@ def get_db():
 def init_db():
     """初始化数据库"""
     from models import Base
-    Base.metadata.create_all(bind=engine) 
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
+    ensure_indexes(Base.metadata)
+
+def ensure_indexes(metadata):
+    """已有数据库不会由 create_all 补建新增的索引，这里按需创建"""
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except Exception as e:
+                logger.warning(f"创建索引 {index.name} 失败: {e}") 
\ No newline at end of file
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+Docling转换结果缓存模块
+
+按 文件内容哈希 + 流水线配置指纹 缓存Docling转换结果，
+在磁盘上保存序列化的DoclingDocument及其文本、Markdown、HTML导出，
+按缓存总大小进行LRU淘汰。重复转换同一文件时只需读取磁盘。
+页面级OCR缓存与转换缓存共用 DiskLruCache 的索引、淘汰和统计。
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple, Union, Iterator, Callable
+
+from blob_store import blob_hash_from_path
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+# DoclingDocument反序列化
+try:
+    from docling_core.types.doc import DoclingDocument
+    DOCLING_CORE_AVAILABLE = True
+except ImportError as e:
+    DOCLING_CORE_AVAILABLE = False
+    logger.warning(f"docling_core不可用，转换缓存无法还原文档: {e}")
+
+
+def compute_file_hash(file_path: Union[str, Path], chunk_size: int = 1024 * 1024) -> str:
+    """计算文件内容的SHA-256哈希（blob存储中的文件直接取文件名）"""
+    blob_hash = blob_hash_from_path(file_path)
+    if blob_hash:
+        return blob_hash
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def compute_options_fingerprint(options: Dict[str, Any]) -> str:
+    """计算流水线配置指纹"""
+    payload = json.dumps(options, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class DiskLruCache:
+    """磁盘缓存公共部分：内存索引、按大小LRU淘汰、清空和统计
+
+    子类负责键与条目内容的读写，实现 _scan_entries（启动时扫描磁盘重建索引）和 _delete_files。
+    """
+
+    LABEL = "磁盘缓存"
+    UNIT = "条"
+
+    def __init__(self, cache_dir: Union[str, Path], max_size_bytes: int, enabled: bool = True):
+        self.cache_dir = Path(cache_dir)
+        self.max_size_bytes = max_size_bytes
+        self.enabled = enabled
+
+        # 内存索引: key -> (占用字节数, 最近访问时间)
+        self._index: Dict[str, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+        if self.enabled:
+            try:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                for key, size, accessed_at in self._scan_entries():
+                    self._index[key] = (size, accessed_at)
+                logger.info(f"{self.LABEL}已启用: {self.cache_dir} "
+                            f"({len(self._index)} {self.UNIT}, 上限 {self.max_size_bytes // (1024 * 1024)}MB)")
+            except Exception as e:
+                logger.warning(f"{self.LABEL}初始化失败，已禁用: {e}")
+                self.enabled = False
+
+    def _scan_entries(self) -> Iterator[Tuple[str, int, float]]:
+        """扫描磁盘上的条目，产出 (key, 占用字节数, 最近访问时间)"""
+        raise NotImplementedError
+
+    def _delete_files(self, key: str):
+        """删除条目在磁盘上的文件"""
+        raise NotImplementedError
+
+    # ========== 索引记录 ==========
+
+    def _record_hit(self, key: str, size_if_unknown: Callable[[], int]):
+        """命中后刷新访问时间（索引中没有该条目时按 size_if_unknown() 登记）"""
+        now = time.time()
+        with self._lock:
+            self._hits += 1
+            size = self._index[key][0] if key in self._index else size_if_unknown()
+            self._index[key] = (size, now)
+
+    def _record_miss(self, key: Optional[str] = None):
+        """记录未命中；给出 key 时同时从索引中移除（条目已不在磁盘上）"""
+        with self._lock:
+            self._misses += 1
+            if key is not None:
+                self._index.pop(key, None)
+
+    def _record_put(self, key: str, size: int):
+        """登记新写入的条目，总大小超限时淘汰"""
+        with self._lock:
+            self._index[key] = (size, time.time())
+        self.evict_if_needed()
+
+    def _remove_entry(self, key: str):
+        self._delete_files(key)
+        with self._lock:
+            self._index.pop(key, None)
+
+    # ========== 管理 ==========
+
+    def evict_if_needed(self):
+        """总大小超过上限时按最近访问时间淘汰"""
+        with self._lock:
+            total_size = sum(size for size, _ in self._index.values())
+            if total_size <= self.max_size_bytes:
+                return
+            victims = []
+            for key, (size, _) in sorted(self._index.items(), key=lambda item: item[1][1]):
+                if total_size <= self.max_size_bytes:
+                    break
+                victims.append(key)
+                total_size -= size
+
+        for key in victims:
+            self._remove_entry(key)
+        if victims:
+            logger.info(f"{self.LABEL}淘汰 {len(victims)} {self.UNIT}")
+
+    def clear(self) -> int:
+        """清空缓存，返回删除条目数"""
+        with self._lock:
+            keys = list(self._index.keys())
+        for key in keys:
+            self._remove_entry(key)
+        return len(keys)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        with self._lock:
+            total_size = sum(size for size, _ in self._index.values())
+            return {
+                "enabled": self.enabled,
+                "cache_dir": str(self.cache_dir),
+                "entries": len(self._index),
+                "size_bytes": total_size,
+                "max_size_bytes": self.max_size_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+            }
+
+
+class ConversionCache(DiskLruCache):
+    """Docling转换结果磁盘缓存（按大小LRU淘汰）"""
+
+    LABEL = "Docling转换缓存"
+    UNIT = "条记录"
+
+    DOCUMENT_FILE = "document.json"
+    META_FILE = "meta.json"
+    EXPORT_FILES = {
+        "text": "text.txt",
+        "markdown": "markdown.md",
+        "html": "html.html",
+    }
+
+    def __init__(self, cache_dir: Union[str, Path], max_size_bytes: int, enabled: bool = True):
+        super().__init__(cache_dir, max_size_bytes, enabled and DOCLING_CORE_AVAILABLE)
+
+    @staticmethod
+    def make_key(file_hash: str, fingerprint: str) -> str:
+        """生成缓存键"""
+        return f"{file_hash}_{fingerprint}"
+
+    def _entry_dir(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / key
+
+    @staticmethod
+    def _dir_size(path: Path) -> int:
+        return sum(f.stat().st_size for f in path.iterdir() if f.is_file())
+
+    def _scan_entries(self) -> Iterator[Tuple[str, int, float]]:
+        for meta_path in self.cache_dir.glob(f"*/*/{self.META_FILE}"):
+            entry_dir = meta_path.parent
+            try:
+                yield entry_dir.name, self._dir_size(entry_dir), meta_path.stat().st_mtime
+            except OSError:
+                continue
+
+    def _delete_files(self, key: str):
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    # ========== 读写 ==========
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存，未命中返回None"""
+        if not self.enabled:
+            return None
+
+        entry_dir = self._entry_dir(key)
+        meta_path = entry_dir / self.META_FILE
+        if not meta_path.exists():
+            self._record_miss(key)
+            return None
+
+        try:
+            with open(entry_dir / self.DOCUMENT_FILE, "r", encoding="utf-8") as f:
+                document = DoclingDocument.model_validate_json(f.read())
+
+            exports = {}
+            for export_name, filename in self.EXPORT_FILES.items():
+                export_path = entry_dir / filename
+                if export_path.exists():
+                    exports[export_name] = export_path.read_text(encoding="utf-8")
+
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+
+            # 更新访问时间（LRU依据）
+            now = time.time()
+            os.utime(meta_path, (now, now))
+            self._record_hit(key, lambda: self._dir_size(entry_dir))
+
+            return {"document": document, "exports": exports, "meta": meta}
+
+        except Exception as e:
+            # 缓存条目损坏，删除后按未命中处理
+            logger.warning(f"读取转换缓存失败 {key}: {e}")
+            self._remove_entry(key)
+            self._record_miss()
+            return None
+
+    def put(self, key: str, document: Any, exports: Dict[str, str], meta: Optional[Dict[str, Any]] = None) -> bool:
+        """写入缓存（先写临时目录再原子替换）"""
+        if not self.enabled:
+            return False
+
+        entry_dir = self._entry_dir(key)
+        tmp_dir = entry_dir.parent / f".{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            tmp_dir.mkdir(parents=True, exist_ok=True)
+
+            with open(tmp_dir / self.DOCUMENT_FILE, "w", encoding="utf-8") as f:
+                f.write(document.model_dump_json())
+
+            for export_name, filename in self.EXPORT_FILES.items():
+                if exports.get(export_name) is not None:
+                    (tmp_dir / filename).write_text(exports[export_name], encoding="utf-8")
+
+            meta = dict(meta or {})
+            meta["created_at"] = time.time()
+            with open(tmp_dir / self.META_FILE, "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+
+            size = self._dir_size(tmp_dir)
+            if entry_dir.exists():
+                shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+
+            self._record_put(key, size)
+            return True
+
+        except Exception as e:
+            logger.warning(f"写入转换缓存失败 {key}: {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return False
+
+
+def compute_page_raster_hash(page: Any, zoom: float = 1.0) -> str:
+    """计算PDF页面栅格化后的像素哈希（与文件其余内容无关，相同页面在不同文件中哈希一致）"""
+    import fitz  # PyMuPDF
+
+    pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+    sha256 = hashlib.sha256()
+    sha256.update(f"{pixmap.width}x{pixmap.height}".encode("ascii"))
+    sha256.update(pixmap.samples)
+    return sha256.hexdigest()
+
+
+class PageOcrCache(DiskLruCache):
+    """页面级OCR结果磁盘缓存（按 页面栅格哈希 + OCR配置指纹 存储识别出的文本块，按大小LRU淘汰）"""
+
+    LABEL = "页面OCR缓存"
+    UNIT = "页"
+
+    @staticmethod
+    def make_key(page_hash: str, fingerprint: str) -> str:
+        """生成缓存键"""
+        return f"{page_hash}_{fingerprint}"
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _scan_entries(self) -> Iterator[Tuple[str, int, float]]:
+        for entry_path in self.cache_dir.glob("*/*.json"):
+            stat = entry_path.stat()
+            yield entry_path.stem, stat.st_size, stat.st_mtime
+
+    def _delete_files(self, key: str):
+        try:
+            self._entry_path(key).unlink()
+        except OSError:
+            pass
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取页面OCR结果 {"text", "blocks"}，未命中返回None"""
+        if not self.enabled:
+            return None
+
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            self._record_miss(key)
+            return None
+        except Exception as e:
+            logger.warning(f"读取页面OCR缓存失败 {key}: {e}")
+            self._remove_entry(key)
+            self._record_miss()
+            return None
+
+        now = time.time()
+        try:
+            os.utime(entry_path, (now, now))
+        except OSError:
+            pass
+        self._record_hit(key, lambda: entry_path.stat().st_size)
+        return entry
+
+    def put(self, key: str, text: str, blocks: list) -> bool:
+        """写入页面OCR结果"""
+        if not self.enabled:
+            return False
+
+        entry_path = self._entry_path(key)
+        tmp_path = entry_path.parent / f".{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            entry_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"text": text, "blocks": blocks, "created_at": time.time()}, f, ensure_ascii=False)
+            size = tmp_path.stat().st_size
+            os.replace(tmp_path, entry_path)
+
+            self._record_put(key, size)
+            return True
+
+        except Exception as e:
+            logger.warning(f"写入页面OCR缓存失败 {key}: {e}")
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+            return False
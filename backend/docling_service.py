@@ -11,14 +11,30 @@
 """
 
 import os
+import re
+import copy
+import time
 import logging
-from typing import Dict, Any, List, Optional, Union
+from typing import Dict, Any, List, Optional, Union, Tuple
 from pathlib import Path
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import threading
+import functools
 import json
 import subprocess
 
+from docling_cache import (
+    ConversionCache, PageOcrCache, compute_file_hash, compute_options_fingerprint, compute_page_raster_hash
+)
+from single_flight import SingleFlight, make_flight_key
+from ai_metrics import ai_metrics
+import docling_worker
+from settings_cache import settings_snapshot
+from docling_worker import create_document_converter
+
 # 设置日志
 logger = logging.getLogger(__name__)
 
@@ -38,6 +54,7 @@ try:
         EasyOcrOptions
     )
     from docling.datamodel.accelerator_options import AcceleratorOptions, AcceleratorDevice
+    from docling_core.types.doc import DoclingDocument
     DOCLING_AVAILABLE = True
     logger.info("Docling模块可用")
 except ImportError as e:
@@ -108,6 +125,26 @@ class DoclingConfig:
         # 图片描述prompt - 可配置
         self.picture_description_prompt = self._get_setting_value("picture_description_prompt", "请详细描述这张图片的内容，包括文字、图表、结构等信息。")
         
+        # 转换结果缓存配置 - 从数据库读取
+        self.cache_enabled = self._get_setting_value("docling_cache_enabled", "true").lower() == "true"
+        self.cache_dir = Path(self._get_setting_value("docling_cache_dir", str(self.project_root / "cache" / "docling")))
+        self.cache_max_size_mb = int(self._get_setting_value("docling_cache_max_size_mb", "2048"))
+        self.page_cache_enabled = self._get_setting_value("docling_page_cache_enabled", "true").lower() == "true"
+        self.page_cache_max_size_mb = int(self._get_setting_value("docling_page_cache_max_size_mb", "512"))
+        
+        # 执行引擎配置 - 从数据库读取 (thread: 线程池, process: 进程池)
+        self.executor_backend = self._get_setting_value("docling_executor_backend", "thread").lower()
+        self.max_workers = max(1, int(self._get_setting_value("docling_max_workers", "2")))
+        
+        # 大文件分片转换配置 - 从数据库读取
+        self.shard_enabled = self._get_setting_value("docling_shard_enabled", "false").lower() == "true"
+        self.shard_min_pages = max(2, int(self._get_setting_value("docling_shard_min_pages", "60")))
+        self.shard_page_size = max(1, int(self._get_setting_value("docling_shard_page_size", "20")))
+        
+        # 原生文本快速通道配置 - 从数据库读取
+        self.native_text_fast_path = self._get_setting_value("docling_native_text_fast_path", "true").lower() == "true"
+        self.text_layer_min_chars = int(self._get_setting_value("docling_text_layer_min_chars", "20"))
+        
         logger.info(f"Docling配置初始化完成:")
         logger.info(f"  - 运行环境: {'Docker容器' if os.path.exists('/app') else '本地开发'}")
         logger.info(f"  - 项目根目录: {self.project_root}")
@@ -130,6 +167,52 @@ class DoclingConfig:
         logger.info(f"  - 视觉模型: {self.vision_model}")
         logger.info(f"  - 视觉模型URL: {self.vision_base_url if self.vision_provider != 'ollama' else self.ollama_vision_base_url}")
         logger.info(f"  - 图片描述Prompt: {self.picture_description_prompt[:50]}...")
+        logger.info(f"  - 转换缓存: {self.cache_enabled} ({self.cache_dir}, 上限 {self.cache_max_size_mb}MB)")
+        logger.info(f"  - 页面OCR缓存: {self.page_cache_enabled} (上限 {self.page_cache_max_size_mb}MB)")
+        logger.info(f"  - 执行引擎: {self.executor_backend} (工作数: {self.max_workers})")
+        logger.info(f"  - 分片转换: {self.shard_enabled} (>= {self.shard_min_pages}页, 每片 {self.shard_page_size}页)")
+        logger.info(f"  - 原生文本快速通道: {self.native_text_fast_path} (每页最少 {self.text_layer_min_chars} 字符)")
+    
+    def get_pipeline_fingerprint_options(self) -> Dict[str, Any]:
+        """影响转换结果的流水线配置（用于缓存指纹）"""
+        try:
+            from importlib.metadata import version
+            docling_version = version("docling")
+        except Exception:
+            docling_version = "unknown"
+        
+        return {
+            "docling_version": docling_version,
+            "enable_ocr": self.enable_ocr,
+            "ocr_languages": self.ocr_languages,
+            "confidence_threshold": self.confidence_threshold,
+            "bitmap_area_threshold": self.bitmap_area_threshold,
+            "force_full_page_ocr": self.force_full_page_ocr,
+            "recog_network": self.recog_network,
+            "enable_table_structure": self.enable_table_structure,
+            "enable_picture_classification": self.enable_picture_classification,
+            "enable_picture_description": self.enable_picture_description,
+            "picture_description_model": self.vision_model if self.enable_picture_description else None,
+            "picture_description_prompt": self.picture_description_prompt if self.enable_picture_description else None,
+            "images_scale": self.images_scale,
+            "generate_page_images": self.generate_page_images,
+            "generate_picture_images": self.generate_picture_images,
+        }
+    
+    def get_page_ocr_fingerprint_options(self) -> Dict[str, Any]:
+        """影响单页OCR结果的配置（用于页面缓存指纹）"""
+        try:
+            from importlib.metadata import version
+            docling_version = version("docling")
+        except Exception:
+            docling_version = "unknown"
+        
+        return {
+            "docling_version": docling_version,
+            "ocr_languages": self.ocr_languages,
+            "recog_network": self.recog_network,
+            "confidence_threshold": self.confidence_threshold,
+        }
     
     def _get_env_bool(self, key: str, default: bool) -> bool:
         """获取环境变量布尔值"""
@@ -143,31 +226,100 @@ class DoclingConfig:
         return default
     
     def _get_setting_value(self, key: str, default: str = "") -> str:
-        """从数据库获取设置值"""
-        try:
-            from database import get_db
-            from models import SystemSettings
-            
-            db = next(get_db())
-            setting = db.query(SystemSettings).filter(
-                SystemSettings.setting_key == key
-            ).first()
-            
-            if setting and setting.setting_value:
-                return setting.setting_value
-                
-        except Exception as e:
-            logger.warning(f"无法从数据库获取设置 {key}: {str(e)}")
-        finally:
-            try:
-                if 'db' in locals():
-                    db.close()
-            except:
-                pass
+        """从数据库获取设置值（读取进程内设置快照）"""
+        value = settings_snapshot.get(key)
+        if value:
+            return value
         
         return default
 
 
+# 缓存相关配置项
+CACHE_CONFIG_KEYS = frozenset({
+    "cache_enabled", "cache_dir", "cache_max_size_mb", "page_cache_enabled", "page_cache_max_size_mb"
+})
+
+# 只影响调度与缓存、不需要重建转换器的配置项（分片和快速通道配置在每次转换时读取）
+RUNTIME_ONLY_CONFIG_KEYS = CACHE_CONFIG_KEYS | frozenset({
+    "executor_backend", "max_workers", "shard_enabled", "shard_min_pages", "shard_page_size",
+    "native_text_fast_path", "text_layer_min_chars", "download_enabled"
+})
+
+
+# ========== 分片合并工具 ==========
+
+# DoclingDocument中可被引用的节点集合
+_REF_COLLECTIONS = ("groups", "texts", "pictures", "tables", "key_value_items", "form_items")
+_REF_PATTERN = re.compile(r"^#/(groups|texts|pictures|tables|key_value_items|form_items)/(\d+)$")
+
+
+def split_page_ranges(num_pages: int, shard_size: int) -> List[Tuple[int, int]]:
+    """按固定页数切分页码范围（页码从1开始，闭区间）"""
+    return [
+        (start, min(start + shard_size - 1, num_pages))
+        for start in range(1, num_pages + 1, shard_size)
+    ]
+
+
+def _shift_document_node(node: Any, ref_offsets: Dict[str, int], page_offset: int) -> Any:
+    """平移节点中的JSON引用下标和页码"""
+    if isinstance(node, dict):
+        shifted = {}
+        for key, value in node.items():
+            if key in ("self_ref", "$ref", "cref") and isinstance(value, str):
+                match = _REF_PATTERN.match(value)
+                if match:
+                    collection, index = match.group(1), int(match.group(2))
+                    value = f"#/{collection}/{index + ref_offsets.get(collection, 0)}"
+                shifted[key] = value
+            elif key == "page_no" and isinstance(value, int):
+                shifted[key] = value + page_offset
+            else:
+                shifted[key] = _shift_document_node(value, ref_offsets, page_offset)
+        return shifted
+    if isinstance(node, list):
+        return [_shift_document_node(item, ref_offsets, page_offset) for item in node]
+    return node
+
+
+def merge_shard_documents(shards: List[Tuple[Tuple[int, int], Any]]) -> Any:
+    """将按页码范围转换得到的DoclingDocument合并为一个文档
+    
+    shards: [((起始页, 结束页), DoclingDocument), ...]，按起始页排序
+    """
+    merged: Optional[Dict[str, Any]] = None
+    
+    for (start_page, _), document in sorted(shards, key=lambda item: item[0][0]):
+        shard_dict = document.export_to_dict()
+        
+        # 分片内页码可能从1重新编号，也可能保留原始页码，统一映射回原始页码
+        page_numbers = [int(page_no) for page_no in (shard_dict.get("pages") or {}).keys()]
+        page_offset = start_page - min(page_numbers) if page_numbers else 0
+        
+        ref_offsets = {
+            collection: len(merged.get(collection) or []) if merged else 0
+            for collection in _REF_COLLECTIONS
+        }
+        shard_dict = _shift_document_node(shard_dict, ref_offsets, page_offset)
+        shard_dict["pages"] = {
+            str(page["page_no"]): page for page in (shard_dict.get("pages") or {}).values()
+        }
+        
+        if merged is None:
+            merged = copy.deepcopy(shard_dict)
+            continue
+        
+        for collection in _REF_COLLECTIONS:
+            merged.setdefault(collection, []).extend(shard_dict.get(collection) or [])
+        for root in ("body", "furniture"):
+            if root in shard_dict and root in merged:
+                merged[root].setdefault("children", []).extend(shard_dict[root].get("children") or [])
+        merged.setdefault("pages", {}).update(shard_dict.get("pages") or {})
+    
+    merged["pages"] = dict(sorted(merged.get("pages", {}).items(), key=lambda item: int(item[0])))
+    return DoclingDocument.model_validate(merged)
+
+
 class DoclingService:
     """统一Docling服务类 - 管理所有Docling相关功能"""
     
@@ -175,11 +327,40 @@ class DoclingService:
         self.config = config or DoclingConfig()
         self.converter: Optional[DocumentConverter] = None
         self.is_initialized = False
-        self._executor = ThreadPoolExecutor(max_workers=2)
+        self._executor = ThreadPoolExecutor(max_workers=self.config.max_workers)
+        
+        # 进程池执行引擎（docling_executor_backend=process 时启用）
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._process_pool_lock = threading.Lock()
+        
+        # 转换器注册表: 流水线配置指纹 -> DocumentConverter（懒加载复用）
+        self._converter_registry: Dict[str, Any] = {}
+        self._converter_registry_lock = threading.Lock()
+        
+        # 相同文件的并发转换合并
+        self._convert_flight = SingleFlight("Docling转换")
+        
+        # 转换结果缓存和页面级OCR缓存
+        self._create_caches()
+        self._pipeline_fingerprint = compute_options_fingerprint(self.config.get_pipeline_fingerprint_options())
+        self._page_ocr_fingerprint = compute_options_fingerprint(self.config.get_page_ocr_fingerprint_options())
         
         # 初始化转换器
         self._initialize_converter()
     
+    def _create_caches(self):
+        """按当前配置创建转换结果缓存和页面级OCR缓存（从磁盘重建索引）"""
+        self.conversion_cache = ConversionCache(
+            cache_dir=self.config.cache_dir,
+            max_size_bytes=self.config.cache_max_size_mb * 1024 * 1024,
+            enabled=self.config.cache_enabled
+        )
+        self.page_ocr_cache = PageOcrCache(
+            cache_dir=self.config.cache_dir / "pages",
+            max_size_bytes=self.config.page_cache_max_size_mb * 1024 * 1024,
+            enabled=self.config.page_cache_enabled
+        )
+    
     def _initialize_converter(self) -> bool:
         """初始化Docling转换器"""
         if not DOCLING_AVAILABLE:
@@ -195,6 +376,11 @@ class DoclingService:
             self.is_initialized = True
             
             logger.info("Docling转换器初始化成功")
+            
+            # 进程池模式下预热工作进程
+            if self.config.executor_backend == "process":
+                self._start_process_pool()
+            
             return True
             
         except Exception as e:
@@ -296,177 +482,381 @@ class DoclingService:
             logger.warning(f"模型配置失败，但不影响基础功能: {e}")
     
     def _create_converter(self) -> Optional[object]:
-        """创建Docling文档转换器 - 使用HF镜像配置并优化EasyOCR"""
-        # 确保HF镜像环境变量在转换器创建时也有效
-        import os
-        hf_endpoint = "https://hf-mirror.com"
-        os.environ["HF_ENDPOINT"] = hf_endpoint
-        os.environ["HUGGINGFACE_HUB_URL"] = hf_endpoint
-        
-        # 配置EasyOCR选项
-        ocr_options = None
-        accelerator_options = AcceleratorOptions(device=AcceleratorDevice.CPU)
-        
-        if self.config.enable_ocr and EASYOCR_AVAILABLE:
+        """创建Docling文档转换器"""
+        return create_document_converter(self.config)
+    
+    # ========== 进程池执行引擎 ==========
+    
+    def _start_process_pool(self) -> Optional[ProcessPoolExecutor]:
+        """创建进程池并预热工作进程，每个工作进程启动时构建一次转换器"""
+        with self._process_pool_lock:
+            if self._process_pool is not None:
+                return self._process_pool
+            
             try:
-                # 优化EasyOCR选项 - 基于官方文档和GitHub讨论
-                ocr_options = EasyOcrOptions(
-                    # 必需参数 - 语言支持
-                    lang=self.config.ocr_languages,  # ['ch_sim', 'en'] 中英文支持
-                    
-                    # OCR控制参数 - 从数据库配置读取
-                    force_full_page_ocr=self.config.force_full_page_ocr,  # 从数据库读取
-                    bitmap_area_threshold=self.config.bitmap_area_threshold,  # 从数据库读取
-                    confidence_threshold=self.config.confidence_threshold,  # 从数据库读取
-                    
-                    # 模型管理 - 关键优化
-                    model_storage_directory=str(self.config.easyocr_models_path),  # 统一模型存储
-                    download_enabled=True,  # 启用自动下载
-                    
-                    # 网络配置 - 从数据库读取
-                    recog_network=self.config.recog_network,  # 从数据库读取
-                    
-                    # GPU配置 - 从数据库读取
-                    use_gpu=self.config.use_gpu  # 从数据库读取
+                # 使用spawn避免fork后torch/OCR线程状态异常
+                self._process_pool = ProcessPoolExecutor(
+                    max_workers=self.config.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=docling_worker.init_worker,
+                    initargs=(dict(vars(self.config)),)
                 )
+                for _ in range(self.config.max_workers):
+                    self._process_pool.submit(docling_worker.worker_ping)
                 
-                # 设置加速器选项
-                if self.config.use_gpu:
-                    accelerator_options = AcceleratorOptions(device=AcceleratorDevice.CUDA)
-                else:
-                    accelerator_options = AcceleratorOptions(device=AcceleratorDevice.CPU)
-                    
-                logger.info(f"EasyOCR优化配置完成:")
-                logger.info(f"  - 语言支持: {self.config.ocr_languages}")
-                logger.info(f"  - 计算设备: {accelerator_options.device.value}")
-                logger.info(f"  - 置信度阈值: {self.config.confidence_threshold}")
-                logger.info(f"  - 位图阈值: {self.config.bitmap_area_threshold}")
-                logger.info(f"  - 全页OCR: {self.config.force_full_page_ocr}")
-                logger.info(f"  - 识别网络: {self.config.recog_network}")
-                logger.info(f"  - 模型路径: {self.config.easyocr_models_path}")
-                logger.info(f"  - HF镜像: {hf_endpoint}")
-                
+                logger.info(f"Docling进程池已启动: {self.config.max_workers} 个工作进程")
             except Exception as e:
-                logger.error(f"EasyOCR配置失败: {e}")
-                ocr_options = None
-                accelerator_options = AcceleratorOptions(device=AcceleratorDevice.CPU)
+                logger.error(f"Docling进程池启动失败，回退到线程池: {e}")
+                self._process_pool = None
+            
+            return self._process_pool
+    
+    def _reset_process_pool(self):
+        """关闭并丢弃进程池（工作进程崩溃后重建）"""
+        with self._process_pool_lock:
+            pool, self._process_pool = self._process_pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+    
+    async def _run_conversion(self, file_path: Path, page_range: Optional[Tuple[int, int]] = None) -> Dict[str, Any]:
+        """按配置的执行引擎执行转换，返回document及原始转换结果"""
+        loop = asyncio.get_event_loop()
         
-        # 配置图片描述选项 - 使用用户配置的视觉模型
-        picture_description_options = None
-        if self.config.enable_picture_description and self.config.vision_api_key:
-            try:
-                from docling.datamodel.pipeline_options import PictureDescriptionApiOptions
-                
-                # 根据视觉提供商配置API选项
-                if self.config.vision_provider == "ollama":
-                    # Ollama配置
-                    picture_description_options = PictureDescriptionApiOptions(
-                        url=f"{self.config.ollama_vision_base_url}/chat/completions",
-                        headers={
-                            "Content-Type": "application/json"
-                        },
-                        params={
-                            "model": self.config.vision_model
-                        },
-                        prompt=self.config.picture_description_prompt,
-                        timeout=60,
-                        picture_area_threshold=0.05,
-                        scale=2.0
+        if self.config.executor_backend == "process":
+            pool = self._process_pool or self._start_process_pool()
+            if pool is not None:
+                try:
+                    document_json = await loop.run_in_executor(
+                        pool,
+                        docling_worker.convert_in_worker,
+                        str(file_path),
+                        page_range
                     )
-                    logger.info(f"Docling图片描述配置(Ollama): {self.config.vision_model}")
-                else:
-                    # OpenAI兼容API配置 (OpenAI, Azure, Custom)
-                    headers = {
-                        "Content-Type": "application/json",
-                        "Authorization": f"Bearer {self.config.vision_api_key}"
-                    }
-                    
-                    # 根据不同提供商配置模型参数
-                    if self.config.vision_provider == "azure":
-                        # Azure OpenAI特殊配置
-                        api_url = f"{self.config.vision_base_url}/openai/deployments/{self.config.vision_model}/chat/completions"
-                        headers["api-key"] = self.config.vision_api_key
-                        del headers["Authorization"]  # Azure使用api-key而不是Authorization
-                    else:
-                        # OpenAI或Custom API
-                        api_url = f"{self.config.vision_base_url}/chat/completions"
-                    
-                    picture_description_options = PictureDescriptionApiOptions(
-                        url=api_url,
-                        headers=headers,
-                        params={
-                            "model": self.config.vision_model,
-                            "max_tokens": 1000,
-                            "temperature": 0.1
-                        },
-                        prompt=self.config.picture_description_prompt,
-                        timeout=60,
-                        picture_area_threshold=0.05,
-                        scale=2.0
+                    document = await loop.run_in_executor(
+                        None,
+                        DoclingDocument.model_validate_json,
+                        document_json
                     )
-                    logger.info(f"Docling图片描述配置({self.config.vision_provider}): {self.config.vision_model}")
-                    logger.info(f"  - API URL: {api_url}")
-                    logger.info(f"  - Prompt: {self.config.picture_description_prompt[:50]}...")
-                
-            except ImportError as e:
-                logger.warning(f"PictureDescriptionApiOptions不可用: {e}")
-                picture_description_options = None
-            except Exception as e:
-                logger.error(f"图片描述配置失败: {e}")
-                picture_description_options = None
-        
-        # 配置PDF处理选项
-        pdf_options_dict = {
-            "do_ocr": self.config.enable_ocr,
-            "do_table_structure": self.config.enable_table_structure,  # 从数据库读取
-            "do_picture_classification": self.config.enable_picture_classification,  # 从数据库读取
-            "do_picture_description": self.config.enable_picture_description,  # 从数据库读取
-            "ocr_options": ocr_options,
-            "accelerator_options": accelerator_options,  # 关键：设置加速器选项
-            "images_scale": self.config.images_scale,
-            "generate_page_images": self.config.generate_page_images,  # 从数据库读取
-            "generate_picture_images": self.config.generate_picture_images,  # 从数据库读取
-            "generate_parsed_pages": True,
-            "generate_table_images": False,
-            "enable_remote_services": (picture_description_options is not None)  # 如果配置了图片描述，则启用远程服务
-        }
+                    return {"document": document, "conversion_result": None}
+                except BrokenProcessPool as e:
+                    logger.error(f"Docling工作进程异常退出，重建进程池并使用线程池重试: {e}")
+                    self._reset_process_pool()
         
-        # 只有在配置了图片描述选项时才添加
-        if picture_description_options is not None:
-            pdf_options_dict["picture_description_options"] = picture_description_options
-            logger.info("✅ Docling图片描述选项已配置，将使用用户配置的视觉模型")
+        if page_range:
+            convert = functools.partial(self.converter.convert, str(file_path), page_range=page_range)
         else:
-            logger.info("ℹ️  未配置Docling图片描述选项，将使用独立视觉分析")
+            convert = functools.partial(self.converter.convert, str(file_path))
+        result = await loop.run_in_executor(self._executor, convert)
+        return {"document": result.document, "conversion_result": result}
+    
+    def _get_pdf_page_count(self, file_path: Path) -> int:
+        """获取PDF页数，非PDF或读取失败返回0"""
+        if file_path.suffix.lower() != ".pdf":
+            return 0
+        try:
+            import fitz  # PyMuPDF
+            with fitz.open(str(file_path)) as pdf_document:
+                return pdf_document.page_count
+        except Exception as e:
+            logger.warning(f"读取PDF页数失败 {file_path}: {e}")
+            return 0
+    
+    async def _run_sharded_conversion(self, file_path: Path, num_pages: int) -> Dict[str, Any]:
+        """按页码范围分片并行转换大文件，合并为一个文档"""
+        page_ranges = split_page_ranges(num_pages, self.config.shard_page_size)
+        logger.info(f"分片转换 {file_path.name}: {num_pages} 页 -> {len(page_ranges)} 个分片")
+        
+        async def convert_shard(page_range: Tuple[int, int]) -> Dict[str, Any]:
+            started = time.perf_counter()
+            shard_result = await self._run_conversion(file_path, page_range)
+            return {
+                "page_range": page_range,
+                "document": shard_result["document"],
+                "seconds": round(time.perf_counter() - started, 3)
+            }
+        
+        started = time.perf_counter()
+        tasks = [asyncio.ensure_future(convert_shard(page_range)) for page_range in page_ranges]
+        try:
+            shard_results = await asyncio.gather(*tasks)
+        except BaseException:
+            # 任一分片失败时取消其余分片，排队中的分片不再占用工作进程（已开始执行的无法中断，结果丢弃），
+            # 等取消完成后再由调用方回退到整文件转换
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        convert_seconds = time.perf_counter() - started
         
-        pdf_options = PdfPipelineOptions(**pdf_options_dict)
+        loop = asyncio.get_event_loop()
+        merge_started = time.perf_counter()
+        document = await loop.run_in_executor(
+            None,
+            merge_shard_documents,
+            [(shard["page_range"], shard["document"]) for shard in shard_results]
+        )
+        merge_seconds = time.perf_counter() - merge_started
+        
+        shard_timings = [
+            {"page_range": list(shard["page_range"]), "seconds": shard["seconds"]}
+            for shard in shard_results
+        ]
+        for timing in shard_timings:
+            logger.info(f"  - 分片 {timing['page_range'][0]}-{timing['page_range'][1]}页: {timing['seconds']}s")
+        logger.info(f"  - 分片转换总耗时: {convert_seconds:.2f}s, 合并耗时: {merge_seconds:.2f}s")
+        
+        return {
+            "document": document,
+            "conversion_result": None,
+            "sharding": {
+                "num_pages": num_pages,
+                "shard_count": len(page_ranges),
+                "shards": shard_timings,
+                "convert_seconds": round(convert_seconds, 3),
+                "merge_seconds": round(merge_seconds, 3)
+            }
+        }
+    
+    def shutdown(self):
+        """关闭执行引擎"""
+        self._reset_process_pool()
+        self._executor.shutdown(wait=False)
+    
+    # ========== 核心转换功能 ==========
+    
+    async def convert_document(
+        self,
+        file_path: Union[str, Path],
+        use_cache: bool = True,
+        sharded: Optional[bool] = None
+    ) -> Dict[str, Any]:
+        """通用文档转换（带内容寻址缓存，相同文件的并发转换只执行一次）
         
-        # 配置图片处理选项 - 修复API兼容性问题
-        # 对于图片处理，我们不需要单独的PipelineOptions
+        sharded: 是否按页码范围分片并行转换；None时按配置对大PDF自动分片
+        """
+        if not self.is_initialized:
+            return {"success": False, "error": "Docling服务未初始化"}
         
-        # 创建转换器
         try:
-            converter = DocumentConverter(
-                format_options={
-                    InputFormat.PDF: PdfFormatOption(pipeline_options=pdf_options),
-                    InputFormat.DOCX: WordFormatOption(),
-                    InputFormat.PPTX: WordFormatOption(),
-                    InputFormat.HTML: WordFormatOption(),
-                    InputFormat.MD: WordFormatOption(),
-                    InputFormat.IMAGE: ImageFormatOption(),  # 简化图片配置，不传递pipeline_options
-                }
+            file_path = Path(file_path)
+            if not file_path.exists():
+                return {"success": False, "error": f"文件不存在: {file_path}"}
+            
+            loop = asyncio.get_event_loop()
+            file_hash = await loop.run_in_executor(None, compute_file_hash, file_path)
+            flight_key = make_flight_key(
+                file_hash,
+                suffix=file_path.suffix.lower(),
+                pipeline=self._pipeline_fingerprint,
+                use_cache=use_cache,
+                sharded=sharded
+            )
+            result = await self._convert_flight.run(
+                flight_key,
+                lambda: self._measured_conversion(file_path, file_hash, use_cache, sharded)
             )
+            # 合并的请求可能来自不同路径的相同文件
+            if result.get("success"):
+                result["file_path"] = str(file_path)
+            return result
             
-            logger.info("Docling转换器创建成功")
-            return converter
+        except Exception as e:
+            logger.error(f"文档转换失败 {file_path}: {e}")
+            return {"success": False, "error": str(e)}
+    
+    async def _measured_conversion(
+        self,
+        file_path: Path,
+        file_hash: str,
+        use_cache: bool,
+        sharded: Optional[bool]
+    ) -> Dict[str, Any]:
+        """执行文档转换并记录耗时和缓存命中（合并的并发请求只记录一次）"""
+        started = time.perf_counter()
+        result = await self._convert_document(file_path, file_hash, use_cache, sharded)
+        ai_metrics.record(
+            "docling_convert",
+            started,
+            model="docling",
+            provider="local",
+            cache_hit=bool(result.get("cache_hit")),
+            success=bool(result.get("success")),
+            error=result.get("error"),
+            source_file=str(file_path),
+            extra={"sharded": bool(result.get("sharding"))}
+        )
+        return result
+    
+    async def _convert_document(
+        self,
+        file_path: Path,
+        file_hash: str,
+        use_cache: bool,
+        sharded: Optional[bool]
+    ) -> Dict[str, Any]:
+        """执行一次文档转换（查询缓存 → 分片或整文件转换 → 写入缓存）"""
+        try:
+            loop = asyncio.get_event_loop()
+            
+            # 查询转换缓存
+            cache_key = None
+            if use_cache and self.conversion_cache.enabled:
+                try:
+                    cache_key = ConversionCache.make_key(file_hash, self._pipeline_fingerprint)
+                    cached = await loop.run_in_executor(None, self.conversion_cache.get, cache_key)
+                    if cached:
+                        logger.info(f"Docling转换缓存命中: {file_path.name}")
+                        return {
+                            "success": True,
+                            "document": cached["document"],
+                            "conversion_result": None,
+                            "exports": cached["exports"],
+                            "file_path": str(file_path),
+                            "cache_hit": True
+                        }
+                except Exception as cache_error:
+                    logger.warning(f"查询转换缓存失败: {cache_error}")
+            
+            # 大PDF按页码范围分片转换
+            result = None
+            if sharded is not False and (sharded or self.config.shard_enabled):
+                num_pages = await loop.run_in_executor(None, self._get_pdf_page_count, file_path)
+                min_pages = self.config.shard_page_size + 1 if sharded else self.config.shard_min_pages
+                if num_pages >= min_pages:
+                    try:
+                        result = await self._run_sharded_conversion(file_path, num_pages)
+                    except Exception as shard_error:
+                        logger.warning(f"分片转换失败，回退到整文件转换: {shard_error}")
+            
+            # 在线程池/进程池中执行转换
+            if result is None:
+                result = await self._run_conversion(file_path)
+            
+            # 写入转换缓存
+            exports = {}
+            if cache_key:
+                exports = await loop.run_in_executor(
+                    None,
+                    self._store_conversion,
+                    cache_key,
+                    result["document"],
+                    file_path.name
+                )
+            
+            return {
+                "success": True,
+                "document": result["document"],
+                "conversion_result": result["conversion_result"],
+                "exports": exports,
+                "file_path": str(file_path),
+                "cache_hit": False,
+                "sharding": result.get("sharding")
+            }
             
         except Exception as e:
-            logger.error(f"Docling转换器创建失败: {e}")
+            logger.error(f"文档转换失败 {file_path}: {e}")
+            return {"success": False, "error": str(e)}
+    
+    def _store_conversion(self, cache_key: str, document: Any, filename: str) -> Dict[str, str]:
+        """导出文本/Markdown/HTML并写入转换缓存"""
+        exports = {}
+        try:
+            exports = {
+                "text": document.export_to_text(),
+                "markdown": document.export_to_markdown(),
+                "html": document.export_to_html()
+            }
+            self.conversion_cache.put(cache_key, document, exports, {"filename": filename})
+        except Exception as e:
+            logger.warning(f"写入转换缓存失败: {e}")
+        return exports
+    
+    # ========== 原生文本快速通道 ==========
+    
+    def _is_usable_text_layer(self, text: str) -> bool:
+        """判断页面文本层是否可直接使用（字符足够且不是乱码）"""
+        if len(text) < self.config.text_layer_min_chars:
+            return False
+        # 缺少ToUnicode映射的字体会导出大量替换字符
+        garbled = sum(1 for char in text if char == "\ufffd" or (ord(char) < 32 and char not in "\n\r\t"))
+        return garbled / len(text) < 0.1
+    
+    def probe_pdf_text_layer(self, file_path: Union[str, Path], with_raster_hash: bool = False) -> List[Dict[str, Any]]:
+        """逐页探测PDF文本层，返回每页文本及是否需要OCR（需要OCR的页面可附带栅格哈希）"""
+        import fitz  # PyMuPDF
+        
+        pages = []
+        with fitz.open(str(file_path)) as pdf_document:
+            for index, page in enumerate(pdf_document):
+                text = page.get_text().strip()
+                needs_ocr = not self._is_usable_text_layer(text)
+                pages.append({
+                    "page_no": index + 1,
+                    "text": text,
+                    "needs_ocr": needs_ocr,
+                    "raster_hash": compute_page_raster_hash(page) if needs_ocr and with_raster_hash else None
+                })
+        return pages
+    
+    @staticmethod
+    def _group_page_runs(page_numbers: List[int]) -> List[Tuple[int, int]]:
+        """将页码列表合并为连续的页码范围"""
+        runs: List[Tuple[int, int]] = []
+        for page_no in sorted(page_numbers):
+            if runs and page_no == runs[-1][1] + 1:
+                runs[-1] = (runs[-1][0], page_no)
+            else:
+                runs.append((page_no, page_no))
+        return runs
+    
+    @staticmethod
+    def _blocks_by_page(document: Any, page_offset: int = 0) -> Dict[int, List[Dict[str, Any]]]:
+        """按页码汇总DoclingDocument中的文本块"""
+        page_blocks: Dict[int, List[Dict[str, Any]]] = {}
+        for text_item in document.texts:
+            if not getattr(text_item, "text", None) or not getattr(text_item, "prov", None):
+                continue
+            prov = text_item.prov[0]
+            bbox = getattr(prov, "bbox", None)
+            page_blocks.setdefault(prov.page_no + page_offset, []).append({
+                "text": text_item.text.strip(),
+                "label": getattr(text_item.label, "value", str(text_item.label)),
+                "bbox": [bbox.l, bbox.t, bbox.r, bbox.b] if bbox is not None else None
+            })
+        return page_blocks
+    
+    def _page_cache_key(self, page: Dict[str, Any]) -> Optional[str]:
+        if not page.get("raster_hash"):
             return None
+        return PageOcrCache.make_key(page["raster_hash"], self._page_ocr_fingerprint)
     
-    # ========== 核心转换功能 ==========
+    def _store_page_blocks(self, pages: List[Dict[str, Any]], page_blocks: Dict[int, List[Dict[str, Any]]]):
+        """将OCR得到的页面文本块写入页面缓存"""
+        for page in pages:
+            cache_key = self._page_cache_key(page)
+            if cache_key is None:
+                continue
+            blocks = page_blocks.get(page["page_no"], [])
+            self.page_ocr_cache.put(cache_key, "\n".join(block["text"] for block in blocks), blocks)
     
-    async def convert_document(self, file_path: Union[str, Path]) -> Dict[str, Any]:
-        """通用文档转换"""
+    def _lookup_page_texts(self, pages: List[Dict[str, Any]]) -> Dict[int, str]:
+        """查询需要OCR的页面在页面缓存中的文本，返回命中的 {页码: 文本}"""
+        texts: Dict[int, str] = {}
+        for page in pages:
+            cache_key = self._page_cache_key(page) if page["needs_ocr"] else None
+            if cache_key is None:
+                continue
+            cached = self.page_ocr_cache.get(cache_key)
+            if cached is not None:
+                texts[page["page_no"]] = cached.get("text", "")
+        return texts
+    
+    async def extract_text_routed(self, file_path: Union[str, Path]) -> Dict[str, Any]:
+        """PDF文本提取路由：有文本层的页面直接用PyMuPDF提取，无文本页面先查页面OCR缓存，其余才交给Docling OCR，按页合并
+        
+        页面OCR缓存只在本路由中查询和写入：convert_document 返回完整的 DoclingDocument，
+        无法由缓存的页面文本拼出，由整文件转换缓存负责。
+        """
         if not self.is_initialized:
             return {"success": False, "error": "Docling服务未初始化"}
         
@@ -474,24 +864,110 @@ class DoclingService:
             file_path = Path(file_path)
             if not file_path.exists():
                 return {"success": False, "error": f"文件不存在: {file_path}"}
+            if file_path.suffix.lower() != ".pdf":
+                return {"success": False, "error": f"仅支持PDF文件: {file_path.suffix}"}
             
-            # 在线程池中执行转换
             loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                self._executor, 
-                self.converter.convert, 
-                str(file_path)
+            started = time.perf_counter()
+            pages = await loop.run_in_executor(
+                None, functools.partial(self.probe_pdf_text_layer, file_path, self.page_ocr_cache.enabled)
             )
             
+            # 页面OCR缓存：不同文件中相同的证书、扫描件页面只识别一次（读取磁盘缓存在线程池中执行）
+            ocr_texts: Dict[int, str] = {}
+            if self.page_ocr_cache.enabled:
+                ocr_texts = await loop.run_in_executor(None, self._lookup_page_texts, pages)
+            cached_page_numbers = set(ocr_texts)
+            
+            ocr_page_numbers = [page["page_no"] for page in pages if page["needs_ocr"]]
+            pending_pages = [page for page in pages if page["needs_ocr"] and page["page_no"] not in cached_page_numbers]
+            
+            # 全部页面都需要OCR且均未命中页面缓存时走完整转换（可命中转换缓存）
+            if pages and len(pending_pages) == len(pages):
+                convert_result = await self.convert_document(file_path)
+                if not convert_result["success"]:
+                    return convert_result
+                doc = convert_result["document"]
+                text_content = (convert_result.get("exports") or {}).get("text") or doc.export_to_text()
+                if self.page_ocr_cache.enabled:
+                    await loop.run_in_executor(None, self._store_page_blocks, pages, self._blocks_by_page(doc))
+                return {
+                    "success": True,
+                    "text_content": text_content,
+                    "format": "text",
+                    "method": "ocr",
+                    "document": doc,
+                    "pages": [{"page_no": page["page_no"], "source": "ocr"} for page in pages],
+                    "metadata": {
+                        "pages": len(pages),
+                        "text_layer_pages": 0,
+                        "ocr_pages": len(pages),
+                        "ocr_cache_pages": 0,
+                        "seconds": round(time.perf_counter() - started, 3)
+                    }
+                }
+            
+            # 仅对未命中缓存的无文本连续页段执行OCR
+            page_runs = self._group_page_runs([page["page_no"] for page in pending_pages])
+            if page_runs:
+                run_results = await asyncio.gather(
+                    *(self._run_conversion(file_path, page_run) for page_run in page_runs),
+                    return_exceptions=True
+                )
+                for page_run, run_result in zip(page_runs, run_results):
+                    if isinstance(run_result, Exception):
+                        logger.warning(f"页面 {page_run[0]}-{page_run[1]} OCR失败: {run_result}")
+                        continue
+                    run_document = run_result["document"]
+                    # 与分片合并一致：按文档页表映射回原始页码
+                    page_numbers = [int(page_no) for page_no in (run_document.pages or {}).keys()]
+                    page_offset = page_run[0] - min(page_numbers) if page_numbers else 0
+                    run_blocks = self._blocks_by_page(run_document, page_offset)
+                    for page_no, blocks in run_blocks.items():
+                        ocr_texts[page_no] = "\n".join(block["text"] for block in blocks)
+                    if self.page_ocr_cache.enabled:
+                        run_pages = [page for page in pending_pages if page_run[0] <= page["page_no"] <= page_run[1]]
+                        await loop.run_in_executor(None, self._store_page_blocks, run_pages, run_blocks)
+            
+            # 按页合并
+            page_summaries = []
+            page_contents = []
+            for page in pages:
+                if page["needs_ocr"]:
+                    text = ocr_texts.get(page["page_no"], "")
+                    source = "ocr_cache" if page["page_no"] in cached_page_numbers else "ocr"
+                else:
+                    text = page["text"]
+                    source = "text_layer"
+                if text:
+                    page_contents.append(text)
+                page_summaries.append({"page_no": page["page_no"], "source": source, "chars": len(text)})
+            
+            text_content = "\n\n".join(page_contents)
+            method = "hybrid" if ocr_page_numbers else "text_layer"
+            seconds = round(time.perf_counter() - started, 3)
+            logger.info(f"PDF文本路由提取完成 {file_path.name}: {len(pages)} 页, "
+                        f"OCR {len(pending_pages)} 页, 缓存命中 {len(cached_page_numbers)} 页, "
+                        f"{len(text_content)} 字符, {seconds}s")
+            
             return {
                 "success": True,
-                "document": result.document,
-                "conversion_result": result,
-                "file_path": str(file_path)
+                "text_content": text_content,
+                "format": "text",
+                "method": method,
+                "document": None,
+                "pages": page_summaries,
+                "metadata": {
+                    "pages": len(pages),
+                    "text_layer_pages": len(pages) - len(ocr_page_numbers),
+                    "ocr_pages": len(pending_pages),
+                    "ocr_cache_pages": len(cached_page_numbers),
+                    "seconds": seconds
+                }
             }
             
         except Exception as e:
-            logger.error(f"文档转换失败 {file_path}: {e}")
+            logger.error(f"PDF文本路由提取失败 {file_path}: {e}")
             return {"success": False, "error": str(e)}
     
     async def extract_text(self, file_path: Union[str, Path], format: str = "markdown") -> Dict[str, Any]:
@@ -518,8 +994,11 @@ class DoclingService:
             else:
                 logger.warning("  - 没有找到文本元素")
             
-            # 根据格式提取文本
-            if format.lower() == "markdown":
+            # 根据格式提取文本（优先使用缓存的导出结果）
+            exports = convert_result.get("exports") or {}
+            if format.lower() in exports:
+                text_content = exports[format.lower()]
+            elif format.lower() == "markdown":
                 text_content = doc.export_to_markdown()
             elif format.lower() == "html":
                 text_content = doc.export_to_html()
@@ -560,14 +1039,15 @@ class DoclingService:
         
         try:
             doc = convert_result["document"]
+            exports = convert_result.get("exports") or {}
             
             # 获取预览数据
             preview_data = {
                 # HTML预览内容 - 主要用于网页显示
-                "html_content": doc.export_to_html(),
+                "html_content": exports.get("html") or doc.export_to_html(),
                 
                 # Markdown格式（备选）
-                "markdown_content": doc.export_to_markdown(),
+                "markdown_content": exports.get("markdown") or doc.export_to_markdown(),
                 
                 # 可视化数据 - 如果需要图形化预览
                 "visualization": None,  # doc.get_visualization() 如果API支持
@@ -634,7 +1114,7 @@ class DoclingService:
             
             if analysis_type in ("full", "text"):
                 # 文本分析
-                text_content = doc.export_to_text()
+                text_content = (convert_result.get("exports") or {}).get("text") or doc.export_to_text()
                 analysis_result["text_analysis"] = {
                     "char_count": len(text_content),
                     "word_count": len(text_content.split()),
@@ -668,6 +1148,15 @@ class DoclingService:
             "easyocr_available": EASYOCR_AVAILABLE,
             "initialized": self.is_initialized,
             "converter_ready": self.converter is not None,
+            "conversion_cache": self.conversion_cache.get_stats(),
+            "page_ocr_cache": self.page_ocr_cache.get_stats(),
+            "convert_single_flight": self._convert_flight.get_stats(),
+            "registered_converters": len(self._converter_registry),
+            "executor": {
+                "backend": self.config.executor_backend,
+                "max_workers": self.config.max_workers,
+                "process_pool_running": self._process_pool is not None
+            },
             "config": {
                 # 基础OCR配置
                 "enable_ocr": self.config.enable_ocr,
@@ -757,6 +1246,8 @@ class DoclingService:
     
     def __del__(self):
         """清理资源"""
+        if hasattr(self, '_process_pool'):
+            self._reset_process_pool()
         if hasattr(self, '_executor'):
             self._executor.shutdown(wait=False)
 
@@ -797,32 +1288,8 @@ class DoclingService:
             # 对于支持的文档格式，使用简化的OCR转换
             if file_ext in ['.pdf', '.docx', '.pptx', '.html', '.jpg', '.jpeg', '.png']:
                 try:
-                    # 创建简化的OCR配置 - 只做文本提取
-                    simplified_pdf_options = PdfPipelineOptions(
-                        do_ocr=True,  # 启用OCR
-                        do_table_structure=self.config.enable_table_structure,  # 从数据库读取
-                        do_picture_classification=self.config.enable_picture_classification,  # 从数据库读取
-                        do_picture_description=self.config.enable_picture_description,  # 从数据库读取
-                        generate_page_images=self.config.generate_page_images,  # 从数据库读取
-                        generate_picture_images=self.config.generate_picture_images,  # 从数据库读取
-                        generate_parsed_pages=True,  # 必须为True，避免Pydantic校验错误
-                        generate_table_images=False,  # 禁用表格图片
-                        enable_remote_services=False,  # 保持离线
-                        ocr_options=self._get_ocr_options(),  # 使用OCR选项
-                        accelerator_options=AcceleratorOptions(device=AcceleratorDevice.CUDA if self.config.use_gpu else AcceleratorDevice.CPU),  # 从数据库读取
-                        images_scale=self.config.images_scale  # 从数据库读取
-                    )
-                    
-                    # 创建简化的转换器
-                    simplified_converter = DocumentConverter(
-                        format_options={
-                            InputFormat.PDF: PdfFormatOption(pipeline_options=simplified_pdf_options),
-                            InputFormat.DOCX: WordFormatOption(),
-                            InputFormat.PPTX: WordFormatOption(),
-                            InputFormat.HTML: WordFormatOption(),
-                            InputFormat.IMAGE: ImageFormatOption(),  # 移除pipeline_options避免API错误
-                        }
-                    )
+                    # 从注册表获取简化的OCR转换器 - 只做文本提取，相同配置复用已加载模型
+                    simplified_converter = self._get_registered_converter(self._get_ocr_only_options())
                     
                     # 执行简化的转换
                     loop = asyncio.get_event_loop()
@@ -860,6 +1327,114 @@ class DoclingService:
             logger.error(f"文本提取失败: {e}")
             return {"success": False, "error": str(e)}
     
+    # ========== 转换器注册表 ==========
+    
+    def _get_ocr_only_options(self) -> Dict[str, Any]:
+        """OCR文本提取使用的有效流水线配置"""
+        return {
+            "do_ocr": True,
+            "do_table_structure": self.config.enable_table_structure,
+            "do_picture_classification": self.config.enable_picture_classification,
+            "do_picture_description": self.config.enable_picture_description,
+            "generate_page_images": self.config.generate_page_images,
+            "generate_picture_images": self.config.generate_picture_images,
+            "images_scale": self.config.images_scale,
+            "use_gpu": self.config.use_gpu,
+            "enable_ocr": self.config.enable_ocr,
+            "ocr_languages": self.config.ocr_languages,
+            "force_full_page_ocr": self.config.force_full_page_ocr,
+            "bitmap_area_threshold": self.config.bitmap_area_threshold,
+            "confidence_threshold": self.config.confidence_threshold,
+            "recog_network": self.config.recog_network
+        }
+    
+    def _build_ocr_only_converter(self, options: Dict[str, Any]) -> Any:
+        """按配置创建简化的OCR转换器"""
+        simplified_pdf_options = PdfPipelineOptions(
+            do_ocr=options["do_ocr"],  # 启用OCR
+            do_table_structure=options["do_table_structure"],
+            do_picture_classification=options["do_picture_classification"],
+            do_picture_description=options["do_picture_description"],
+            generate_page_images=options["generate_page_images"],
+            generate_picture_images=options["generate_picture_images"],
+            generate_parsed_pages=True,  # 必须为True，避免Pydantic校验错误
+            generate_table_images=False,  # 禁用表格图片
+            enable_remote_services=False,  # 保持离线
+            ocr_options=self._get_ocr_options(),  # 使用OCR选项
+            accelerator_options=AcceleratorOptions(device=AcceleratorDevice.CUDA if options["use_gpu"] else AcceleratorDevice.CPU),
+            images_scale=options["images_scale"]
+        )
+        
+        return DocumentConverter(
+            format_options={
+                InputFormat.PDF: PdfFormatOption(pipeline_options=simplified_pdf_options),
+                InputFormat.DOCX: WordFormatOption(),
+                InputFormat.PPTX: WordFormatOption(),
+                InputFormat.HTML: WordFormatOption(),
+                InputFormat.IMAGE: ImageFormatOption(),  # 移除pipeline_options避免API错误
+            }
+        )
+    
+    def _get_registered_converter(self, options: Dict[str, Any]) -> Any:
+        """按有效配置从注册表获取转换器，不存在时懒加载创建"""
+        key = compute_options_fingerprint(options)
+        with self._converter_registry_lock:
+            converter = self._converter_registry.get(key)
+            if converter is None:
+                converter = self._build_ocr_only_converter(options)
+                self._converter_registry[key] = converter
+                logger.info(f"转换器注册表新增: {key} (共 {len(self._converter_registry)} 个)")
+            return converter
+    
+    def clear_converter_registry(self) -> int:
+        """清空转换器注册表，返回清除数量"""
+        with self._converter_registry_lock:
+            count = len(self._converter_registry)
+            self._converter_registry.clear()
+        return count
+    
+    def reload_config(self) -> bool:
+        """重新读取Docling配置，按变化的配置项重建转换器、执行池或缓存，返回配置是否变化"""
+        old_config, new_config = self.config, DoclingConfig()
+        old_values, new_values = vars(old_config), vars(new_config)
+        changed_keys = {key for key in set(old_values) | set(new_values) if old_values.get(key) != new_values.get(key)}
+        
+        self.config = new_config
+        if not changed_keys:
+            logger.info("Docling配置未变化，保留现有转换器")
+            return False
+        logger.info(f"Docling配置已变化: {sorted(changed_keys)}")
+        
+        # 除执行引擎、分片、快速通道和缓存外的配置都会影响转换器（含GPU、视觉模型等）
+        rebuild_converter = bool(changed_keys - RUNTIME_ONLY_CONFIG_KEYS)
+        if rebuild_converter:
+            self._pipeline_fingerprint = compute_options_fingerprint(new_config.get_pipeline_fingerprint_options())
+            self._page_ocr_fingerprint = compute_options_fingerprint(new_config.get_page_ocr_fingerprint_options())
+            evicted = self.clear_converter_registry()
+            logger.info(f"淘汰 {evicted} 个注册转换器")
+            if DOCLING_AVAILABLE:
+                self.converter = self._create_converter()
+                self.is_initialized = self.converter is not None
+        
+        # 线程池按新的工作数重建（进行中的转换在旧线程池中继续完成）
+        if "max_workers" in changed_keys:
+            old_executor, self._executor = self._executor, ThreadPoolExecutor(max_workers=new_config.max_workers)
+            old_executor.shutdown(wait=False)
+        
+        # 进程池中的常驻转换器、工作进程数或执行引擎变化时关闭旧进程池，仍为进程池模式时重新启动
+        if rebuild_converter or changed_keys & {"executor_backend", "max_workers"}:
+            self._reset_process_pool()
+            if self.is_initialized and new_config.executor_backend == "process":
+                self._start_process_pool()
+        
+        # 缓存开关、目录或容量变化时重建缓存并按新上限淘汰
+        if changed_keys & CACHE_CONFIG_KEYS:
+            self._create_caches()
+            self.conversion_cache.evict_if_needed()
+            self.page_ocr_cache.evict_if_needed()
+        
+        return True
+    
     def _get_ocr_options(self):
         """获取OCR选项"""
         if not self.config.enable_ocr or not EASYOCR_AVAILABLE:
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Docling工作进程模块
+
+提供Docling转换器的构建函数，以及进程池执行引擎使用的工作进程入口。
+每个工作进程在启动时构建一次DocumentConverter并常驻复用，
+转换结果以JSON序列化的DoclingDocument返回主进程。
+
+注意：本模块不能导入docling_service，避免工作进程启动时重复创建全局服务实例。
+"""
+
+import os
+import logging
+import importlib.util
+from typing import Any, Dict, Optional, Tuple
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+# Docling相关导入
+try:
+    from docling.document_converter import (
+        DocumentConverter,
+        PdfFormatOption,
+        WordFormatOption,
+        ImageFormatOption
+    )
+    from docling.datamodel.base_models import InputFormat
+    from docling.datamodel.pipeline_options import (
+        PdfPipelineOptions,
+        EasyOcrOptions
+    )
+    from docling.datamodel.accelerator_options import AcceleratorOptions, AcceleratorDevice
+    DOCLING_AVAILABLE = True
+except ImportError as e:
+    DOCLING_AVAILABLE = False
+    logger.warning(f"Docling模块不可用: {e}")
+
+# EasyOCR检查（只检查是否安装，模型由Docling在创建转换器时加载）
+EASYOCR_AVAILABLE = importlib.util.find_spec("easyocr") is not None
+
+
+def create_document_converter(config) -> Optional[object]:
+    """创建Docling文档转换器 - 使用HF镜像配置并优化EasyOCR"""
+    # 确保HF镜像环境变量在转换器创建时也有效
+    import os
+    hf_endpoint = "https://hf-mirror.com"
+    os.environ["HF_ENDPOINT"] = hf_endpoint
+    os.environ["HUGGINGFACE_HUB_URL"] = hf_endpoint
+    
+    # 配置EasyOCR选项
+    ocr_options = None
+    accelerator_options = AcceleratorOptions(device=AcceleratorDevice.CPU)
+    
+    if config.enable_ocr and EASYOCR_AVAILABLE:
+        try:
+            # 优化EasyOCR选项 - 基于官方文档和GitHub讨论
+            ocr_options = EasyOcrOptions(
+                # 必需参数 - 语言支持
+                lang=config.ocr_languages,  # ['ch_sim', 'en'] 中英文支持
+                
+                # OCR控制参数 - 从数据库配置读取
+                force_full_page_ocr=config.force_full_page_ocr,  # 从数据库读取
+                bitmap_area_threshold=config.bitmap_area_threshold,  # 从数据库读取
+                confidence_threshold=config.confidence_threshold,  # 从数据库读取
+                
+                # 模型管理 - 关键优化
+                model_storage_directory=str(config.easyocr_models_path),  # 统一模型存储
+                download_enabled=True,  # 启用自动下载
+                
+                # 网络配置 - 从数据库读取
+                recog_network=config.recog_network,  # 从数据库读取
+                
+                # GPU配置 - 从数据库读取
+                use_gpu=config.use_gpu  # 从数据库读取
+            )
+            
+            # 设置加速器选项
+            if config.use_gpu:
+                accelerator_options = AcceleratorOptions(device=AcceleratorDevice.CUDA)
+            else:
+                accelerator_options = AcceleratorOptions(device=AcceleratorDevice.CPU)
+                
+            logger.info("EasyOCR优化配置完成:")
+            logger.info(f"  - 语言支持: {config.ocr_languages}")
+            logger.info(f"  - 计算设备: {accelerator_options.device.value}")
+            logger.info(f"  - 置信度阈值: {config.confidence_threshold}")
+            logger.info(f"  - 位图阈值: {config.bitmap_area_threshold}")
+            logger.info(f"  - 全页OCR: {config.force_full_page_ocr}")
+            logger.info(f"  - 识别网络: {config.recog_network}")
+            logger.info(f"  - 模型路径: {config.easyocr_models_path}")
+            logger.info(f"  - HF镜像: {hf_endpoint}")
+            
+        except Exception as e:
+            logger.error(f"EasyOCR配置失败: {e}")
+            ocr_options = None
+            accelerator_options = AcceleratorOptions(device=AcceleratorDevice.CPU)
+    
+    # 配置图片描述选项 - 使用用户配置的视觉模型
+    picture_description_options = None
+    if config.enable_picture_description and config.vision_api_key:
+        try:
+            from docling.datamodel.pipeline_options import PictureDescriptionApiOptions
+            
+            # 根据视觉提供商配置API选项
+            if config.vision_provider == "ollama":
+                # Ollama配置
+                picture_description_options = PictureDescriptionApiOptions(
+                    url=f"{config.ollama_vision_base_url}/chat/completions",
+                    headers={
+                        "Content-Type": "application/json"
+                    },
+                    params={
+                        "model": config.vision_model
+                    },
+                    prompt=config.picture_description_prompt,
+                    timeout=60,
+                    picture_area_threshold=0.05,
+                    scale=2.0
+                )
+                logger.info(f"Docling图片描述配置(Ollama): {config.vision_model}")
+            else:
+                # OpenAI兼容API配置 (OpenAI, Azure, Custom)
+                headers = {
+                    "Content-Type": "application/json",
+                    "Authorization": f"Bearer {config.vision_api_key}"
+                }
+                
+                # 根据不同提供商配置模型参数
+                if config.vision_provider == "azure":
+                    # Azure OpenAI特殊配置
+                    api_url = f"{config.vision_base_url}/openai/deployments/{config.vision_model}/chat/completions"
+                    headers["api-key"] = config.vision_api_key
+                    del headers["Authorization"]  # Azure使用api-key而不是Authorization
+                else:
+                    # OpenAI或Custom API
+                    api_url = f"{config.vision_base_url}/chat/completions"
+                
+                picture_description_options = PictureDescriptionApiOptions(
+                    url=api_url,
+                    headers=headers,
+                    params={
+                        "model": config.vision_model,
+                        "max_tokens": 1000,
+                        "temperature": 0.1
+                    },
+                    prompt=config.picture_description_prompt,
+                    timeout=60,
+                    picture_area_threshold=0.05,
+                    scale=2.0
+                )
+                logger.info(f"Docling图片描述配置({config.vision_provider}): {config.vision_model}")
+                logger.info(f"  - API URL: {api_url}")
+                logger.info(f"  - Prompt: {config.picture_description_prompt[:50]}...")
+            
+        except ImportError as e:
+            logger.warning(f"PictureDescriptionApiOptions不可用: {e}")
+            picture_description_options = None
+        except Exception as e:
+            logger.error(f"图片描述配置失败: {e}")
+            picture_description_options = None
+    
+    # 配置PDF处理选项
+    pdf_options_dict = {
+        "do_ocr": config.enable_ocr,
+        "do_table_structure": config.enable_table_structure,  # 从数据库读取
+        "do_picture_classification": config.enable_picture_classification,  # 从数据库读取
+        "do_picture_description": config.enable_picture_description,  # 从数据库读取
+        "ocr_options": ocr_options,
+        "accelerator_options": accelerator_options,  # 关键：设置加速器选项
+        "images_scale": config.images_scale,
+        "generate_page_images": config.generate_page_images,  # 从数据库读取
+        "generate_picture_images": config.generate_picture_images,  # 从数据库读取
+        "generate_parsed_pages": True,
+        "generate_table_images": False,
+        "enable_remote_services": (picture_description_options is not None)  # 如果配置了图片描述，则启用远程服务
+    }
+    
+    # 只有在配置了图片描述选项时才添加
+    if picture_description_options is not None:
+        pdf_options_dict["picture_description_options"] = picture_description_options
+        logger.info("✅ Docling图片描述选项已配置，将使用用户配置的视觉模型")
+    else:
+        logger.info("ℹ️  未配置Docling图片描述选项，将使用独立视觉分析")
+    
+    pdf_options = PdfPipelineOptions(**pdf_options_dict)
+    
+    # 配置图片处理选项 - 修复API兼容性问题
+    # 对于图片处理，我们不需要单独的PipelineOptions
+    
+    # 创建转换器
+    try:
+        converter = DocumentConverter(
+            format_options={
+                InputFormat.PDF: PdfFormatOption(pipeline_options=pdf_options),
+                InputFormat.DOCX: WordFormatOption(),
+                InputFormat.PPTX: WordFormatOption(),
+                InputFormat.HTML: WordFormatOption(),
+                InputFormat.MD: WordFormatOption(),
+                InputFormat.IMAGE: ImageFormatOption(),  # 简化图片配置，不传递pipeline_options
+            }
+        )
+        
+        logger.info("Docling转换器创建成功")
+        return converter
+        
+    except Exception as e:
+        logger.error(f"Docling转换器创建失败: {e}")
+        return None
+
+
+# ========== 进程池工作进程 ==========
+
+# 工作进程内常驻的转换器
+_worker_converter = None
+
+
+def init_worker(config_snapshot: Dict[str, Any]):
+    """工作进程初始化：构建一次转换器并常驻"""
+    global _worker_converter
+    from types import SimpleNamespace
+
+    logging.basicConfig(level=logging.INFO)
+    config = SimpleNamespace(**config_snapshot)
+    _worker_converter = create_document_converter(config)
+    logger.info(f"Docling工作进程就绪: pid={os.getpid()}, converter={'OK' if _worker_converter else 'FAILED'}")
+
+
+def worker_ping() -> int:
+    """预热探测，返回工作进程PID"""
+    if _worker_converter is None:
+        raise RuntimeError("Docling工作进程转换器未就绪")
+    return os.getpid()
+
+
+def convert_in_worker(file_path: str, page_range: Optional[Tuple[int, int]] = None) -> str:
+    """在工作进程中转换文档（可指定页码范围），返回序列化的DoclingDocument(JSON)"""
+    if _worker_converter is None:
+        raise RuntimeError("Docling工作进程转换器未就绪")
+    if page_range:
+        result = _worker_converter.convert(file_path, page_range=page_range)
+    else:
+        result = _worker_converter.convert(file_path)
+    return result.document.model_dump_json()
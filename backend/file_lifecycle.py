@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+文件生命周期后台调度模块
+
+按固定间隔归档过期的临时文件并执行blob垃圾回收，代替在列表/统计接口中逐次清理：
+过期记录按 (is_archived, expires_at) 索引和主键分批处理，每批单独提交；
+PostgreSQL 上通过会话级 advisory lock 保证多副本部署时同一时刻只有一个实例执行。
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+from blob_store import blob_store
+from settings_cache import settings_snapshot
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+# 生命周期任务的 advisory lock 键（同一数据库中唯一即可）
+LIFECYCLE_LOCK_KEY = 7301042215
+
+# 会过期的文件类型：上传临时文件（30天）、生成临时文件（180天）
+EXPIRING_CATEGORIES = ("temporary_upload", "temporary_generated")
+
+
+class FileLifecycleScheduler:
+    """过期文件归档与blob垃圾回收的周期任务"""
+
+    def __init__(self, enabled: bool = True, interval: float = 3600.0, batch_size: int = 500,
+                 gc_grace_seconds: float = 3600.0):
+        self.enabled = enabled
+        self.interval = interval
+        self.batch_size = batch_size
+        self.gc_grace_seconds = gc_grace_seconds
+
+        self._task: Optional[asyncio.Task] = None
+        self._run_lock = threading.Lock()
+        self._indexes_ready = False
+
+        # 指标
+        self._runs = 0
+        self._skipped = 0
+        self._errors = 0
+        self._archived_total = 0
+        self._last_run: Optional[Dict[str, Any]] = None
+
+    def load_settings(self):
+        """从系统设置快照读取配置（每轮执行前调用，修改设置无需重启）"""
+        def _number(key: str, default: float) -> float:
+            try:
+                return float(settings_snapshot.get(key) or default)
+            except ValueError:
+                return default
+
+        enabled = settings_snapshot.get("file_lifecycle_enabled")
+        self.enabled = True if enabled is None else enabled.lower() == "true"
+        self.interval = max(60.0, _number("file_lifecycle_interval_seconds", self.interval))
+        self.batch_size = max(1, int(_number("file_lifecycle_batch_size", self.batch_size)))
+        self.gc_grace_seconds = max(0.0, _number("blob_gc_grace_seconds", self.gc_grace_seconds))
+
+    # ---------- 后台任务 ----------
+
+    def start(self):
+        """启动周期任务（需在事件循环中调用）"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        # 启动后稍作延迟，避免与初始化数据争用数据库
+        await asyncio.sleep(60)
+        while True:
+            try:
+                self.load_settings()
+                if self.enabled:
+                    await self.run_once()
+            except Exception as e:
+                logger.error(f"文件生命周期任务执行失败: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self, run_gc: bool = True) -> Dict[str, Any]:
+        """在线程池中执行一轮归档和垃圾回收"""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self._run, run_gc)
+
+    # ---------- 执行 ----------
+
+    def _run(self, run_gc: bool = True) -> Dict[str, Any]:
+        from database import engine, SessionLocal
+
+        # 本进程内不重入
+        if not self._run_lock.acquire(blocking=False):
+            self._skipped += 1
+            return {"success": False, "skipped": True, "error": "生命周期任务正在执行"}
+
+        lock_conn = None
+        try:
+            lock_conn = self._acquire_db_lock(engine)
+            if lock_conn is False:
+                self._skipped += 1
+                logger.info("其他实例正在执行文件生命周期任务，本轮跳过")
+                return {"success": False, "skipped": True, "error": "其他实例正在执行生命周期任务"}
+
+            started = time.perf_counter()
+            started_at = datetime.now()
+            self._ensure_indexes(engine)
+
+            db = SessionLocal()
+            try:
+                archived, failed = self._archive_expired(db)
+                gc_result = blob_store.collect_garbage(db, grace_seconds=self.gc_grace_seconds) if run_gc else None
+            finally:
+                db.close()
+
+            result = {
+                "success": True,
+                "started_at": started_at.isoformat(),
+                "archived": archived,
+                "failed": failed,
+                "blob_gc": gc_result,
+                "seconds": round(time.perf_counter() - started, 3)
+            }
+            self._runs += 1
+            self._archived_total += archived
+            self._last_run = result
+            logger.info(f"文件生命周期任务完成: 归档 {archived} 个过期文件, 耗时 {result['seconds']}s")
+            return result
+
+        except Exception as e:
+            self._errors += 1
+            self._last_run = {"success": False, "started_at": datetime.now().isoformat(), "error": str(e)}
+            logger.error(f"文件生命周期任务失败: {e}")
+            return self._last_run
+        finally:
+            if lock_conn:
+                self._release_db_lock(lock_conn)
+            self._run_lock.release()
+
+    @staticmethod
+    def _acquire_db_lock(engine):
+        """PostgreSQL 上获取会话级 advisory lock，返回持有锁的连接；被占用时返回 False
+
+        SQLite 为单机文件数据库，进程内锁即可，返回 None。
+        """
+        if engine.dialect.name != "postgresql":
+            return None
+
+        from sqlalchemy import text
+
+        conn = engine.connect()
+        try:
+            locked = conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": LIFECYCLE_LOCK_KEY}).scalar()
+        except Exception:
+            conn.close()
+            raise
+        if not locked:
+            conn.close()
+            return False
+        return conn
+
+    @staticmethod
+    def _release_db_lock(conn):
+        from sqlalchemy import text
+
+        try:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": LIFECYCLE_LOCK_KEY})
+        except Exception as e:
+            logger.warning(f"释放生命周期任务锁失败: {e}")
+        finally:
+            conn.close()
+
+    def _ensure_indexes(self, engine):
+        """已有数据库不会由 create_all 补建索引，这里按需创建"""
+        if self._indexes_ready:
+            return
+        from models import ManagedFile
+
+        for index in ManagedFile.__table__.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except Exception as e:
+                logger.warning(f"创建索引 {index.name} 失败: {e}")
+        self._indexes_ready = True
+
+    def _archive_expired(self, db) -> tuple:
+        """按主键分批归档过期临时文件，每批提交一次；返回 (归档数, 失败数)"""
+        from models import ManagedFile
+
+        now = datetime.now()
+        archived = 0
+        failed = 0
+        last_id = 0
+
+        while True:
+            rows = db.query(ManagedFile.id, ManagedFile.storage_path, ManagedFile.processed_path).filter(
+                ManagedFile.is_archived == False,
+                ManagedFile.expires_at < now,
+                ManagedFile.file_category.in_(EXPIRING_CATEGORIES),
+                ManagedFile.id > last_id
+            ).order_by(ManagedFile.id).limit(self.batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            archived_ids = []
+            for file_id, storage_path, processed_path in rows:
+                try:
+                    # 释放物理文件（blob存储中的文件由垃圾回收删除）
+                    blob_store.discard_path(db, storage_path)
+                    if processed_path and os.path.exists(processed_path):
+                        os.remove(processed_path)
+                    archived_ids.append(file_id)
+                except Exception as e:
+                    failed += 1
+                    logger.error(f"清理文件失败 {file_id}: {e}")
+
+            if archived_ids:
+                db.query(ManagedFile).filter(ManagedFile.id.in_(archived_ids)).update(
+                    {ManagedFile.is_archived: True, ManagedFile.archived_at: datetime.now()},
+                    synchronize_session=False
+                )
+            db.commit()
+            archived += len(archived_ids)
+
+            if len(rows) < self.batch_size:
+                break
+
+        return archived, failed
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "interval": self.interval,
+            "batch_size": self.batch_size,
+            "gc_grace_seconds": self.gc_grace_seconds,
+            "running": self._run_lock.locked(),
+            "runs": self._runs,
+            "skipped": self._skipped,
+            "errors": self._errors,
+            "archived_total": self._archived_total,
+            "last_run": self._last_run,
+        }
+
+
+# 全局文件生命周期调度实例
+file_lifecycle = FileLifecycleScheduler()
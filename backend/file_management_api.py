@@ -1,24 +1,29 @@
 #!/usr/bin/env python3
 """文件管理API"""
 
-from fastapi import APIRouter, Depends, File, UploadFile, Form, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, File, UploadFile, Form, HTTPException, BackgroundTasks, Query
 from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import and_, or_, desc, asc, func
+from sqlalchemy import and_, or_, func, case
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 import os
 import hashlib
-import shutil
 import json
 import mimetypes
 import pytz
 
-from database import get_db
+from database import get_db, SessionLocal
 from models import ManagedFile, FileVersion, FileUsage, FileCategory, LawyerCertificate, LawyerCertificateFile, SystemSettings, AITask
 from schemas import *
 import logging
 from ai_service import create_ai_task, update_ai_task
+from ai_scheduler import set_background_priority
+from upload_ingest import UploadTooLargeError
+from blob_store import blob_store
+from file_lifecycle import file_lifecycle
+from search_index import file_search_index, extract_analysis_text
+from pagination import paginate_query, page_info, resolve_sort_column, InvalidCursorError
 
 # 设置日志
 logging.basicConfig(level=logging.INFO)
@@ -38,12 +43,47 @@ for path in [TEMP_FILES_PATH, PERMANENT_FILES_PATH, PROCESSED_FILES_PATH]:
 # ============ 辅助函数 ============
 
 def calculate_file_hash(file_path: str) -> str:
-    """计算文件MD5哈希值"""
-    hash_md5 = hashlib.md5()
+    """计算文件SHA-256哈希值（与blob存储键一致）"""
+    hash_sha256 = hashlib.sha256()
     with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_md5.update(chunk)
-    return hash_md5.hexdigest()
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hash_sha256.update(chunk)
+    return hash_sha256.hexdigest()
+
+def backfill_file_hashes(batch_size: int = 200) -> int:
+    """把旧记录的MD5哈希（32位）换算为SHA-256，使重复上传检测对已有文件生效
+
+    文件已不存在的记录保留原值。返回更新的记录数。
+    """
+    updated = 0
+    last_id = 0
+    db = SessionLocal()
+    try:
+        while True:
+            rows = db.query(ManagedFile).filter(
+                ManagedFile.id > last_id,
+                func.length(ManagedFile.file_hash) == 32
+            ).order_by(ManagedFile.id).limit(batch_size).all()
+            if not rows:
+                break
+            for managed_file in rows:
+                last_id = managed_file.id
+                if managed_file.storage_path and os.path.exists(managed_file.storage_path):
+                    try:
+                        managed_file.file_hash = calculate_file_hash(managed_file.storage_path)
+                        updated += 1
+                    except OSError as e:
+                        logger.warning(f"计算文件哈希失败 {managed_file.storage_path}: {e}")
+            db.commit()
+        if updated:
+            logger.info(f"已将 {updated} 条文件记录的MD5哈希换算为SHA-256")
+        return updated
+    except Exception as e:
+        db.rollback()
+        logger.error(f"换算文件哈希失败: {str(e)}")
+        return updated
+    finally:
+        db.close()
 
 def get_file_type_from_mime(mime_type: str) -> str:
     """根据MIME类型确定文件类型"""
@@ -62,50 +102,9 @@ def get_file_type_from_mime(mime_type: str) -> str:
     else:
         return 'other'
 
-def cleanup_expired_files(db: Session):
-    """清理过期的临时文件"""
-    try:
-        # 清理过期的上传临时文件（30天）
-        expired_upload_files = db.query(ManagedFile).filter(
-            and_(
-                ManagedFile.file_category == "temporary_upload",
-                ManagedFile.expires_at < datetime.now(),
-                ManagedFile.is_archived == False
-            )
-        ).all()
-        
-        # 清理过期的生成文件（180天）
-        expired_generated_files = db.query(ManagedFile).filter(
-            and_(
-                ManagedFile.file_category == "temporary_generated",
-                ManagedFile.expires_at < datetime.now(),
-                ManagedFile.is_archived == False
-            )
-        ).all()
-        
-        expired_files = expired_upload_files + expired_generated_files
-        
-        for file in expired_files:
-            try:
-                # 删除物理文件
-                if os.path.exists(file.storage_path):
-                    os.remove(file.storage_path)
-                if file.processed_path and os.path.exists(file.processed_path):
-                    os.remove(file.processed_path)
-                
-                # 标记为已归档
-                file.is_archived = True
-                file.archived_at = datetime.now()
-                
-            except Exception as e:
-                logger.error(f"清理文件失败 {file.id}: {e}")
-        
-        db.commit()
-        logger.info(f"清理了 {len(expired_files)} 个过期临时文件")
-        
-    except Exception as e:
-        logger.error(f"清理过期文件失败: {e}")
-        db.rollback()
+def _not_expired():
+    """未过期条件：已过期但尚未被后台任务归档的文件不再出现在列表和统计中"""
+    return or_(ManagedFile.expires_at == None, ManagedFile.expires_at >= datetime.now())
 
 # ============ API端点 ============
 
@@ -120,18 +119,10 @@ async def upload_temporary_file(
 ):
     """上传临时文件（单文件）"""
     try:
-        # 检查文件大小
-        content = await file.read()
-        file_size = len(content)
-        
-        if file_size > 100 * 1024 * 1024:  # 100MB限制
-            raise HTTPException(status_code=413, detail="文件大小超过限制(100MB)")
-        
-        # 重置文件指针
-        await file.seek(0)
-        
-        # 计算文件哈希
-        file_hash = hashlib.md5(content).hexdigest()
+        # 流式写入blob存储，同时计算大小和SHA-256（超过100MB立即中止）
+        blob = await blob_store.store_upload(db, file, max_size=100 * 1024 * 1024)
+        file_size = blob.file_size
+        file_hash = blob.sha256
         
         # 检查是否已存在相同文件
         existing_file = db.query(ManagedFile).filter(
@@ -142,6 +133,8 @@ async def upload_temporary_file(
         ).first()
         
         if existing_file:
+            # 复用已有记录，释放本次上传登记的引用
+            blob_store.release(db, blob.path)
             # 更新访问时间
             existing_file.access_count += 1
             existing_file.last_accessed = datetime.now()
@@ -154,17 +147,8 @@ async def upload_temporary_file(
                 "is_duplicate": True
             }
         
-        # 生成存储路径
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename_base = os.path.splitext(file.filename)[0]
-        file_ext = os.path.splitext(file.filename)[1]
-        storage_filename = f"temp_{timestamp}_{file_hash[:8]}{file_ext}"
-        storage_path = os.path.join(TEMP_FILES_PATH, storage_filename)
-        
-        # 保存文件
-        with open(storage_path, "wb") as f:
-            await file.seek(0)
-            shutil.copyfileobj(file.file, f)
+        # 存储路径即blob路径（相同内容只保存一份）
+        storage_path = blob.path
         
         # 获取MIME类型
         mime_type, _ = mimetypes.guess_type(file.filename)
@@ -198,6 +182,8 @@ async def upload_temporary_file(
         )
         
         db.add(db_file)
+        db.flush()
+        file_search_index.index_file(db, db_file)
         db.commit()
         db.refresh(db_file)
         
@@ -215,6 +201,8 @@ async def upload_temporary_file(
         
     except HTTPException:
         raise
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         logger.error(f"上传临时文件失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"上传失败: {str(e)}")
@@ -234,15 +222,10 @@ async def upload_permanent_file(
 ):
     """上传常驻文件"""
     try:
-        # 检查文件大小
-        content = await file.read()
-        file_size = len(content)
-        
-        if file_size > 200 * 1024 * 1024:  # 200MB限制
-            raise HTTPException(status_code=413, detail="文件大小超过限制(200MB)")
-        
-        # 计算文件哈希
-        file_hash = hashlib.md5(content).hexdigest()
+        # 流式写入blob存储，同时计算大小和SHA-256（超过200MB立即中止）
+        blob = await blob_store.store_upload(db, file, max_size=200 * 1024 * 1024)
+        file_size = blob.file_size
+        file_hash = blob.sha256
         
         # 检查是否已存在相同文件
         existing_file = db.query(ManagedFile).filter(
@@ -254,6 +237,8 @@ async def upload_permanent_file(
         ).first()
         
         if existing_file:
+            # 复用已有记录，释放本次上传登记的引用
+            blob_store.release(db, blob.path)
             # 更新访问时间和计数，返回现有文件信息而不是抛出错误
             existing_file.access_count += 1
             existing_file.last_accessed = datetime.now()
@@ -270,15 +255,8 @@ async def upload_permanent_file(
                 "is_duplicate": True
             }
         
-        # 生成存储路径
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        file_ext = os.path.splitext(file.filename)[1]
-        storage_filename = f"perm_{timestamp}_{file_hash[:8]}{file_ext}"
-        storage_path = os.path.join(PERMANENT_FILES_PATH, storage_filename)
-        
-        # 保存文件
-        with open(storage_path, "wb") as f:
-            f.write(content)
+        # 存储路径即blob路径（相同内容只保存一份）
+        storage_path = blob.path
         
         # 获取MIME类型
         mime_type, _ = mimetypes.guess_type(file.filename)
@@ -317,6 +295,8 @@ async def upload_permanent_file(
         )
         
         db.add(db_file)
+        db.flush()
+        file_search_index.index_file(db, db_file)
         db.commit()
         db.refresh(db_file)
         
@@ -358,6 +338,8 @@ async def upload_permanent_file(
         
     except HTTPException:
         raise
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         logger.error(f"上传常驻文件失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"上传失败: {str(e)}")
@@ -386,19 +368,10 @@ async def upload_temporary_files_batch(
         
         for i, file in enumerate(files):
             try:
-                # 检查文件大小
-                content = await file.read()
-                file_size = len(content)
-                
-                if file_size > 100 * 1024 * 1024:  # 100MB限制
-                    failed_files.append({
-                        "filename": file.filename,
-                        "error": "文件大小超过限制(100MB)"
-                    })
-                    continue
-                
-                # 计算文件哈希
-                file_hash = hashlib.md5(content).hexdigest()
+                # 流式写入blob存储，同时计算大小和SHA-256（超过100MB立即中止）
+                blob = await blob_store.store_upload(db, file, max_size=100 * 1024 * 1024)
+                file_size = blob.file_size
+                file_hash = blob.sha256
                 
                 # 检查是否已存在相同文件
                 existing_file = db.query(ManagedFile).filter(
@@ -409,6 +382,8 @@ async def upload_temporary_files_batch(
                 ).first()
                 
                 if existing_file:
+                    # 复用已有记录，释放本次上传登记的引用
+                    blob_store.release(db, blob.path)
                     # 更新访问时间
                     existing_file.access_count += 1
                     existing_file.last_accessed = datetime.now()
@@ -421,15 +396,8 @@ async def upload_temporary_files_batch(
                     })
                     continue
                 
-                # 生成存储路径
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                file_ext = os.path.splitext(file.filename)[1]
-                storage_filename = f"temp_{timestamp}_{i}_{file_hash[:8]}{file_ext}"
-                storage_path = os.path.join(TEMP_FILES_PATH, storage_filename)
-                
-                # 保存文件
-                with open(storage_path, "wb") as f:
-                    f.write(content)
+                # 存储路径即blob路径（相同内容只保存一份）
+                storage_path = blob.path
                 
                 # 获取MIME类型
                 mime_type, _ = mimetypes.guess_type(file.filename)
@@ -456,6 +424,7 @@ async def upload_temporary_files_batch(
                 
                 db.add(db_file)
                 db.flush()  # 获取ID但不提交
+                file_search_index.index_file(db, db_file)
                 
                 uploaded_files.append({
                     "file_id": db_file.id,
@@ -467,6 +436,12 @@ async def upload_temporary_files_batch(
                 
                 logger.info(f"批量临时文件上传成功: {file.filename}")
                 
+            except UploadTooLargeError as size_err:
+                failed_files.append({
+                    "filename": file.filename,
+                    "error": str(size_err)
+                })
+                continue
             except Exception as file_err:
                 failed_files.append({
                     "filename": file.filename,
@@ -530,19 +505,10 @@ async def upload_permanent_files_batch(
         
         for i, file in enumerate(files):
             try:
-                # 检查文件大小
-                content = await file.read()
-                file_size = len(content)
-                
-                if file_size > 200 * 1024 * 1024:  # 200MB限制
-                    failed_files.append({
-                        "filename": file.filename,
-                        "error": "文件大小超过限制(200MB)"
-                    })
-                    continue
-                
-                # 计算文件哈希
-                file_hash = hashlib.md5(content).hexdigest()
+                # 流式写入blob存储，同时计算大小和SHA-256（超过200MB立即中止）
+                blob = await blob_store.store_upload(db, file, max_size=200 * 1024 * 1024)
+                file_size = blob.file_size
+                file_hash = blob.sha256
                 
                 # 检查是否已存在相同文件
                 existing_file = db.query(ManagedFile).filter(
@@ -554,6 +520,8 @@ async def upload_permanent_files_batch(
                 ).first()
                 
                 if existing_file:
+                    # 复用已有记录，释放本次上传登记的引用
+                    blob_store.release(db, blob.path)
                     existing_file.access_count += 1
                     existing_file.last_accessed = datetime.now()
                     uploaded_files.append({
@@ -569,15 +537,8 @@ async def upload_permanent_files_batch(
                 # 确定显示名称
                 display_name = display_names_list[i] if i < len(display_names_list) else file.filename
                 
-                # 生成存储路径
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                file_ext = os.path.splitext(file.filename)[1]
-                storage_filename = f"perm_{timestamp}_{i}_{file_hash[:8]}{file_ext}"
-                storage_path = os.path.join(PERMANENT_FILES_PATH, storage_filename)
-                
-                # 保存文件
-                with open(storage_path, "wb") as f:
-                    f.write(content)
+                # 存储路径即blob路径（相同内容只保存一份）
+                storage_path = blob.path
                 
                 # 获取MIME类型
                 mime_type, _ = mimetypes.guess_type(file.filename)
@@ -608,6 +569,7 @@ async def upload_permanent_files_batch(
                 
                 db.add(db_file)
                 db.flush()  # 获取ID但不提交
+                file_search_index.index_file(db, db_file)
                 
                 # 创建AI分析任务
                 task_id = None
@@ -631,6 +593,12 @@ async def upload_permanent_files_batch(
                 
                 logger.info(f"批量常驻文件上传成功: {display_name}")
                 
+            except UploadTooLargeError as size_err:
+                failed_files.append({
+                    "filename": file.filename,
+                    "error": str(size_err)
+                })
+                continue
             except Exception as file_err:
                 failed_files.append({
                     "filename": file.filename,
@@ -684,23 +652,21 @@ async def list_files(
     tags: Optional[str] = None,
     page: int = 1,
     page_size: int = 20,
-    sort_by: str = "created_at",
+    sort_by: Optional[str] = None,  # 默认按创建时间；全文检索时默认按相关度（relevance）
     sort_order: str = "desc",
     include_archived: bool = False,
+    cursor: Optional[str] = None,  # 游标分页：传入上一页返回的 next_cursor（忽略 page）
+    include_total: Optional[bool] = None,  # 是否返回总数：页码分页默认返回，游标分页传 true 时返回缓存的总数
     db: Session = Depends(get_db)
 ):
-    """获取文件列表"""
+    """获取文件列表（支持页码分页和游标分页）"""
     try:
-        # 清理过期文件
-        if file_category in ["temporary_upload", "temporary_generated", "temporary"] or file_category is None:
-            cleanup_expired_files(db)
-        
-        # 构建查询
+        # 构建查询（过期文件由后台生命周期任务归档，这里只读）
         query = db.query(ManagedFile)
         
-        # 基础过滤
+        # 基础过滤：已过期但尚未归档的文件视同已归档
         if not include_archived:
-            query = query.filter(ManagedFile.is_archived == False)
+            query = query.filter(ManagedFile.is_archived == False, _not_expired())
         
         if file_category:
             if file_category == "temporary":
@@ -718,8 +684,11 @@ async def list_files(
         if category:
             query = query.filter(ManagedFile.category == category)
         
-        # 搜索
-        if search:
+        # 搜索：优先使用全文索引（含文档正文，按相关度排序），索引不可用时退回LIKE查询
+        search_ranking = file_search_index.search(db, search) if search else None
+        if search_ranking is not None:
+            query = query.filter(ManagedFile.id.in_([file_id for file_id, _ in search_ranking]))
+        elif search:
             search_filter = or_(
                 ManagedFile.display_name.ilike(f"%{search}%"),
                 ManagedFile.original_filename.ilike(f"%{search}%"),
@@ -735,16 +704,22 @@ async def list_files(
                 query = query.filter(ManagedFile.tags.contains([tag]))
         
         # 排序
-        sort_column = getattr(ManagedFile, sort_by, ManagedFile.created_at)
-        if sort_order.lower() == "desc":
-            query = query.order_by(desc(sort_column))
+        if search_ranking is not None and sort_by in (None, "relevance"):
+            ranks = {file_id: position for position, (file_id, _) in enumerate(search_ranking)}
+            sort_expr = case(ranks, value=ManagedFile.id, else_=len(ranks)) if ranks else ManagedFile.id
+            sort_key = "relevance"
+            descending = False
+            value_of = lambda item: ranks.get(item.id, len(ranks))
         else:
-            query = query.order_by(asc(sort_column))
-        
-        # 分页
-        total = query.count()
-        offset = (page - 1) * page_size
-        files = query.offset(offset).limit(page_size).all()
+            sort_expr, sort_name = resolve_sort_column(ManagedFile, sort_by)
+            descending = sort_order.lower() == "desc"
+            sort_key = f"{sort_name}:{'desc' if descending else 'asc'}"
+            value_of = lambda item: getattr(item, sort_name)
+        
+        # 分页（游标模式不使用OFFSET）
+        files, next_cursor = paginate_query(
+            query, sort_expr, ManagedFile.id, descending, sort_key, value_of, page_size, cursor=cursor, page=page
+        )
         
         # 格式化结果
         result_files = []
@@ -779,14 +754,11 @@ async def list_files(
         return {
             "success": True,
             "files": result_files,
-            "pagination": {
-                "total": total,
-                "page": page,
-                "page_size": page_size,
-                "total_pages": (total + page_size - 1) // page_size
-            }
+            "pagination": page_info(page, page_size, next_cursor, cursor, query, include_total)
         }
         
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"获取文件列表失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"获取文件列表失败: {str(e)}")
@@ -797,11 +769,8 @@ async def list_files(
 async def get_file_stats(db: Session = Depends(get_db)):
     """获取文件统计信息"""
     try:
-        # 清理过期文件
-        cleanup_expired_files(db)
-        
-        # 统计信息
-        total_files = db.query(ManagedFile).filter(ManagedFile.is_archived == False).count()
+        # 统计信息（过期文件由后台生命周期任务归档，这里只读）
+        total_files = db.query(ManagedFile).filter(ManagedFile.is_archived == False, _not_expired()).count()
         temp_files = db.query(ManagedFile).filter(
             and_(
                 or_(
@@ -809,15 +778,15 @@ async def get_file_stats(db: Session = Depends(get_db)):
                     ManagedFile.file_category == "temporary_upload",
                     ManagedFile.file_category == "temporary_generated"
                 ),
-                ManagedFile.is_archived == False
+                ManagedFile.is_archived == False, _not_expired()
             )
         ).count()
         permanent_files = db.query(ManagedFile).filter(
-            and_(ManagedFile.file_category == "permanent", ManagedFile.is_archived == False)
+            and_(ManagedFile.file_category == "permanent", ManagedFile.is_archived == False, _not_expired())
         ).count()
         
         # 存储大小统计
-        total_size = db.query(func.sum(ManagedFile.file_size)).filter(ManagedFile.is_archived == False).scalar() or 0
+        total_size = db.query(func.sum(ManagedFile.file_size)).filter(ManagedFile.is_archived == False, _not_expired()).scalar() or 0
         temp_size = db.query(func.sum(ManagedFile.file_size)).filter(
             and_(
                 or_(
@@ -825,11 +794,11 @@ async def get_file_stats(db: Session = Depends(get_db)):
                     ManagedFile.file_category == "temporary_upload",
                     ManagedFile.file_category == "temporary_generated"
                 ),
-                ManagedFile.is_archived == False
+                ManagedFile.is_archived == False, _not_expired()
             )
         ).scalar() or 0
         permanent_size = db.query(func.sum(ManagedFile.file_size)).filter(
-            and_(ManagedFile.file_category == "permanent", ManagedFile.is_archived == False)
+            and_(ManagedFile.file_category == "permanent", ManagedFile.is_archived == False, _not_expired())
         ).scalar() or 0
         
         # 文件类型统计
@@ -837,7 +806,7 @@ async def get_file_stats(db: Session = Depends(get_db)):
             ManagedFile.file_type,
             func.count(ManagedFile.id).label('count'),
             func.sum(ManagedFile.file_size).label('size')
-        ).filter(ManagedFile.is_archived == False).group_by(ManagedFile.file_type).all()
+        ).filter(ManagedFile.is_archived == False, _not_expired()).group_by(ManagedFile.file_type).all()
         
         return {
             "success": True,
@@ -863,6 +832,62 @@ async def get_file_stats(db: Session = Depends(get_db)):
         logger.error(f"获取统计信息失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"获取统计信息失败: {str(e)}")
 
+@router.get("/blobs/stats")
+async def get_blob_stats(db: Session = Depends(get_db)):
+    """获取blob存储统计（去重次数、节省空间、上次垃圾回收结果）"""
+    try:
+        return {"success": True, "stats": blob_store.get_stats(db)}
+    except Exception as e:
+        logger.error(f"获取blob存储统计失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"获取blob存储统计失败: {str(e)}")
+
+@router.post("/blobs/gc")
+async def collect_blob_garbage(
+    grace_seconds: int = Query(3600, ge=0, description="无引用blob保留的宽限期（秒）"),
+    dry_run: bool = Query(False, description="只统计不删除"),
+    db: Session = Depends(get_db)
+):
+    """按实际引用修正blob引用计数并删除无引用的blob"""
+    try:
+        return blob_store.collect_garbage(db, grace_seconds=grace_seconds, dry_run=dry_run)
+    except Exception as e:
+        logger.error(f"blob垃圾回收失败: {str(e)}")
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"blob垃圾回收失败: {str(e)}")
+
+@router.get("/lifecycle/stats")
+async def get_lifecycle_stats():
+    """获取文件生命周期任务统计（执行次数、归档数量、上次执行结果）"""
+    return {"success": True, "stats": file_lifecycle.get_stats()}
+
+@router.post("/lifecycle/run")
+async def run_lifecycle_now(run_gc: bool = Query(True, description="是否同时执行blob垃圾回收")):
+    """立即执行一轮过期文件归档（其他实例正在执行时跳过）"""
+    try:
+        return await file_lifecycle.run_once(run_gc=run_gc)
+    except Exception as e:
+        logger.error(f"执行文件生命周期任务失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"执行文件生命周期任务失败: {str(e)}")
+
+@router.post("/search-index/rebuild")
+async def rebuild_search_index():
+    """重建文件全文索引的名称和元数据（保留已索引的文档正文）"""
+    try:
+        import asyncio
+        result = await asyncio.get_event_loop().run_in_executor(None, _rebuild_search_index)
+        return {**result, "stats": file_search_index.get_stats()}
+    except Exception as e:
+        logger.error(f"重建全文索引失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"重建全文索引失败: {str(e)}")
+
+def _rebuild_search_index() -> Dict[str, Any]:
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        return file_search_index.rebuild(db)
+    finally:
+        db.close()
+
 @router.get("/categories/list")
 async def list_categories(db: Session = Depends(get_db)):
     """获取分类列表"""
@@ -1096,6 +1121,7 @@ async def update_file_info(
         
         # 如果启用AI重新分析
         ai_result = None
+        extracted_text = None
         if enable_ai_reanalysis and file.file_category == "permanent":
             try:
                 from ai_service import ai_service
@@ -1105,6 +1131,7 @@ async def update_file_info(
                 )
                 if analysis_result.get("success"):
                     ai_result = analysis_result["results"]["final_classification"]
+                    extracted_text = extract_analysis_text(analysis_result)
                     
                     # 如果用户没有手动设置分类，使用AI分析结果
                     if category is None and ai_result.get("category"):
@@ -1120,6 +1147,7 @@ async def update_file_info(
             except Exception as ai_err:
                 logger.warning(f"AI重新分析失败: {ai_err}")
         
+        file_search_index.index_file(db, file, content=extracted_text)
         db.commit()
         
         return {
@@ -1153,14 +1181,14 @@ async def delete_file(file_id: int, force: bool = False, db: Session = Depends(g
         if force:
             # 物理删除
             try:
-                if os.path.exists(file.storage_path):
-                    os.remove(file.storage_path)
+                blob_store.discard_path(db, file.storage_path)
                 if file.processed_path and os.path.exists(file.processed_path):
                     os.remove(file.processed_path)
             except Exception as e:
                 logger.warning(f"删除物理文件失败: {e}")
             
             # 删除数据库记录
+            file_search_index.remove_file(db, file.id)
             db.delete(file)
         else:
             # 软删除（归档）
@@ -1299,6 +1327,7 @@ async def analyze_document_ai(
             file_record.processing_result["ai_analysis"] = analysis_result
             file_record.processing_result["classification"] = classification
             
+            file_search_index.index_file(db, file_record, content=extract_analysis_text(analysis_result))
             db.commit()
             logger.info(f"文件记录已更新: 分类={new_category}, 标签={file_record.tags}")
         
@@ -1419,6 +1448,7 @@ async def handle_lawyer_certificate_creation(file_record, classification, analys
         if business_field:
             lawyer_cert.business_field_tags = [business_field]
         
+        blob_store.acquire(db, file_record.storage_path)  # 新记录引用同一文件
         db.add(lawyer_cert)
         db.flush()  # 获取ID
         
@@ -1431,6 +1461,7 @@ async def handle_lawyer_certificate_creation(file_record, classification, analys
             file_size=file_record.file_size
         )
         
+        blob_store.acquire(db, file_record.storage_path)  # 新记录引用同一文件
         db.add(cert_file)
         db.commit()
         
@@ -1532,6 +1563,7 @@ async def create_lawyer_certificate_from_file(
             is_manual_input=True  # 从文件管理手动创建
         )
         
+        blob_store.acquire(db, file_record.storage_path)  # 新记录引用同一文件
         db.add(lawyer_cert)
         db.flush()  # 获取ID
         
@@ -1544,6 +1576,7 @@ async def create_lawyer_certificate_from_file(
             file_size=file_record.file_size
         )
         
+        blob_store.acquire(db, file_record.storage_path)  # 新记录引用同一文件
         db.add(cert_file)
         
         # 更新文件记录的分类
@@ -1662,6 +1695,7 @@ async def reanalyze_permanent_file(
     file_id: int,
     enable_vision_analysis: bool = Form(True),
     force_reclassify: bool = Form(True),
+    use_cache: bool = Form(True),  # 为False时跳过LLM响应缓存
     db: Session = Depends(get_db)
 ):
     """重新分析常驻文件（智能分类 + 专业记录创建）"""
@@ -1685,7 +1719,8 @@ async def reanalyze_permanent_file(
                 file_id,
                 enable_vision_analysis,
                 task_id,
-                user_category=None  # 让AI重新智能分类
+                user_category=None,  # 让AI重新智能分类
+                use_cache=use_cache
             )
         )
         logger.info(f"🤖 已启动重新分析任务，文件ID={file_id}")
@@ -1697,7 +1732,8 @@ async def reanalyze_permanent_file(
             "file_id": file_id,
             "analysis_options": {
                 "vision_enabled": enable_vision_analysis,
-                "force_reclassify": force_reclassify
+                "force_reclassify": force_reclassify,
+                "use_cache": use_cache
             }
         }
         
@@ -1707,8 +1743,10 @@ async def reanalyze_permanent_file(
         logger.error(f"重新分析文件失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"重新分析失败: {str(e)}")
 
-async def analyze_permanent_file_in_background(file_id: int, enable_vision_analysis: bool, task_id: int = None, user_category: str = None):
-    """后台异步分析常驻文件"""
+async def analyze_permanent_file_in_background(file_id: int, enable_vision_analysis: bool, task_id: int = None, user_category: str = None, use_cache: bool = True, requeue_attempt: int = 0):
+    """后台异步分析常驻文件（AI提供商暂时不可用时自动重新排队）"""
+    # 后台分析的AI请求让位于交互请求
+    set_background_priority()
     try:
         from database import get_db
         from ai_service import ai_service
@@ -1764,14 +1802,38 @@ async def analyze_permanent_file_in_background(file_id: int, enable_vision_analy
                 analysis_result = await ai_service.smart_document_analysis(
                     file_record.storage_path, 
                     enable_vision=True,
-                    enable_ocr=True
+                    enable_ocr=True,
+                    use_cache=use_cache
                 )
             else:
                 analysis_result = await ai_service.smart_document_analysis(
                     file_record.storage_path,
-                    enable_ocr=True
+                    enable_ocr=True,
+                    use_cache=use_cache
                 )
             
+            # AI提供商限流、故障或熔断导致失败时，稍后重新分析而不是直接标记失败
+            if analysis_result.get("retryable_failure") or analysis_result.get("retryable"):
+                retry_delay = ai_service.background_retries.requeue(
+                    f"permanent_file:{file_id}",
+                    lambda: analyze_permanent_file_in_background(
+                        file_id, enable_vision_analysis, task_id, user_category, use_cache, requeue_attempt + 1
+                    ),
+                    requeue_attempt,
+                    retry_after=analysis_result.get("retry_after")
+                )
+                if retry_delay is not None:
+                    file_record.processing_status = "retry_pending"
+                    if task_id:
+                        update_ai_task(db, task_id, "retrying", result={
+                            "error": analysis_result.get("error", "AI服务暂时不可用"),
+                            "requeue_attempt": requeue_attempt + 1,
+                            "retry_in_seconds": round(retry_delay)
+                        })
+                    db.commit()
+                    logger.warning(f"⏳ AI服务暂时不可用，文件 {file_id} 将在 {retry_delay:.0f}s 后重新分析")
+                    return
+            
             if analysis_result.get("success"):
                 # 提取分类信息
                 if enable_vision_analysis:
@@ -1828,6 +1890,9 @@ async def analyze_permanent_file_in_background(file_id: int, enable_vision_analy
                 file_record.processing_status = "completed"
                 file_record.is_processed = True
                 
+                # 更新全文索引（分类、标签和提取的正文）
+                file_search_index.index_file(db, file_record, content=extract_analysis_text(analysis_result))
+                
                 # 更新AI任务状态为成功
                 if task_id:
                     update_ai_task(db, task_id, "success", result={
@@ -2044,6 +2109,7 @@ async def create_lawyer_certificate_from_analysis(db, file_record, ai_classifica
                 file_name=file_record.original_filename,
                 file_size=file_record.file_size
             )
+            blob_store.acquire(db, file_record.storage_path)  # 新记录引用同一文件
             db.add(cert_file)
             
             logger.info(f"👥 律师证已存在，添加文件关联: {existing.lawyer_name}")
@@ -2084,6 +2150,7 @@ async def create_lawyer_certificate_from_analysis(db, file_record, ai_classifica
                 file_size=file_record.file_size
             )
             
+            blob_store.acquire(db, file_record.storage_path)  # 新记录引用同一文件
             db.add(cert_file)
             
             logger.info(f"✅ 自动创建律师证记录: {cert.lawyer_name} ({cert.certificate_number})")
@@ -2131,6 +2198,7 @@ async def create_performance_from_analysis(db, file_record, ai_classification, a
             extracted_text=analysis_result.get('text_extraction_result', {}).get('text', '')
         )
         
+        blob_store.acquire(db, file_record.storage_path)  # 新记录引用同一文件
         db.add(performance)
         db.flush()  # 获取ID
         
@@ -2143,6 +2211,7 @@ async def create_performance_from_analysis(db, file_record, ai_classification, a
             file_size=file_record.file_size
         )
         
+        blob_store.acquire(db, file_record.storage_path)  # 新记录引用同一文件
         db.add(perf_file)
         
         logger.info(f"✅ 自动创建业绩记录: {performance.project_name}")
@@ -2187,6 +2256,7 @@ async def create_award_from_analysis(db, file_record, ai_classification, analysi
             confidence_score=ai_classification.get("confidence", 0.0)
         )
         
+        blob_store.acquire(db, file_record.storage_path)  # 新记录引用同一文件
         db.add(award)
         db.flush()  # 获取ID
         
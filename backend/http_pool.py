@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+共享HTTP连接池模块
+
+为每个AI服务提供商（以及网页读取工具）维护一个长期存在的 aiohttp.ClientSession，
+复用TCP/TLS连接（keep-alive），避免每次调用都重新握手。
+连接池在应用启动时创建、关闭时释放，由 AIService 负责配置和生命周期管理。
+"""
+
+import asyncio
+import logging
+from typing import Dict, Any, Optional, Iterable
+
+import aiohttp
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+
+class HttpClientPool:
+    """按提供商划分的共享HTTP连接池"""
+
+    def __init__(self, limit: int = 100, limit_per_host: int = 20, keepalive_timeout: float = 60.0):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._lock: Optional[asyncio.Lock] = None
+        self._requests: Dict[str, int] = {}
+
+    def configure(self, limit: int, limit_per_host: int, keepalive_timeout: float):
+        """更新连接限制（对之后新建的会话生效）"""
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=300
+        )
+        return aiohttp.ClientSession(connector=connector)
+
+    async def start(self, names: Iterable[str]):
+        """应用启动时预先创建各提供商的会话"""
+        for name in names:
+            await self.get_session(name)
+        logger.info(f"HTTP连接池已启动: {sorted(self._sessions)} "
+                    f"(总连接 {self.limit}, 单主机 {self.limit_per_host}, keep-alive {self.keepalive_timeout}s)")
+
+    async def get_session(self, name: str) -> aiohttp.ClientSession:
+        """获取指定提供商的共享会话（不存在或已关闭时创建）"""
+        session = self._sessions.get(name)
+        if session is not None and not session.closed:
+            self._requests[name] = self._requests.get(name, 0) + 1
+            return session
+
+        # 锁需要在事件循环内创建
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            session = self._sessions.get(name)
+            if session is None or session.closed:
+                session = self._create_session()
+                self._sessions[name] = session
+                logger.info(f"HTTP连接池创建会话: {name}")
+        self._requests[name] = self._requests.get(name, 0) + 1
+        return session
+
+    async def close_session(self, name: str):
+        """关闭指定提供商的会话（如提供商配置变化）"""
+        session = self._sessions.pop(name, None)
+        if session is not None and not session.closed:
+            await session.close()
+
+    async def close(self):
+        """关闭所有会话"""
+        sessions, self._sessions = self._sessions, {}
+        for name, session in sessions.items():
+            try:
+                if not session.closed:
+                    await session.close()
+            except Exception as e:
+                logger.warning(f"关闭HTTP会话失败 {name}: {e}")
+        if sessions:
+            logger.info(f"HTTP连接池已关闭 {len(sessions)} 个会话")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取连接池状态"""
+        sessions = {}
+        for name, session in self._sessions.items():
+            connector = session.connector
+            sessions[name] = {
+                "closed": session.closed,
+                "requests": self._requests.get(name, 0),
+                "acquired_connections": len(getattr(connector, "_acquired", ())) if connector else 0,
+            }
+        return {
+            "limit": self.limit,
+            "limit_per_host": self.limit_per_host,
+            "keepalive_timeout": self.keepalive_timeout,
+            "sessions": sessions,
+        }
+
+
+# 全局实例（由 AIService 配置和管理生命周期）
+http_client_pool = HttpClientPool()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+多模式关键词匹配模块
+
+将各分类的关键词编译为一个Aho-Corasick自动机（忽略大小写），
+一次扫描文本即可得到每个分类命中的关键词及其位置，
+替代“每个分类 × 每个关键词 × 全文”的逐个子串查找。
+"""
+
+import logging
+from collections import deque
+from typing import Dict, List, Iterable, Tuple
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+
+class KeywordMatch:
+    """单个分类的匹配结果"""
+
+    __slots__ = ("positions",)
+
+    def __init__(self):
+        # 关键词（小写） -> 起始位置列表
+        self.positions: Dict[str, List[int]] = {}
+
+    @property
+    def count(self) -> int:
+        """命中总次数"""
+        return sum(len(positions) for positions in self.positions.values())
+
+    def has(self, keyword: str) -> bool:
+        return keyword.lower() in self.positions
+
+    def matched(self, keywords: Iterable[str]) -> List[str]:
+        """按配置顺序返回命中的关键词（保留原始写法）"""
+        return [keyword for keyword in keywords if keyword and keyword.lower() in self.positions]
+
+    def to_dict(self) -> Dict[str, object]:
+        return {"count": self.count, "positions": self.positions}
+
+
+class KeywordMatcher:
+    """Aho-Corasick多模式匹配器：分类 -> 关键词列表"""
+
+    def __init__(self, groups: Dict[str, Iterable[str]]):
+        # 状态转移表、失败指针、输出（关键词, 所属分类列表）
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[str, Tuple[str, ...]]]] = [[]]
+        self.groups = list(groups.keys())
+        self.pattern_count = 0
+
+        keyword_groups: Dict[str, List[str]] = {}
+        for group, keywords in groups.items():
+            for keyword in keywords or []:
+                keyword = (keyword or "").strip().lower()
+                if keyword and group not in keyword_groups.setdefault(keyword, []):
+                    keyword_groups[keyword].append(group)
+
+        for keyword, owners in keyword_groups.items():
+            self._insert(keyword, tuple(owners))
+        self.pattern_count = len(keyword_groups)
+        self._build_failure_links()
+
+    def _insert(self, keyword: str, owners: Tuple[str, ...]):
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((keyword, owners))
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                # 合并后缀状态的输出，扫描时无需沿失败链回溯
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def scan(self, text: str) -> Dict[str, KeywordMatch]:
+        """单次扫描文本，返回 {分类: KeywordMatch}（所有分类都有条目）"""
+        results = {group: KeywordMatch() for group in self.groups}
+        if not text or self.pattern_count == 0:
+            return results
+
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for index, char in enumerate(text.lower()):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for keyword, owners in output[state]:
+                start = index - len(keyword) + 1
+                for group in owners:
+                    results[group].positions.setdefault(keyword, []).append(start)
+        return results
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, Form, UploadFile, File
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, desc, asc, func
+from sqlalchemy import and_, or_, desc, func
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 import json
@@ -11,6 +11,10 @@ from database import get_db, Base
 from models import LawyerCertificate, LawyerCertificateFile, ManagedFile, SystemSettings, AITask
 from schemas import LawyerCertificateResponse, LawyerCertificateCreate, LawyerCertificateUpdate
 from ai_service import create_ai_task, update_ai_task
+from ai_scheduler import set_background_priority
+from upload_ingest import UploadTooLargeError
+from blob_store import blob_store
+from pagination import paginate_query, page_info, resolve_sort_column, InvalidCursorError
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/lawyer-certificates", tags=["律师证管理"])
@@ -27,9 +31,11 @@ async def list_lawyer_certificates(
     page_size: int = Query(20, ge=1, le=100, description="每页大小"),
     sort_by: str = Query("created_at", description="排序字段"),
     sort_order: str = Query("desc", description="排序方向（asc/desc）"),
+    cursor: Optional[str] = Query(None, description="游标分页：上一页返回的 next_cursor（忽略页码）"),
+    include_total: Optional[bool] = Query(None, description="是否返回总数（页码分页默认返回，游标分页返回缓存的总数）"),
     db: Session = Depends(get_db)
 ):
-    """获取律师证列表"""
+    """获取律师证列表（支持页码分页和游标分页）"""
     try:
         # 构建查询
         query = db.query(LawyerCertificate)
@@ -68,17 +74,15 @@ async def list_lawyer_certificates(
         if is_verified is not None:
             query = query.filter(LawyerCertificate.is_verified == is_verified)
         
-        # 排序
-        sort_column = getattr(LawyerCertificate, sort_by, LawyerCertificate.created_at)
-        if sort_order.lower() == "desc":
-            query = query.order_by(desc(sort_column))
-        else:
-            query = query.order_by(asc(sort_column))
-        
-        # 分页
-        total = query.count()
-        offset = (page - 1) * page_size
-        certificates = query.offset(offset).limit(page_size).all()
+        # 排序与分页（按排序列 + id，游标模式不使用OFFSET）
+        sort_column, sort_name = resolve_sort_column(LawyerCertificate, sort_by)
+        descending = sort_order.lower() == "desc"
+        certificates, next_cursor = paginate_query(
+            query, sort_column, LawyerCertificate.id, descending,
+            f"{sort_name}:{'desc' if descending else 'asc'}",
+            lambda cert: getattr(cert, sort_name),
+            page_size, cursor=cursor, page=page
+        )
         
         # 格式化结果
         result_certs = []
@@ -109,14 +113,11 @@ async def list_lawyer_certificates(
         return {
             "success": True,
             "certificates": result_certs,
-            "pagination": {
-                "total": total,
-                "page": page,
-                "page_size": page_size,
-                "total_pages": (total + page_size - 1) // page_size
-            }
+            "pagination": page_info(page, page_size, next_cursor, cursor, query, include_total)
         }
         
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"获取律师证列表失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"获取列表失败: {str(e)}")
@@ -319,37 +320,24 @@ async def create_lawyer_certificate(
         # 处理上传的文件
         uploaded_files = []
         if files:
-            try:
-                from file_management_api import PERMANENT_FILES_PATH
-            except ImportError:
-                PERMANENT_FILES_PATH = "/app/uploads"
-                os.makedirs(PERMANENT_FILES_PATH, exist_ok=True)
-            
             for file in files:
                 if file.filename:
-                    # 保存文件
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    file_ext = os.path.splitext(file.filename)[1]
-                    storage_filename = f"lawyer_cert_{cert.id}_{timestamp}{file_ext}"
-                    storage_path = os.path.join(PERMANENT_FILES_PATH, storage_filename)
-                    
-                    content = await file.read()
-                    with open(storage_path, "wb") as f:
-                        f.write(content)
+                    # 流式写入blob存储（相同内容只保存一份）
+                    blob = await blob_store.store_upload(db, file, max_size=50 * 1024 * 1024)
                     
                     # 创建文件记录
                     cert_file = LawyerCertificateFile(
                         certificate_id=cert.id,
-                        file_path=storage_path,
+                        file_path=blob.path,
                         file_type="manual_upload",
                         file_name=file.filename,
-                        file_size=len(content)
+                        file_size=blob.file_size
                     )
                     
                     db.add(cert_file)
                     uploaded_files.append({
                         "filename": file.filename,
-                        "size": len(content)
+                        "size": blob.file_size
                     })
         
         db.commit()
@@ -395,13 +383,6 @@ async def create_lawyer_certificate_from_file(
     try:
         from ai_service import ai_service
         
-        # 保存上传的文件
-        try:
-            from file_management_api import PERMANENT_FILES_PATH
-        except ImportError:
-            PERMANENT_FILES_PATH = "/app/uploads"
-            os.makedirs(PERMANENT_FILES_PATH, exist_ok=True)
-        
         # 检查文件类型
         if not file.filename:
             raise HTTPException(status_code=400, detail="文件名不能为空")
@@ -411,14 +392,12 @@ async def create_lawyer_certificate_from_file(
         if file_ext not in allowed_extensions:
             raise HTTPException(status_code=400, detail="不支持的文件格式")
         
-        # 保存文件
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        storage_filename = f"lawyer_cert_upload_{timestamp}{file_ext}"
-        storage_path = os.path.join(PERMANENT_FILES_PATH, storage_filename)
-        
-        content = await file.read()
-        with open(storage_path, "wb") as f:
-            f.write(content)
+        # 流式写入blob存储（相同内容只保存一份）
+        try:
+            blob = await blob_store.store_upload(db, file, max_size=50 * 1024 * 1024)
+        except UploadTooLargeError as size_err:
+            raise HTTPException(status_code=413, detail=str(size_err))
+        storage_path = blob.path
         
         logger.info(f"文件保存成功: {storage_path}")
         
@@ -575,7 +554,7 @@ async def create_lawyer_certificate_from_file(
             file_path=storage_path,
             file_type="uploaded_document",
             file_name=file.filename,
-            file_size=len(content)
+            file_size=blob.file_size
         )
         
         db.add(cert_file)
@@ -619,21 +598,9 @@ async def create_lawyer_certificate_from_file(
         }
         
     except HTTPException:
-        # 清理上传的文件
-        try:
-            if 'storage_path' in locals() and os.path.exists(storage_path):
-                os.remove(storage_path)
-        except:
-            pass
+        # 未被引用的blob由垃圾回收清理（可能与其他记录共享，不能直接删除）
         raise
     except Exception as e:
-        # 清理上传的文件
-        try:
-            if 'storage_path' in locals() and os.path.exists(storage_path):
-                os.remove(storage_path)
-        except:
-            pass
-        
         logger.error(f"从文件创建律师证失败: {str(e)}")
         db.rollback()
         raise HTTPException(status_code=500, detail=f"创建失败: {str(e)}")
@@ -741,14 +708,9 @@ async def delete_lawyer_certificate(cert_id: int, db: Session = Depends(get_db))
         if not cert:
             raise HTTPException(status_code=404, detail="律师证不存在")
         
-        # 删除关联的文件记录和实际文件
+        # 删除关联的文件记录并释放文件引用
         for file in cert.files:
-            try:
-                if os.path.exists(file.file_path):
-                    os.remove(file.file_path)
-            except Exception as e:
-                logger.warning(f"删除文件失败: {file.file_path}, 错误: {str(e)}")
-            
+            blob_store.discard_path(db, file.file_path)
             db.delete(file)
         
         # 删除律师证记录
@@ -790,39 +752,23 @@ async def upload_lawyer_certificate_file(
         if not file.filename:
             raise HTTPException(status_code=400, detail="文件名不能为空")
         
-        # 读取文件内容
-        content = await file.read()
-        file_size = len(content)
-        
-        if file_size > 50 * 1024 * 1024:  # 50MB限制
-            raise HTTPException(status_code=413, detail="文件大小超过限制(50MB)")
-        
+        # 流式写入blob存储（超过50MB立即中止，相同内容只保存一份）
         try:
-            from file_management_api import PERMANENT_FILES_PATH
-        except ImportError:
-            PERMANENT_FILES_PATH = "/app/uploads"
-            os.makedirs(PERMANENT_FILES_PATH, exist_ok=True)
+            blob = await blob_store.store_upload(db, file, max_size=50 * 1024 * 1024)
+        except UploadTooLargeError as size_err:
+            raise HTTPException(status_code=413, detail=str(size_err))
+        storage_path = blob.path
+        file_size = blob.file_size
         
         # 如果是替换模式，删除现有文件
         if replace_existing:
             for existing_file in cert.files:
                 try:
-                    if os.path.exists(existing_file.file_path):
-                        os.remove(existing_file.file_path)
+                    blob_store.discard_path(db, existing_file.file_path)
                     db.delete(existing_file)
                 except Exception as e:
                     logger.warning(f"删除旧文件失败: {existing_file.file_path}, 错误: {str(e)}")
         
-        # 生成新文件名
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        file_ext = os.path.splitext(file.filename)[1]
-        storage_filename = f"lawyer_cert_{cert_id}_{timestamp}{file_ext}"
-        storage_path = os.path.join(PERMANENT_FILES_PATH, storage_filename)
-        
-        # 保存文件
-        with open(storage_path, "wb") as f:
-            f.write(content)
-        
         # 创建文件记录
         cert_file = LawyerCertificateFile(
             certificate_id=cert_id,
@@ -1035,6 +981,8 @@ async def upload_lawyer_certificate_files_batch(
     db: Session = Depends(get_db)
 ):
     """批量上传律师证文件并进行AI分析"""
+    # 批量分析的AI请求让位于交互请求（只影响本次请求的上下文）
+    set_background_priority()
     try:
         from ai_service import ai_service
         
@@ -1043,13 +991,6 @@ async def upload_lawyer_certificate_files_batch(
         created_certificates = []
         skipped_files = []
         
-        # 确保上传目录存在
-        try:
-            from file_management_api import PERMANENT_FILES_PATH
-        except ImportError:
-            PERMANENT_FILES_PATH = "/app/uploads"
-            os.makedirs(PERMANENT_FILES_PATH, exist_ok=True)
-        
         for i, file in enumerate(files):
             try:
                 if not file.filename:
@@ -1069,24 +1010,17 @@ async def upload_lawyer_certificate_files_batch(
                     })
                     continue
                 
-                # 检查文件大小
-                content = await file.read()
-                file_size = len(content)
-                
-                if file_size > 50 * 1024 * 1024:  # 50MB限制
+                # 流式写入blob存储（超过50MB立即中止，相同内容只保存一份）
+                try:
+                    blob = await blob_store.store_upload(db, file, max_size=50 * 1024 * 1024)
+                except UploadTooLargeError as size_err:
                     failed_files.append({
                         "filename": file.filename,
-                        "error": "文件大小超过限制(50MB)"
+                        "error": str(size_err)
                     })
                     continue
-                
-                # 保存文件
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                storage_filename = f"lawyer_cert_batch_{timestamp}_{i}{file_ext}"
-                storage_path = os.path.join(PERMANENT_FILES_PATH, storage_filename)
-                
-                with open(storage_path, "wb") as f:
-                    f.write(content)
+                storage_path = blob.path
+                file_size = blob.file_size
                 
                 logger.info(f"文件保存成功: {storage_path}")
                 
@@ -1225,13 +1159,6 @@ async def upload_lawyer_certificate_files_batch(
                     "error": str(file_err)
                 })
                 logger.error(f"上传文件失败 {file.filename}: {file_err}")
-                
-                # 清理可能已保存的文件
-                try:
-                    if 'storage_path' in locals() and os.path.exists(storage_path):
-                        os.remove(storage_path)
-                except:
-                    pass
         
         db.commit()
         
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+LLM响应缓存模块
+
+按 提供商 + 请求地址 + 模型 + 温度 + 消息摘要 + 图片摘要 缓存AI接口的成功响应，
+存储在本地SQLite文件中，支持TTL过期和按总大小的LRU淘汰。
+重复分析同一文档且提示词未变化时，直接返回缓存结果。
+读写为同步SQLite操作，异步调用方应在线程池中执行。
+"""
+
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Tuple, Union
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+
+def _digest(payload: Union[str, bytes]) -> str:
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+def _split_images(messages: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """将消息中的图片替换为摘要占位，返回 (不含图片的消息, 图片摘要列表)"""
+    image_digests: List[str] = []
+    stripped = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            parts = []
+            for part in content:
+                if isinstance(part, dict) and part.get("type") == "image_url":
+                    url = (part.get("image_url") or {}).get("url", "")
+                    image_digests.append(_digest(url))
+                    parts.append({"type": "image_url", "image_url": {"url": f"image:{len(image_digests) - 1}"}})
+                else:
+                    parts.append(part)
+            message = {**message, "content": parts}
+        stripped.append(message)
+    return stripped, image_digests
+
+
+def make_cache_key(
+    provider: str,
+    endpoint: str,
+    model: str,
+    temperature: float,
+    messages: List[Dict[str, Any]],
+    extra: Optional[Dict[str, Any]] = None
+) -> str:
+    """生成缓存键：提供商、请求地址、模型、温度、消息摘要、图片摘要及其他影响结果的参数
+
+    不同服务地址上的同名模型不共享缓存。
+    """
+    text_messages, image_digests = _split_images(messages)
+    payload = {
+        "provider": provider,
+        "endpoint": endpoint,
+        "model": model,
+        "temperature": temperature,
+        "messages": _digest(json.dumps(text_messages, sort_keys=True, ensure_ascii=False, default=str)),
+        "images": _digest("".join(image_digests)) if image_digests else None,
+        "extra": extra or {},
+    }
+    return _digest(json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str))
+
+
+class LLMResponseCache:
+    """基于SQLite的LLM响应缓存（TTL过期 + 按大小LRU淘汰）
+
+    总大小在内存中累计，写入时只在超过上限时淘汰（一次淘汰到上限的90%）；
+    过期条目在读取时逐条删除，并按 purge_interval 定期批量清理。
+    """
+
+    def __init__(self, db_path: Union[str, Path], max_size_bytes: int, ttl_seconds: float, enabled: bool = True,
+                 purge_interval: float = 600.0):
+        self.db_path = Path(db_path)
+        self.max_size_bytes = max_size_bytes
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self.purge_interval = purge_interval
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._bypassed = 0
+        self._evictions = 0
+        self._total_size = 0
+        self._purged_at = time.time()
+
+        if self.enabled:
+            try:
+                self.db_path.parent.mkdir(parents=True, exist_ok=True)
+                self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    "cache_key TEXT PRIMARY KEY, "
+                    "response TEXT NOT NULL, "
+                    "size INTEGER NOT NULL, "
+                    "created_at REAL NOT NULL, "
+                    "last_access REAL NOT NULL)"
+                )
+                self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+                self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_created_at ON responses(created_at)")
+                self._total_size = self._sum_size()
+                logger.info(f"LLM响应缓存已启用: {self.db_path} "
+                            f"(TTL {int(self.ttl_seconds)}s, 上限 {self.max_size_bytes // (1024 * 1024)}MB)")
+            except Exception as e:
+                logger.warning(f"LLM响应缓存初始化失败，已禁用: {e}")
+                self._conn = None
+                self.enabled = False
+
+    def configure(self, enabled: bool, ttl_seconds: float):
+        """更新启用状态和TTL（数据库初始化失败时保持禁用）"""
+        self.enabled = enabled and self._conn is not None
+        self.ttl_seconds = ttl_seconds
+
+    def record_bypass(self):
+        """记录一次按请求跳过缓存"""
+        with self._lock:
+            self._bypassed += 1
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取未过期的缓存响应，未命中返回None"""
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT response, created_at FROM responses WHERE cache_key = ?", (key,)
+                ).fetchone()
+                if row is None or now - row[1] > self.ttl_seconds:
+                    if row is not None:
+                        self._delete(key)
+                    self._misses += 1
+                    return None
+
+                self._conn.execute("UPDATE responses SET last_access = ? WHERE cache_key = ?", (now, key))
+                self._hits += 1
+                return json.loads(row[0])
+
+            except Exception as e:
+                logger.warning(f"读取LLM响应缓存失败: {e}")
+                self._misses += 1
+                return None
+
+    def put(self, key: str, response: Dict[str, Any]) -> bool:
+        """写入响应，超过大小上限时淘汰最久未访问的条目"""
+        if not self.enabled:
+            return False
+
+        payload = json.dumps(response, ensure_ascii=False)
+        size = len(payload.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            try:
+                previous = self._conn.execute("SELECT size FROM responses WHERE cache_key = ?", (key,)).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (cache_key, response, size, created_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, payload, size, now, now)
+                )
+                self._total_size += size - (previous[0] if previous else 0)
+
+                if now - self._purged_at >= self.purge_interval:
+                    self._purge_expired(now)
+                if self._total_size > self.max_size_bytes:
+                    self._evict_lru()
+                return True
+            except Exception as e:
+                logger.warning(f"写入LLM响应缓存失败: {e}")
+                return False
+
+    def _sum_size(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def _delete(self, key: str):
+        """删除一条记录并扣减总大小（调用方持有锁）"""
+        row = self._conn.execute("SELECT size FROM responses WHERE cache_key = ?", (key,)).fetchone()
+        if row is not None:
+            self._conn.execute("DELETE FROM responses WHERE cache_key = ?", (key,))
+            self._total_size -= row[0]
+
+    def _purge_expired(self, now: float):
+        """批量删除过期条目并重新统计总大小（调用方持有锁）"""
+        expired = self._conn.execute(
+            "DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)
+        ).rowcount
+        self._evictions += max(expired, 0)
+        self._total_size = self._sum_size()
+        self._purged_at = now
+
+    def _evict_lru(self):
+        """按最近访问时间淘汰到上限的90%，避免每次写入都触发淘汰（调用方持有锁）"""
+        target = int(self.max_size_bytes * 0.9)
+        victims = []
+        for cache_key, size in self._conn.execute("SELECT cache_key, size FROM responses ORDER BY last_access"):
+            if self._total_size <= target:
+                break
+            victims.append((cache_key,))
+            self._total_size -= size
+        self._conn.executemany("DELETE FROM responses WHERE cache_key = ?", victims)
+        self._evictions += len(victims)
+        if victims:
+            logger.info(f"LLM响应缓存淘汰 {len(victims)} 条记录")
+
+    def clear(self) -> int:
+        """清空缓存，返回删除条目数"""
+        if self._conn is None:
+            return 0
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM responses").rowcount
+            self._total_size = 0
+            return removed
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        entries, size_bytes = 0, 0
+        if self._conn is not None:
+            with self._lock:
+                try:
+                    entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+                    size_bytes = self._total_size
+                except Exception as e:
+                    logger.warning(f"读取LLM响应缓存统计失败: {e}")
+        return {
+            "enabled": self.enabled,
+            "db_path": str(self.db_path),
+            "entries": entries,
+            "size_bytes": size_bytes,
+            "max_size_bytes": self.max_size_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self._hits,
+            "misses": self._misses,
+            "bypassed": self._bypassed,
+            "evictions": self._evictions,
+        }
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+本地文档分类模块
+
+在调用LLM之前先用本地模型做一次分类：字符n-gram TF-IDF + 线性模型（scikit-learn），
+训练数据来自用户修正和已验证的业绩/律师证记录，存储在本地SQLite文件中。
+新增样本后在后台线程重新训练；置信度达到阈值的文档直接采用本地结果，
+其余仍交给LLM，并统计本地结果与LLM结果、用户修正的一致率。
+"""
+
+import time
+import random
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from collections import Counter
+from typing import Dict, Any, Optional, List, Tuple, Union
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+try:
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+    SKLEARN_AVAILABLE = True
+except ImportError as e:
+    SKLEARN_AVAILABLE = False
+    logger.warning(f"scikit-learn不可用，本地分类器已禁用: {e}")
+
+# 参与训练/预测的文本长度上限（文档开头最能体现类型）
+MAX_TEXT_CHARS = 3000
+
+# 文本过短时不做本地预测
+MIN_TEXT_CHARS = 30
+
+
+def _normalize_text(text: str) -> str:
+    return " ".join((text or "").split())[:MAX_TEXT_CHARS]
+
+
+class LocalDocumentClassifier:
+    """基于用户修正和已验证记录训练的本地文档类型分类器"""
+
+    def __init__(self, db_path: Union[str, Path], enabled: bool = True):
+        self.db_path = Path(db_path)
+        self.enabled = enabled and SKLEARN_AVAILABLE
+        self.threshold = 0.85
+        self.min_samples = 20
+        self.audit_rate = 0.1
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._train_lock = threading.Lock()
+        self._model = None
+        self._model_labels: List[str] = []
+        self._model_samples = 0
+        self._trained_at: Optional[float] = None
+        self._training = False
+        self._dirty = False
+
+        # 指标
+        self._predictions = 0
+        self._accepted = 0
+        self._deferred = 0
+        self._audited = 0
+        self._compared = 0
+        self._agreed = 0
+        self._per_label: Dict[str, Dict[str, int]] = {}
+        self._corrections = 0
+        self._corrections_matching = 0
+
+        if SKLEARN_AVAILABLE:
+            try:
+                self.db_path.parent.mkdir(parents=True, exist_ok=True)
+                self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                # documents: 已分析文档的文本摘录，用户修正时据此生成样本
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS documents ("
+                    "file_hash TEXT PRIMARY KEY, "
+                    "text TEXT NOT NULL, "
+                    "predicted TEXT, "
+                    "updated_at REAL NOT NULL)"
+                )
+                # samples: 带标签的训练样本（source: correction / verified）
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS samples ("
+                    "sample_key TEXT PRIMARY KEY, "
+                    "label TEXT NOT NULL, "
+                    "text TEXT NOT NULL, "
+                    "source TEXT NOT NULL, "
+                    "updated_at REAL NOT NULL)"
+                )
+            except Exception as e:
+                logger.warning(f"本地分类器样本库初始化失败，已禁用: {e}")
+                self._conn = None
+                self.enabled = False
+
+    def configure(self, enabled: bool, threshold: float, min_samples: int, audit_rate: float):
+        """更新启用状态、置信度阈值、最少样本数和抽检比例"""
+        self.enabled = enabled and self._conn is not None
+        self.threshold = threshold
+        self.min_samples = max(2, min_samples)
+        self.audit_rate = min(1.0, max(0.0, audit_rate))
+
+    @property
+    def ready(self) -> bool:
+        return self.enabled and self._model is not None
+
+    # ---------- 样本 ----------
+
+    def remember_document(self, file_hash: str, text: str, predicted: Optional[str] = None):
+        """记录已分析文档的文本摘录及本地预测，供之后的用户修正使用"""
+        text = _normalize_text(text)
+        if self._conn is None or not file_hash or len(text) < MIN_TEXT_CHARS:
+            return
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO documents (file_hash, text, predicted, updated_at) VALUES (?, ?, ?, ?)",
+                    (file_hash, text, predicted, time.time())
+                )
+            except Exception as e:
+                logger.warning(f"记录本地分类文档失败: {e}")
+
+    def add_correction(self, file_hash: str, label: str) -> bool:
+        """用户修正分类时，以该文档文本和修正后的类型生成训练样本"""
+        if self._conn is None or not file_hash or not label:
+            return False
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text, predicted FROM documents WHERE file_hash = ?", (file_hash,)
+            ).fetchone()
+        if row is None:
+            logger.info(f"本地分类器未找到文档文本，跳过修正样本: {file_hash[:16]}...")
+            return False
+
+        text, predicted = row
+        if predicted:
+            self._corrections += 1
+            if predicted == label:
+                self._corrections_matching += 1
+        self._upsert_samples([(f"correction:{file_hash}", label, text, "correction")])
+        self.schedule_training()
+        return True
+
+    def replace_verified_samples(self, samples: List[Tuple[str, str, str]]):
+        """用已验证记录 [(样本键, 类型, 文本)] 替换全部verified样本"""
+        if self._conn is None:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM samples WHERE source = 'verified'")
+        self._upsert_samples([(key, label, text, "verified") for key, label, text in samples])
+
+    def _upsert_samples(self, samples: List[Tuple[str, str, str, str]]):
+        now = time.time()
+        rows = [
+            (key, label, _normalize_text(text), source, now)
+            for key, label, text, source in samples
+            if label and len(_normalize_text(text)) >= MIN_TEXT_CHARS
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO samples (sample_key, label, text, source, updated_at) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+
+    # ---------- 训练 ----------
+
+    def train(self) -> Dict[str, Any]:
+        """用全部样本重新训练（同一时间只有一个训练在进行）"""
+        if self._conn is None:
+            return {"success": False, "error": "本地分类器不可用"}
+
+        with self._train_lock:
+            with self._lock:
+                rows = self._conn.execute("SELECT label, text FROM samples").fetchall()
+            labels = [label for label, _ in rows]
+            label_counts = Counter(labels)
+
+            if len(rows) < self.min_samples or len(label_counts) < 2:
+                logger.info(f"本地分类器样本不足，暂不训练: {len(rows)} 条 / {len(label_counts)} 类")
+                return {"success": False, "error": "样本不足", "samples": len(rows), "labels": dict(label_counts)}
+
+            started = time.perf_counter()
+            model = make_pipeline(
+                TfidfVectorizer(analyzer="char_wb", ngram_range=(1, 3), sublinear_tf=True, min_df=1, max_features=50000),
+                LogisticRegression(max_iter=1000, C=10.0, class_weight="balanced")
+            )
+            model.fit([text for _, text in rows], labels)
+
+            self._model = model
+            self._model_labels = list(model.classes_)
+            self._model_samples = len(rows)
+            self._trained_at = time.time()
+            elapsed = time.perf_counter() - started
+            logger.info(f"本地分类器训练完成: {len(rows)} 条样本, {len(label_counts)} 类, 耗时 {elapsed:.2f}s")
+            return {"success": True, "samples": len(rows), "labels": dict(label_counts), "seconds": round(elapsed, 3)}
+
+    def schedule_training(self):
+        """在后台线程重新训练；训练进行中再次触发时，结束后再训练一次"""
+        if self._conn is None:
+            return
+        with self._lock:
+            if self._training:
+                self._dirty = True
+                return
+            self._training = True
+        threading.Thread(target=self._training_worker, name="local-classifier-train", daemon=True).start()
+
+    def _training_worker(self):
+        while True:
+            try:
+                self.train()
+            except Exception as e:
+                logger.error(f"本地分类器训练失败: {e}")
+            with self._lock:
+                if not self._dirty:
+                    self._training = False
+                    return
+                self._dirty = False
+
+    # ---------- 预测与一致率 ----------
+
+    def predict(self, text: str) -> Optional[Dict[str, Any]]:
+        """预测文档类型，返回 {document_type, confidence, accepted, audit, scores}；不可用时返回None"""
+        model = self._model
+        text = _normalize_text(text)
+        if not self.enabled or model is None or len(text) < MIN_TEXT_CHARS:
+            return None
+
+        started = time.perf_counter()
+        probabilities = model.predict_proba([text])[0]
+        ranked = sorted(zip(model.classes_, probabilities), key=lambda item: item[1], reverse=True)
+        label, confidence = ranked[0]
+
+        accepted = confidence >= self.threshold
+        # 抽检：部分高置信度文档仍交给LLM，用于持续评估一致率
+        audit = accepted and random.random() < self.audit_rate
+
+        self._predictions += 1
+        if accepted and not audit:
+            self._accepted += 1
+        elif audit:
+            self._audited += 1
+        else:
+            self._deferred += 1
+
+        return {
+            "document_type": str(label),
+            "confidence": round(float(confidence), 4),
+            "accepted": accepted and not audit,
+            "audit": audit,
+            "scores": {str(name): round(float(score), 4) for name, score in ranked[:3]},
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+
+    def record_agreement(self, local_label: str, llm_label: str):
+        """记录本地预测与LLM分类结果是否一致"""
+        if not local_label or not llm_label or llm_label == "unknown":
+            return
+        agreed = local_label == llm_label
+        self._compared += 1
+        self._agreed += int(agreed)
+        entry = self._per_label.setdefault(llm_label, {"compared": 0, "agreed": 0})
+        entry["compared"] += 1
+        entry["agreed"] += int(agreed)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取分类器统计"""
+        samples: Dict[str, int] = {}
+        documents = 0
+        if self._conn is not None:
+            with self._lock:
+                try:
+                    for source, count in self._conn.execute("SELECT source, COUNT(*) FROM samples GROUP BY source"):
+                        samples[source] = count
+                    documents = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+                except Exception as e:
+                    logger.warning(f"读取本地分类器统计失败: {e}")
+        return {
+            "available": SKLEARN_AVAILABLE,
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "threshold": self.threshold,
+            "min_samples": self.min_samples,
+            "audit_rate": self.audit_rate,
+            "samples": samples,
+            "documents": documents,
+            "model_samples": self._model_samples,
+            "model_labels": self._model_labels,
+            "trained_at": self._trained_at,
+            "training": self._training,
+            "predictions": self._predictions,
+            "accepted": self._accepted,
+            "deferred_to_llm": self._deferred,
+            "audited": self._audited,
+            "llm_agreement": {
+                "compared": self._compared,
+                "agreed": self._agreed,
+                "rate": round(self._agreed / self._compared, 4) if self._compared else None,
+                "per_label": {
+                    label: {**entry, "rate": round(entry["agreed"] / entry["compared"], 4)}
+                    for label, entry in self._per_label.items()
+                },
+            },
+            "correction_agreement": {
+                "corrections": self._corrections,
+                "matching_local": self._corrections_matching,
+                "rate": round(self._corrections_matching / self._corrections, 4) if self._corrections else None,
+            },
+        }
@@ -27,6 +27,11 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from database import get_db, init_db, SessionLocal, engine
 from models import *
 from ai_service import ai_service
+from ai_metrics import ai_metrics
+from file_lifecycle import file_lifecycle
+from search_index import file_search_index
+from upload_ingest import save_upload
+from settings_cache import settings_snapshot, SETTINGS_VERSION_KEY
 from screenshot_service import screenshot_service
 from document_generator import document_generator
 import schemas
@@ -165,6 +170,12 @@ def format_heading(doc, text, level=1, center=False):
     
     return heading
 
+def reload_docling_config():
+    """重新加载Docling配置，淘汰按旧配置创建的转换器"""
+    from docling_service import docling_service
+    if docling_service:
+        docling_service.reload_config()
+
 @app.on_event("startup")
 async def startup_event():
     """应用启动时初始化数据库"""
@@ -181,6 +192,34 @@ async def startup_event():
         # 启动时下载Docling模型
         await download_docling_models_on_startup()
         
+        # 设置版本号变化时（包括其他进程修改设置）在后台重新加载AI服务和Docling配置，
+        # Docling可能重建转换器（加载模型），放到线程池中执行
+        settings_snapshot.add_listener(ai_service.reload_config)
+        settings_snapshot.add_listener(reload_docling_config, blocking=True)
+        
+        # 创建AI服务共享HTTP连接池
+        try:
+            await ai_service.start_http_pool()
+        except Exception as e:
+            logger.warning(f"HTTP连接池启动失败，将在首次请求时创建: {str(e)}")
+        
+        # 启动AI调用计量的后台批量写入
+        ai_metrics.start()
+        
+        # 启动文件生命周期后台任务（归档过期文件、blob垃圾回收）
+        file_lifecycle.start()
+        
+        # 创建文件全文索引，首次启用时在后台为已有文件建立索引
+        if file_search_index.prepare(engine):
+            asyncio.get_event_loop().run_in_executor(None, file_search_index.rebuild_if_empty)
+        
+        # 旧记录的文件哈希为MD5，后台换算为SHA-256以便重复上传检测
+        if IMPORT_SUCCESS:
+            asyncio.get_event_loop().run_in_executor(None, file_management_api.backfill_file_hashes)
+        
+        # 后台同步已验证记录并训练本地文档分类器
+        asyncio.get_event_loop().run_in_executor(None, ai_service.rebuild_local_classifier)
+        
         # 注册API路由
         if IMPORT_SUCCESS:
             # 注册项目API路由
@@ -240,6 +279,29 @@ async def startup_event():
     except Exception as e:
         logger.error(f"应用启动失败: {str(e)}")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时释放后台资源"""
+    try:
+        from docling_service import docling_service
+        if docling_service:
+            docling_service.shutdown()
+            logger.info("Docling执行引擎已关闭")
+    except Exception as e:
+        logger.error(f"关闭Docling执行引擎失败: {str(e)}")
+    
+    try:
+        await ai_service.close_http_pool()
+    except Exception as e:
+        logger.error(f"关闭HTTP连接池失败: {str(e)}")
+    
+    try:
+        await ai_metrics.stop()
+    except Exception as e:
+        logger.error(f"写入剩余AI调用计量失败: {str(e)}")
+    
+    await file_lifecycle.stop()
+
 async def init_base_data():
     """初始化基础数据，如厂牌、业务领域等"""
     db = SessionLocal()
@@ -419,7 +481,9 @@ async def download_docling_models_on_startup():
                 db.add(new_setting)
                 logger.info("🔧 已创建OCR设置为开启状态")
             
+            settings_snapshot.bump_version(db)
             db.commit()
+            settings_snapshot.invalidate()
             logger.info("✅ OCR功能已设置为开启状态")
             
         except Exception as e:
@@ -886,7 +950,7 @@ async def get_app_info():
 async def get_settings(category: Optional[str] = None, db: Session = Depends(get_db)):
     """获取系统设置"""
     try:
-        query = db.query(SystemSettings)
+        query = db.query(SystemSettings).filter(SystemSettings.setting_key != SETTINGS_VERSION_KEY)
         if category:
             query = query.filter(SystemSettings.category == category)
         
@@ -962,11 +1026,12 @@ async def update_settings(
             
             updated_settings.append(key)
         
+        # 递增设置版本号，通知所有进程刷新设置快照
+        settings_snapshot.bump_version(db)
         db.commit()
         
-        # 重新初始化AI服务以应用新的模型配置
-        if any("model" in key.lower() or "ai_" in key for key in updated_settings):
-            ai_service.reload_config()
+        # 本进程立即刷新快照，由变更监听者在后台重新加载AI服务和Docling配置（其他进程在检查版本号时同样触发）
+        settings_snapshot.refresh()
         
         return {
             "success": True,
@@ -1042,6 +1107,222 @@ async def init_default_settings(db: Session = Depends(get_db)):
                 "category": "vision",
                 "description": "Ollama视觉模型服务地址"
             },
+            {
+                "key": "vision_max_pages",
+                "value": "4",
+                "category": "vision",
+                "description": "PDF视觉分析最多分析的页数（从第一页开始）"
+            },
+            {
+                "key": "vision_max_side",
+                "value": "1600",
+                "category": "vision",
+                "description": "发送给视觉模型的图片最长边像素"
+            },
+            {
+                "key": "vision_image_format",
+                "value": "jpeg",
+                "category": "vision",
+                "description": "发送给视觉模型的图片编码格式 (jpeg/webp)"
+            },
+            {
+                "key": "vision_image_quality",
+                "value": "80",
+                "category": "vision",
+                "description": "图片编码质量 (30-95)"
+            },
+            {
+                "key": "vision_multi_page_mode",
+                "value": "multi_image",
+                "category": "vision",
+                "description": "多页分析方式：multi_image（一次请求多张图片）/parallel（每页并行请求）"
+            },
+            # HTTP连接池设置
+            {
+                "key": "ai_http_pool_limit",
+                "value": "100",
+                "category": "ai",
+                "description": "每个AI服务提供商连接池的最大连接数",
+                "requires_restart": True
+            },
+            {
+                "key": "ai_http_pool_limit_per_host",
+                "value": "20",
+                "category": "ai",
+                "description": "连接池对单个主机的最大并发连接数",
+                "requires_restart": True
+            },
+            {
+                "key": "ai_http_keepalive_timeout",
+                "value": "60",
+                "category": "ai",
+                "description": "空闲连接保持时间（秒）",
+                "requires_restart": True
+            },
+            # AI请求调度设置
+            {
+                "key": "ai_max_concurrent_requests",
+                "value": "4",
+                "category": "ai",
+                "description": "每个AI服务提供商的最大并发请求数"
+            },
+            {
+                "key": "ai_requests_per_minute",
+                "value": "0",
+                "category": "ai",
+                "description": "每个AI服务提供商每分钟最大请求数（0为不限制）"
+            },
+            {
+                "key": "ai_tokens_per_minute",
+                "value": "0",
+                "category": "ai",
+                "description": "每个AI服务提供商每分钟最大Token数（0为不限制）"
+            },
+            {
+                "key": "ai_provider_rate_limits",
+                "value": "{}",
+                "category": "ai",
+                "description": "按提供商覆盖的限制，JSON格式，如 {\"ollama\": {\"max_in_flight\": 1, \"requests_per_minute\": 0}}"
+            },
+            # 长文档分块分析设置
+            {
+                "key": "ai_chunked_analysis_enabled",
+                "value": "true",
+                "category": "ai",
+                "description": "长文档按结构分块并行分析并合并结果（关闭则只分析前2000字符）"
+            },
+            {
+                "key": "ai_chunk_size_chars",
+                "value": "2000",
+                "category": "ai",
+                "description": "分块分析时每块的最大字符数"
+            },
+            {
+                "key": "ai_chunk_max_chunks",
+                "value": "6",
+                "category": "ai",
+                "description": "单个文档最多分析的分块数（超出时保留首尾并均匀抽取）"
+            },
+            # AI调用重试与熔断设置
+            {
+                "key": "ai_retry_max_attempts",
+                "value": "3",
+                "category": "ai",
+                "description": "AI调用遇到429/5xx/超时时的最大尝试次数（含首次）"
+            },
+            {
+                "key": "ai_retry_base_delay_seconds",
+                "value": "1",
+                "category": "ai",
+                "description": "重试退避基础等待秒数（指数增长并加入随机抖动）"
+            },
+            {
+                "key": "ai_retry_max_delay_seconds",
+                "value": "30",
+                "category": "ai",
+                "description": "单次重试最长等待秒数（Retry-After超过该值时交由后台重新排队）"
+            },
+            {
+                "key": "ai_circuit_failure_threshold",
+                "value": "5",
+                "category": "ai",
+                "description": "提供商连续失败多少次后熔断"
+            },
+            {
+                "key": "ai_circuit_reset_seconds",
+                "value": "30",
+                "category": "ai",
+                "description": "熔断后等待多少秒再放行探测请求"
+            },
+            {
+                "key": "ai_background_max_requeues",
+                "value": "3",
+                "category": "ai",
+                "description": "后台分析因AI服务暂时不可用失败时，自动重新排队的最大次数"
+            },
+            {
+                "key": "ai_background_requeue_delay_seconds",
+                "value": "60",
+                "category": "ai",
+                "description": "后台分析首次重新排队的延迟秒数（之后按指数增长）"
+            },
+            # AI工具并发执行设置
+            {
+                "key": "ai_tool_max_concurrency",
+                "value": "4",
+                "category": "ai",
+                "description": "一次请求中并发执行的AI工具调用数上限"
+            },
+            {
+                "key": "ai_tool_timeout_seconds",
+                "value": "30",
+                "category": "ai",
+                "description": "单个AI工具调用的默认超时秒数"
+            },
+            {
+                "key": "ai_tool_timeouts",
+                "value": "{}",
+                "category": "ai",
+                "description": "按工具覆盖超时秒数（JSON，如 {\"read_webpage\": 60}）"
+            },
+            # AI调用计量设置
+            {
+                "key": "ai_metrics_enabled",
+                "value": "true",
+                "category": "ai",
+                "description": "是否记录每次AI调用的令牌用量、耗时和缓存命中（写入AI处理日志）"
+            },
+            {
+                "key": "ai_metrics_flush_interval_seconds",
+                "value": "5",
+                "category": "ai",
+                "description": "AI调用计量批量写入数据库的间隔（秒）"
+            },
+            # 本地文档分类器设置
+            {
+                "key": "ai_local_classifier_enabled",
+                "value": "true",
+                "category": "ai",
+                "description": "是否先用本地分类器（用户修正和已验证记录训练）判定文档类型"
+            },
+            {
+                "key": "ai_local_classifier_threshold",
+                "value": "0.85",
+                "category": "ai",
+                "description": "本地分类置信度达到该值时跳过LLM分类（0-1）"
+            },
+            {
+                "key": "ai_local_classifier_min_samples",
+                "value": "20",
+                "category": "ai",
+                "description": "本地分类器开始训练所需的最少样本数"
+            },
+            {
+                "key": "ai_local_classifier_audit_rate",
+                "value": "0.1",
+                "category": "ai",
+                "description": "高置信度文档中仍交给LLM抽检的比例，用于统计一致率（0-1）"
+            },
+            # LLM响应缓存设置
+            {
+                "key": "ai_response_cache_enabled",
+                "value": "true",
+                "category": "ai",
+                "description": "是否缓存AI接口响应（相同模型和提示词时直接返回）"
+            },
+            {
+                "key": "ai_response_cache_ttl_hours",
+                "value": "168",
+                "category": "ai",
+                "description": "AI响应缓存有效期（小时）"
+            },
+            {
+                "key": "ai_response_cache_max_size_mb",
+                "value": "256",
+                "category": "ai",
+                "description": "AI响应缓存最大占用空间(MB)",
+                "requires_restart": True
+            },
 
             # 上传设置
             {
@@ -1056,6 +1337,30 @@ async def init_default_settings(db: Session = Depends(get_db)):
                 "category": "upload",
                 "description": "允许的文件类型"
             },
+            {
+                "key": "file_lifecycle_enabled",
+                "value": "true",
+                "category": "upload",
+                "description": "是否启用后台文件生命周期任务（归档过期临时文件、回收无引用blob）"
+            },
+            {
+                "key": "file_lifecycle_interval_seconds",
+                "value": "3600",
+                "category": "upload",
+                "description": "文件生命周期任务执行间隔（秒）"
+            },
+            {
+                "key": "file_lifecycle_batch_size",
+                "value": "500",
+                "category": "upload",
+                "description": "每批归档的过期文件数"
+            },
+            {
+                "key": "blob_gc_grace_seconds",
+                "value": "3600",
+                "category": "upload",
+                "description": "无引用blob删除前的宽限期（秒）"
+            },
             # 截图设置
             {
                 "key": "screenshot_timeout",
@@ -1180,6 +1485,78 @@ async def init_default_settings(db: Session = Depends(get_db)):
                 "category": "ocr",
                 "description": "OCR图像缩放比例 (1.0-3.0)"
             },
+            # Docling转换缓存设置
+            {
+                "key": "docling_cache_enabled",
+                "value": "true",
+                "category": "ocr",
+                "description": "是否启用Docling转换结果缓存（按文件内容哈希复用转换结果）"
+            },
+            {
+                "key": "docling_cache_max_size_mb",
+                "value": "2048",
+                "category": "ocr",
+                "description": "Docling转换缓存最大占用空间（MB），超出后按最近使用时间淘汰"
+            },
+            # Docling执行引擎设置
+            {
+                "key": "docling_executor_backend",
+                "value": "thread",
+                "category": "ocr",
+                "description": "Docling转换执行引擎 (thread: 线程池 / process: 进程池，多核主机推荐process)",
+                "requires_restart": True
+            },
+            {
+                "key": "docling_max_workers",
+                "value": "2",
+                "category": "ocr",
+                "description": "Docling转换并发工作数（线程数或进程数，每个进程常驻一份模型）",
+                "requires_restart": True
+            },
+            # Docling大文件分片转换设置
+            {
+                "key": "docling_shard_enabled",
+                "value": "false",
+                "category": "ocr",
+                "description": "是否对大PDF按页码范围分片并行转换"
+            },
+            {
+                "key": "docling_shard_min_pages",
+                "value": "60",
+                "category": "ocr",
+                "description": "触发分片转换的最小页数"
+            },
+            {
+                "key": "docling_shard_page_size",
+                "value": "20",
+                "category": "ocr",
+                "description": "每个分片包含的页数"
+            },
+            {
+                "key": "docling_native_text_fast_path",
+                "value": "true",
+                "category": "ocr",
+                "description": "PDF有文本层的页面直接提取文本，仅对无文本页面执行OCR"
+            },
+            {
+                "key": "docling_text_layer_min_chars",
+                "value": "20",
+                "category": "ocr",
+                "description": "页面文本层被视为可用的最少字符数"
+            },
+            {
+                "key": "docling_page_cache_enabled",
+                "value": "true",
+                "category": "ocr",
+                "description": "是否按页面栅格哈希缓存OCR识别结果，跨文件复用相同页面"
+            },
+            {
+                "key": "docling_page_cache_max_size_mb",
+                "value": "512",
+                "category": "ocr",
+                "description": "页面OCR缓存最大占用空间(MB)",
+                "requires_restart": True
+            },
             # 图片描述配置
             {
                 "key": "picture_description_prompt",
@@ -1211,13 +1588,16 @@ async def init_default_settings(db: Session = Depends(get_db)):
                     setting_value=setting_info["value"],
                     category=setting_info["category"],
                     description=setting_info["description"],
-                    is_sensitive=setting_info.get("is_sensitive", False)
+                    is_sensitive=setting_info.get("is_sensitive", False),
+                    requires_restart=setting_info.get("requires_restart", False)
                 )
                 db.add(new_setting)
                 created_count += 1
         
         if created_count > 0:
+            settings_snapshot.bump_version(db)
             db.commit()
+            settings_snapshot.invalidate()
             logger.info(f"已初始化 {created_count} 个默认设置")
         
     except Exception as e:
@@ -1266,9 +1646,7 @@ async def convert_files_to_word(
     file_names = []
     for file in files:
         file_path = os.path.join(temp_dir, file.filename)
-        content = await file.read()
-        with open(file_path, "wb") as buffer:
-            buffer.write(content)
+        await save_upload(file, file_path)
         file_paths.append(file_path)
         file_names.append(file.filename)
 
@@ -1456,10 +1834,8 @@ async def clear_convert_history(db: Session = Depends(get_db)):
                 file_path = os.path.join(generated_docs_dir, filename)
                 if os.path.exists(file_path):
                     try:
-                        # 检查文件是否已在数据库中
-                        import hashlib
-                        with open(file_path, 'rb') as f:
-                            file_hash = hashlib.md5(f.read()).hexdigest()
+                        # 检查文件是否已在数据库中（与上传文件相同，按SHA-256去重）
+                        file_hash = file_management_api.calculate_file_hash(file_path)
                         
                         existing_file = db.query(ManagedFile).filter(
                             ManagedFile.file_hash == file_hash
@@ -1489,6 +1865,8 @@ async def clear_convert_history(db: Session = Depends(get_db)):
                                 last_accessed=datetime.now()
                             )
                             db.add(generated_file)
+                            db.flush()
+                            file_search_index.index_file(db, generated_file)
                             logger.info(f"将生成文档加入管理: {filename}")
                         
                     except Exception as db_err:
@@ -2006,10 +2384,11 @@ async def update_classification_prompt(
         setting.setting_value = new_value
         setting.updated_at = func.now()
         
+        settings_snapshot.bump_version(db)
         db.commit()
         
-        # 热重载AI服务配置
-        ai_service.reload_config()
+        # 刷新设置快照，由变更监听者在后台热重载AI服务配置
+        settings_snapshot.refresh()
         
         return {
             "success": True,
@@ -2055,10 +2434,11 @@ async def reset_classification_prompt(
         setting.setting_value = default_prompt
         setting.updated_at = func.now()
         
+        settings_snapshot.bump_version(db)
         db.commit()
         
-        # 热重载AI服务配置
-        ai_service.reload_config()
+        # 刷新设置快照，由变更监听者在后台热重载AI服务配置
+        settings_snapshot.refresh()
         
         return {
             "success": True,
@@ -2101,17 +2481,38 @@ async def get_docling_ocr_status():
         logger.error(f"获取Docling OCR状态失败: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.delete("/api/ocr/docling/cache")
+async def clear_docling_cache():
+    """清空Docling转换结果缓存及页面OCR缓存"""
+    try:
+        from docling_service import docling_service as ds
+        removed = ds.conversion_cache.clear()
+        removed_pages = ds.page_ocr_cache.clear()
+        
+        return {
+            "success": True,
+            "message": f"已清除 {removed} 条转换缓存, {removed_pages} 条页面OCR缓存",
+            "cache": ds.conversion_cache.get_stats(),
+            "page_cache": ds.page_ocr_cache.get_stats()
+        }
+    except Exception as e:
+        logger.error(f"清除Docling转换缓存失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/ocr/docling/reload")
 async def reload_docling_ocr():
     """重新加载Docling OCR配置"""
     try:
+        from docling_service import docling_service as ds
         ai_service.reload_config()
+        changed = ds.reload_config()
         
         return {
             "success": True,
             "message": "Docling OCR配置重新加载成功",
-            "ocr_enabled": ai_service.enable_docling_ocr,
-            "converter_initialized": ai_service.docling_converter is not None
+            "config_changed": changed,
+            "ocr_enabled": ds.config.enable_ocr,
+            "converter_initialized": ds.converter is not None
         }
     except Exception as e:
         logger.error(f"重新加载Docling OCR配置失败: {str(e)}")
@@ -2184,6 +2585,44 @@ async def get_ai_models_status():
         logger.error(f"获取AI模型状态失败: {e}")
         return {"success": False, "error": str(e)}
 
+@app.delete("/api/ai-models/response-cache")
+async def clear_ai_response_cache():
+    """清空LLM响应缓存"""
+    try:
+        from ai_service import ai_service
+        removed = ai_service.response_cache.clear()
+        return {
+            "success": True,
+            "message": f"已清除 {removed} 条AI响应缓存",
+            "cache": ai_service.response_cache.get_stats()
+        }
+    except Exception as e:
+        logger.error(f"清除AI响应缓存失败: {e}")
+        return {"success": False, "error": str(e)}
+
+@app.post("/api/ai-models/local-classifier/retrain")
+async def retrain_local_classifier():
+    """同步已验证记录并重新训练本地文档分类器"""
+    try:
+        from ai_service import ai_service
+        result = await asyncio.get_event_loop().run_in_executor(None, ai_service.rebuild_local_classifier)
+        return {**result, "classifier": ai_service.local_classifier.get_stats()}
+    except Exception as e:
+        logger.error(f"重新训练本地分类器失败: {e}")
+        return {"success": False, "error": str(e)}
+
+@app.get("/api/ai-models/metrics")
+async def get_ai_call_metrics(days: int = 7, stage: Optional[str] = None, db: Session = Depends(get_db)):
+    """按阶段、按天汇总AI调用的p50/p95耗时、令牌总量和缓存命中率"""
+    try:
+        # 先写入缓冲区中的记录，汇总包含最近的调用
+        await ai_metrics.flush()
+        summary = ai_metrics.summarize(db, days=max(1, min(days, 90)), stage=stage)
+        return {"success": True, **summary, "recorder": ai_metrics.get_stats()}
+    except Exception as e:
+        logger.error(f"获取AI调用计量失败: {e}")
+        return {"success": False, "error": str(e)}
+
 @app.post("/api/ai-models/download")
 async def trigger_ai_models_download():
     """触发AI模型下载"""
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, Float, ForeignKey, JSON, func
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, Float, ForeignKey, JSON, Index, func
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -36,6 +36,10 @@ class Award(Base):
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
+    __table_args__ = (
+        Index("ix_awards_created_at_id", "created_at", "id"),  # 列表按创建时间游标分页
+    )
+    
     # 关联的文件
     files = relationship("AwardFile", back_populates="award")
 
@@ -99,6 +103,10 @@ class Performance(Base):
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
+    __table_args__ = (
+        Index("ix_performances_created_at_id", "created_at", "id"),  # 列表按创建时间游标分页
+    )
+    
     # 关联的文件
     files = relationship("PerformanceFile", back_populates="performance")
 
@@ -159,6 +167,10 @@ class LawyerCertificate(Base):
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
+    __table_args__ = (
+        Index("ix_lawyer_certificates_created_at_id", "created_at", "id"),  # 列表按创建时间游标分页
+    )
+    
     # 关联的文件
     files = relationship("LawyerCertificateFile", back_populates="certificate")
 
@@ -580,7 +592,7 @@ class ManagedFile(Base):
     file_type = Column(String(50))  # 文件类型 (document, image, pdf, etc.)
     mime_type = Column(String(100))  # MIME类型
     file_size = Column(Integer)  # 文件大小(字节)
-    file_hash = Column(String(64))  # 文件MD5哈希值，用于去重
+    file_hash = Column(String(64))  # 文件SHA-256哈希值（blob存储键），用于去重
     
     # 文件分类
     file_category = Column(String(50), nullable=False)  # 文件类型: temporary_upload, temporary_generated, permanent
@@ -613,10 +625,29 @@ class ManagedFile(Base):
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
+    __table_args__ = (
+        Index("ix_managed_files_expiry", "is_archived", "expires_at"),  # 过期文件分批归档
+        Index("ix_managed_files_created_at_id", "created_at", "id"),  # 列表按创建时间游标分页
+    )
+    
     # 关联
     versions = relationship("FileVersion", back_populates="file", cascade="all, delete-orphan")
     usages = relationship("FileUsage", back_populates="file", cascade="all, delete-orphan")
 
+class Blob(Base):
+    """内容寻址文件存储表（按SHA-256去重，多个记录共享同一物理文件）"""
+    __tablename__ = "blobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), nullable=False, unique=True, index=True)  # 文件内容SHA-256（每份内容只登记一个blob）
+    extension = Column(String(20), default="")  # 扩展名（决定文档处理方式）
+    storage_path = Column(String(500), nullable=False, unique=True, index=True)  # blob文件路径
+    file_size = Column(Integer)  # 文件大小(字节)
+    ref_count = Column(Integer, default=0)  # 引用计数（垃圾回收时按实际引用修正）
+    
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now())  # 最后一次引用变化时间
+
 class FileVersion(Base):
     """文件版本表"""
     __tablename__ = "file_versions"
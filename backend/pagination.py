@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+列表分页模块
+
+在原有 page/page_size 分页之外提供游标（keyset）分页：按 (排序列, id) 作为键，
+下一页从上一页最后一条记录之后继续查询，不使用 OFFSET，任意深度的翻页代价相同。
+游标是不透明的 base64 字符串，记录排序方式、最后一条记录的排序值和ID。
+
+游标模式默认不计算总数；需要时从短期缓存中取（相同查询条件在有效期内只统计一次）。
+"""
+
+import json
+import time
+import base64
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, date
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import Date, DateTime, String, tuple_, type_coerce
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+
+class InvalidCursorError(ValueError):
+    """游标无法解析或与当前排序方式不匹配"""
+
+
+def _dump_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def _load_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+    return value
+
+
+def encode_cursor(sort_key: str, value: Any, row_id: int) -> str:
+    payload = json.dumps({"s": sort_key, "v": _dump_value(value), "id": row_id}, separators=(",", ":"), ensure_ascii=False)
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_key: str) -> Tuple[Any, int]:
+    """解析游标，返回 (排序值, id)；排序方式改变后旧游标失效"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+        value, row_id = _load_value(payload["v"]), int(payload["id"])
+    except Exception:
+        raise InvalidCursorError("无效的分页游标")
+    if payload.get("s") != sort_key:
+        raise InvalidCursorError("分页游标与当前排序方式不一致，请从第一页重新加载")
+    return value, row_id
+
+
+def resolve_sort_column(model, sort_by: Optional[str], default: str = "created_at") -> Tuple[Any, str]:
+    """按字段名取排序列（只允许表中的列），返回 (列, 列名)"""
+    name = sort_by if sort_by in model.__table__.columns.keys() else default
+    return getattr(model, name), name
+
+
+def _stored_sort_column(query, sort_expr):
+    """SQLite 中日期时间按文本存储，返回按原始文本读取/比较的排序列；其他情况返回 None
+
+    func.now() 写入的是 'YYYY-MM-DD HH:MM:SS'，而绑定的 datetime 参数带微秒，
+    直接比较会把同一秒内的记录（包括游标所在记录本身）判为"之后"，因此游标中保存原始文本。
+    """
+    if not isinstance(getattr(sort_expr, "type", None), (DateTime, Date)):
+        return None
+    try:
+        dialect = query.session.get_bind().dialect.name
+    except Exception:
+        return None
+    return type_coerce(sort_expr, String) if dialect == "sqlite" else None
+
+
+def paginate_query(
+    query,
+    sort_expr,
+    id_column,
+    descending: bool,
+    sort_key: str,
+    value_of: Callable[[Any], Any],
+    page_size: int,
+    cursor: Optional[str] = None,
+    page: int = 1
+) -> Tuple[List[Any], Optional[str]]:
+    """按 (sort_expr, id) 排序取一页，返回 (记录, 下一页游标)
+
+    给出 cursor 时从游标之后继续（keyset），否则按 page 使用 OFFSET（兼容旧接口）。
+    排序值为 NULL 的记录统一排在最后：先按 (排序列, id) 取非空记录，不足一页时再按 id 从NULL记录中补足，
+    两段查询都不含 OR 条件，可直接使用 (排序列, id) 索引。sort_key 标识排序方式（如 "created_at:desc"），写入游标用于校验。
+    """
+    stored_column = _stored_sort_column(query, sort_expr)
+    compare_expr = sort_expr if stored_column is None else stored_column
+    if stored_column is not None:
+        query = query.add_columns(stored_column)
+
+    after = (lambda column, value: column < value) if descending else (lambda column, value: column > value)
+    direction = (lambda column: column.desc()) if descending else (lambda column: column.asc())
+    # 多取一条判断是否还有下一页
+    limit = page_size + 1
+
+    def null_tail(last_id: Optional[int], count: int) -> List[Any]:
+        tail = query.filter(sort_expr.is_(None))
+        if last_id is not None:
+            tail = tail.filter(after(id_column, last_id))
+        return tail.order_by(direction(id_column)).limit(count).all()
+
+    if not cursor and page > 1:
+        rows = query.order_by(direction(sort_expr).nulls_last(), direction(id_column)) \
+            .offset((page - 1) * page_size).limit(limit).all()
+    elif cursor:
+        last_value, last_id = decode_cursor(cursor, sort_key)
+        if last_value is None:
+            rows = null_tail(last_id, limit)
+        else:
+            rows = query.filter(after(tuple_(compare_expr, id_column), tuple_(last_value, last_id))) \
+                .order_by(direction(sort_expr), direction(id_column)).limit(limit).all()
+            if len(rows) < limit:
+                rows += null_tail(None, limit - len(rows))
+    else:
+        rows = query.filter(sort_expr.isnot(None)) \
+            .order_by(direction(sort_expr), direction(id_column)).limit(limit).all()
+        if len(rows) < limit:
+            rows += null_tail(None, limit - len(rows))
+
+    if stored_column is not None:
+        # (记录, 原始排序值)
+        items = [row[0] for row in rows[:page_size]]
+        last_value = rows[page_size - 1][1] if len(rows) > page_size else None
+    else:
+        items = rows[:page_size]
+        last_value = value_of(items[-1]) if len(rows) > page_size and items else None
+
+    next_cursor = None
+    if len(rows) > page_size and items:
+        next_cursor = encode_cursor(sort_key, last_value, items[-1].id)
+    return items, next_cursor
+
+
+class CountCache:
+    """列表总数的短期缓存（按查询语句和参数区分）"""
+
+    def __init__(self, ttl: float = 30.0, max_entries: int = 512):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # 指标
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def _key(query) -> str:
+        compiled = query.statement.compile()
+        return f"{compiled}|{sorted((k, repr(v)) for k, v in compiled.params.items())}"
+
+    def count(self, query) -> Tuple[int, bool]:
+        """返回 (总数, 是否来自缓存)"""
+        key = self._key(query)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry[1], True
+
+        total = query.order_by(None).count()
+        with self._lock:
+            self._misses += 1
+            self._entries[key] = (now, total)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return total, False
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "ttl": self.ttl,
+            "entries": len(self._entries),
+            "hits": self._hits,
+            "misses": self._misses,
+        }
+
+
+def page_info(
+    page: int,
+    page_size: int,
+    next_cursor: Optional[str],
+    cursor: Optional[str],
+    query,
+    include_total: Optional[bool] = None,
+    pages_key: str = "total_pages"
+) -> Dict[str, Any]:
+    """生成分页信息
+
+    页码模式默认返回精确总数和总页数（include_total=False 时跳过统计）；
+    游标模式只在 include_total=True 时返回总数，取自短期缓存。
+    """
+    info: Dict[str, Any] = {"page_size": page_size, "next_cursor": next_cursor, "has_more": next_cursor is not None}
+    if cursor:
+        if include_total:
+            total, cached = list_count_cache.count(query)
+            info.update({"total": total, "total_cached": cached})
+        return info
+
+    info["page"] = page
+    if include_total is not False:
+        total = query.order_by(None).count()
+        info.update({"total": total, pages_key: (total + page_size - 1) // page_size})
+    return info
+
+
+# 全局列表总数缓存实例
+list_count_cache = CountCache()
@@ -14,6 +14,10 @@ from models import Performance, PerformanceFile, SystemSettings, AITask
 from schemas import PerformanceCreate, PerformanceUpdate, PerformanceResponse
 from config_manager import config_manager
 from ai_service import create_ai_task, update_ai_task
+from ai_scheduler import set_background_priority
+from upload_ingest import UploadTooLargeError
+from blob_store import blob_store
+from pagination import paginate_query, page_info, InvalidCursorError
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -67,9 +71,11 @@ async def list_performances(
     business_field: Optional[str] = None,
     year: Optional[int] = None,
     is_verified: Optional[bool] = None,
+    cursor: Optional[str] = None,  # 游标分页：传入上一页返回的 next_cursor（忽略 page）
+    include_total: Optional[bool] = None,  # 是否返回总数：页码分页默认返回，游标分页传 true 时返回缓存的总数
     db: Session = Depends(get_db)
 ):
-    """获取业绩列表"""
+    """获取业绩列表（支持页码分页和游标分页）"""
     try:
         query = db.query(Performance)
         
@@ -93,12 +99,11 @@ async def list_performances(
         if is_verified is not None:
             query = query.filter(Performance.is_verified == is_verified)
         
-        # 总数
-        total = query.count()
-        
-        # 分页
-        offset = (page - 1) * page_size
-        performances = query.order_by(desc(Performance.created_at)).offset(offset).limit(page_size).all()
+        # 按创建时间倒序分页（创建时间 + id 作为游标，游标模式不使用OFFSET）
+        performances, next_cursor = paginate_query(
+            query, Performance.created_at, Performance.id, True, "created_at:desc",
+            lambda item: item.created_at, page_size, cursor=cursor, page=page
+        )
         
         return {
             "success": True,
@@ -124,14 +129,11 @@ async def list_performances(
                 }
                 for perf in performances
             ],
-            "pagination": {
-                "page": page,
-                "page_size": page_size,
-                "total": total,
-                "pages": (total + page_size - 1) // page_size
-            }
+            "pagination": page_info(page, page_size, next_cursor, cursor, query, include_total, pages_key="pages")
         }
         
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"获取业绩列表失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"获取业绩列表失败: {str(e)}")
@@ -191,20 +193,11 @@ async def upload_performance_files(
     uploaded_files = []
     
     try:
-        # 保存文件目录
-        upload_dir = os.path.join(os.path.dirname(__file__), "uploads", "performances")
-        os.makedirs(upload_dir, exist_ok=True)
-        
         # 为每个文件创建独立的业绩记录
         for i, file in enumerate(files):
-            # 生成唯一文件名
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            file_path = os.path.join(upload_dir, f"{timestamp}_{i}_{file.filename}")
-            
-            # 保存文件
-            with open(file_path, "wb") as buffer:
-                content = await file.read()
-                buffer.write(content)
+            # 流式写入blob存储（相同内容只保存一份，超过100MB立即中止）
+            blob = await blob_store.store_upload(db, file, max_size=100 * 1024 * 1024)
+            file_path = blob.path
             
             logger.info(f"✅ 业绩文件保存成功: {file_path}")
             
@@ -230,13 +223,14 @@ async def upload_performance_files(
             db.commit()  # 立即提交每个记录
             db.refresh(performance)
             
-            # 创建文件记录
+            # 创建文件记录（与业绩源文档引用同一blob）
+            blob_store.acquire(db, file_path)
             performance_file = PerformanceFile(
                 performance_id=performance.id,
                 file_path=file_path,
                 file_type="contract" if "合同" in file.filename or "contract" in file.filename.lower() else "supporting_doc",
                 file_name=file.filename,
-                file_size=len(content)
+                file_size=blob.file_size
             )
             
             db.add(performance_file)
@@ -259,6 +253,9 @@ async def upload_performance_files(
             
             logger.info(f"✅ 业绩记录已创建: ID={performance.id}, 项目名称={performance.project_name}")
         
+    except UploadTooLargeError as e:
+        db.rollback()
+        raise HTTPException(status_code=413, detail=f"{file.filename}: {e}")
     except Exception as e:
         logger.error(f"❌ 文件保存失败: {str(e)}")
         db.rollback()
@@ -291,8 +288,19 @@ async def upload_performance_files(
         }
     }
 
-async def analyze_performances_in_background(performance_ids: List[int], enable_vision_analysis: bool, db: Session):
-    """后台异步分析业绩记录"""
+async def _reanalyze_performance_later(performance_id: int, enable_vision_analysis: bool, requeue_attempt: int):
+    """重新排队的业绩分析（原请求的数据库会话已关闭，使用新会话）"""
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        await analyze_performances_in_background([performance_id], enable_vision_analysis, db, requeue_attempt)
+    finally:
+        db.close()
+
+async def analyze_performances_in_background(performance_ids: List[int], enable_vision_analysis: bool, db: Session, requeue_attempt: int = 0):
+    """后台异步分析业绩记录（AI提供商暂时不可用时自动重新排队）"""
+    # 后台分析的AI请求让位于交互请求
+    set_background_priority()
     try:
         from ai_service import ai_service
         
@@ -337,6 +345,29 @@ async def analyze_performances_in_background(performance_ids: List[int], enable_
                     enable_ocr=True
                 )
                 
+                # AI提供商限流、故障或熔断导致失败时，稍后重新分析而不是直接标记失败
+                if ai_result and (ai_result.get("retryable_failure") or ai_result.get("retryable")):
+                    retry_delay = ai_service.background_retries.requeue(
+                        f"performance:{performance_id}",
+                        lambda performance_id=performance_id: _reanalyze_performance_later(
+                            performance_id, enable_vision_analysis, requeue_attempt + 1
+                        ),
+                        requeue_attempt,
+                        retry_after=ai_result.get("retry_after")
+                    )
+                    if retry_delay is not None:
+                        performance.ai_analysis_status = "retry_pending"
+                        performance.description = f"AI服务暂时不可用，将在{retry_delay:.0f}秒后重新分析"
+                        db.commit()
+                        if task_id:
+                            update_ai_task(db, task_id, "retrying", result={
+                                "error": ai_result.get("error", "AI服务暂时不可用"),
+                                "requeue_attempt": requeue_attempt + 1,
+                                "retry_in_seconds": round(retry_delay)
+                            })
+                        logger.warning(f"⏳ AI服务暂时不可用，业绩记录 {performance_id} 将在 {retry_delay:.0f}s 后重新分析")
+                        continue
+                
                 if ai_result and ai_result.get("success"):
                     # 提取业绩信息
                     extracted_info = await _extract_performance_info(ai_result)
@@ -477,20 +508,20 @@ async def _extract_performance_info(ai_result):
     # 使用AI智能提取完整的业绩信息
     try:
         from ai_service import ai_service
-        from config_manager import ConfigManager
         
-        config_manager = ConfigManager()
-        
-        # 构建业绩分析的prompt
+        # 构建业绩分析的prompt（静态部分已预编译）
         performance_analysis_prompt = config_manager.build_prompt("performance_analysis", {
-            "text_content": full_text[:2000]  # 限制文本长度避免token过多
+            "text_content": full_text[:ai_service.chunk_size_chars]  # 超过分块大小的长文本走分块分析
         })
         
         if ai_service.enable_ai and performance_analysis_prompt:
             logger.info("🤖 使用AI智能提取业绩信息...")
             
-            # 调用AI进行完整的业绩信息提取
-            ai_extraction_result = await ai_service.analyze_text(performance_analysis_prompt)
+            # 调用AI进行完整的业绩信息提取（长文本分块并行提取后按字段合并）
+            if ai_service.chunked_analysis_enabled and len(full_text) > ai_service.chunk_size_chars:
+                ai_extraction_result = await ai_service.analyze_text_chunked("performance_analysis", full_text)
+            else:
+                ai_extraction_result = await ai_service.analyze_text(performance_analysis_prompt)
             
             if ai_extraction_result.get("success"):
                 import json
@@ -866,6 +897,7 @@ async def reanalyze_performance(
     enable_vision_analysis: bool = Form(True),
     enable_ocr: bool = Form(True),
     update_fields: bool = Form(False),  # 是否使用AI结果更新字段
+    use_cache: bool = Form(True),  # 为False时跳过LLM响应缓存
     db: Session = Depends(get_db)
 ):
     """重新分析业绩文件"""
@@ -915,7 +947,8 @@ async def reanalyze_performance(
             ai_result = await ai_service.smart_document_analysis(
                 performance.source_document,
                 enable_vision=enable_vision_analysis,
-                enable_ocr=enable_ocr
+                enable_ocr=enable_ocr,
+                use_cache=use_cache
             )
             
             if not ai_result:
@@ -1006,20 +1039,14 @@ async def delete_performance(
         # 删除关联文件
         performance_files = db.query(PerformanceFile).filter(PerformanceFile.performance_id == performance_id).all()
         for perf_file in performance_files:
-            if perf_file.file_path and os.path.exists(perf_file.file_path):
-                try:
-                    os.remove(perf_file.file_path)
-                    logger.info(f"已删除文件: {perf_file.file_path}")
-                except Exception as file_error:
-                    logger.warning(f"删除文件失败: {perf_file.file_path}, 错误: {file_error}")
-        
-        # 删除源文档
-        if performance.source_document and os.path.exists(performance.source_document):
-            try:
-                os.remove(performance.source_document)
-                logger.info(f"已删除源文档: {performance.source_document}")
-            except Exception as source_error:
-                logger.warning(f"删除源文档失败: {performance.source_document}, 错误: {source_error}")
+            if perf_file.file_path:
+                blob_store.discard_path(db, perf_file.file_path)
+                logger.info(f"已释放文件: {perf_file.file_path}")
+        
+        # 删除源文档（blob存储中的文件在无引用后由垃圾回收删除）
+        if performance.source_document:
+            blob_store.discard_path(db, performance.source_document)
+            logger.info(f"已释放源文档: {performance.source_document}")
         
         # 删除数据库记录
         db.delete(performance)
@@ -7,7 +7,6 @@ import os
 import shutil
 from datetime import datetime
 import logging
-import uuid
 import asyncio
 import json
 from pydantic import BaseModel
@@ -15,6 +14,8 @@ from pydantic import BaseModel
 from database import get_db
 from models import Project, ProjectSection, SectionDocument, Template, TemplateField, TemplateMapping, GeneratedDocument
 from document_processor import document_processor
+from upload_ingest import UploadTooLargeError
+from blob_store import blob_store
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -184,6 +185,11 @@ async def update_project(
         db.rollback()
         raise HTTPException(status_code=500, detail=f"更新项目失败: {str(e)}")
 
+def _release_section_documents(db: Session, section: ProjectSection):
+    """释放章节下所有文档的源文件引用（文档记录随章节级联删除）"""
+    for document in section.documents:
+        blob_store.discard_path(db, document.storage_path)
+
 @router.delete("/{project_id}")
 async def delete_project(project_id: int, db: Session = Depends(get_db)):
     """删除项目"""
@@ -193,7 +199,9 @@ async def delete_project(project_id: int, db: Session = Depends(get_db)):
         if not project:
             raise HTTPException(status_code=404, detail="项目不存在")
         
-        # 删除项目(关联的章节、文档会通过cascade自动删除)
+        # 删除项目(关联的章节、文档会通过cascade自动删除)，先释放文档的源文件引用
+        for section in project.sections:
+            _release_section_documents(db, section)
         db.delete(project)
         db.commit()
         
@@ -296,7 +304,8 @@ async def delete_section(section_id: int, db: Session = Depends(get_db)):
         if not section:
             raise HTTPException(status_code=404, detail="章节不存在")
         
-        # 删除章节(关联的文档会通过cascade自动删除)
+        # 删除章节(关联的文档会通过cascade自动删除)，先释放文档的源文件引用
+        _release_section_documents(db, section)
         db.delete(section)
         db.commit()
         
@@ -357,7 +366,9 @@ async def process_document_background(document_id: int, db_str: str):
             # 处理文档
             if document.file_type.lower() in ['pdf', 'image', 'docx', 'doc']:
                 # 转换为Word
-                converted_path, page_count = await document_processor.convert_to_word(document.storage_path)
+                converted_path, page_count = await document_processor.convert_to_word(
+                    document.storage_path, f"section_document_{document.id}"
+                )
                 
                 document.converted_path = converted_path
                 document.page_count = page_count
@@ -396,24 +407,13 @@ async def upload_document(
         if not section:
             raise HTTPException(status_code=404, detail="章节不存在")
         
-        # 生成唯一文件名
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        unique_id = str(uuid.uuid4())[:8]
-        ext = os.path.splitext(file.filename)[1]
-        new_filename = f"{timestamp}_{unique_id}{ext}"
-        
-        # 创建项目专属目录
-        project_dir = os.path.join(UPLOAD_DIR, f"project_{section.project_id}")
-        os.makedirs(project_dir, exist_ok=True)
-        
-        file_path = os.path.join(project_dir, new_filename)
-        file_size = 0
-        
-        # 保存文件
-        with open(file_path, "wb") as buffer:
-            data = await file.read()
-            buffer.write(data)
-            file_size = len(data)
+        # 流式写入blob存储（相同内容只保存一份）
+        try:
+            blob = await blob_store.store_upload(db, file, max_size=200 * 1024 * 1024)
+        except UploadTooLargeError as size_err:
+            raise HTTPException(status_code=413, detail=str(size_err))
+        file_path = blob.path
+        file_size = blob.file_size
         
         # 检测文件类型
         file_ext = os.path.splitext(file.filename)[1].lower().replace('.', '')
@@ -478,10 +478,6 @@ async def upload_documents_batch(
             except:
                 orders_list = []
         
-        # 创建项目专属目录
-        project_dir = os.path.join(UPLOAD_DIR, f"project_{section.project_id}")
-        os.makedirs(project_dir, exist_ok=True)
-        
         for i, file in enumerate(files):
             try:
                 if not file.filename:
@@ -491,28 +487,17 @@ async def upload_documents_batch(
                     })
                     continue
                 
-                # 检查文件大小
-                content = await file.read()
-                file_size = len(content)
-                
-                if file_size > 200 * 1024 * 1024:  # 200MB限制
+                # 流式写入blob存储（超过200MB立即中止，相同内容只保存一份）
+                try:
+                    blob = await blob_store.store_upload(db, file, max_size=200 * 1024 * 1024)
+                except UploadTooLargeError as size_err:
                     failed_files.append({
                         "filename": file.filename,
-                        "error": "文件大小超过限制(200MB)"
+                        "error": str(size_err)
                     })
                     continue
-                
-                # 生成唯一文件名
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                unique_id = str(uuid.uuid4())[:8]
-                ext = os.path.splitext(file.filename)[1]
-                new_filename = f"{timestamp}_{i}_{unique_id}{ext}"
-                
-                file_path = os.path.join(project_dir, new_filename)
-                
-                # 保存文件
-                with open(file_path, "wb") as buffer:
-                    buffer.write(content)
+                file_path = blob.path
+                file_size = blob.file_size
                 
                 # 检测文件类型
                 file_ext = os.path.splitext(file.filename)[1].lower().replace('.', '')
@@ -609,9 +594,8 @@ async def delete_document(document_id: int, db: Session = Depends(get_db)):
         if not document:
             raise HTTPException(status_code=404, detail="文档不存在")
         
-        # 删除文件
-        if document.storage_path and os.path.exists(document.storage_path):
-            os.remove(document.storage_path)
+        # 释放源文件引用，删除转换结果
+        blob_store.discard_path(db, document.storage_path)
         
         if document.converted_path and os.path.exists(document.converted_path):
             os.remove(document.converted_path)
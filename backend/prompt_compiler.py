@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+提示词预编译模块
+
+把提示词模板中的静态部分（文档类型表、业务领域表、项目类型表、学习提醒等）
+一次渲染好，只保留每次调用才变化的变量（如 {text_content}）作为占位，
+调用时按顺序拼接即可，无需重新格式化配置表和重新解析模板。
+"""
+
+import logging
+from string import Formatter
+from typing import Dict, Any, List, Optional, Tuple, Union
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+
+class CompiledPrompt:
+    """预编译的提示词：静态文本片段与动态字段交替排列"""
+
+    __slots__ = ("prompt_type", "template", "version", "_parts", "fields")
+
+    def __init__(self, prompt_type: str, template: str, static_variables: Dict[str, Any], version: Any = None):
+        self.prompt_type = prompt_type
+        self.template = template
+        self.version = version
+        # 片段：str 为已渲染的静态文本，tuple 为 (字段名, 转换, 格式说明)
+        self._parts: List[Union[str, Tuple[str, Optional[str], str]]] = []
+
+        formatter = Formatter()
+        literal: List[str] = []
+        for text, field, spec, conversion in formatter.parse(template):
+            literal.append(text)
+            if field is None:
+                continue
+            if field in static_variables:
+                literal.append(formatter.format_field(
+                    formatter.convert_field(static_variables[field], conversion), spec or ""
+                ))
+                continue
+            if literal:
+                self._parts.append("".join(literal))
+                literal = []
+            self._parts.append((field, conversion, spec or ""))
+        if literal:
+            self._parts.append("".join(literal))
+
+        self.fields = [part[0] for part in self._parts if isinstance(part, tuple)]
+
+    def render(self, variables: Optional[Dict[str, Any]] = None) -> str:
+        """填入动态变量；缺少变量时与 str.format 一样抛出 KeyError"""
+        if not self.fields:
+            return self._parts[0] if self._parts else ""
+
+        variables = variables or {}
+        formatter = Formatter()
+        rendered = []
+        for part in self._parts:
+            if isinstance(part, str):
+                rendered.append(part)
+                continue
+            field, conversion, spec = part
+            value, _ = formatter.get_field(field, (), variables)
+            rendered.append(formatter.format_field(formatter.convert_field(value, conversion), spec))
+        return "".join(rendered)
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+文件全文检索索引模块
+
+为文件管理中的文件建立全文索引：名称（显示名、原始文件名、关键词）、元数据
+（描述、分类、标签）和 Docling 提取的文档正文。中日韩文字按二元组（bigram）切分，
+其他文字按单词切分，写入前先统一切分好，检索时用同样规则切分查询词。
+
+- SQLite：FTS5 虚拟表，bm25 加权排序
+- PostgreSQL：tsvector（名称/元数据/正文分别加权）+ GIN 索引，ts_rank_cd 排序；
+  可用 pg_trgm 时对名称额外建立三元组索引，支持名称中任意子串匹配
+
+索引在上传、修改和重新分析时增量更新；索引不可用时 search() 返回 None，
+调用方退回原有的 LIKE 查询。
+"""
+
+import re
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+SQLITE_TABLE = "managed_files_fts"
+POSTGRES_TABLE = "managed_file_search"
+
+# 中日韩文字（汉字、假名、谚文）
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_CJK_RUN = re.compile(f"([{_CJK}]+)")
+_WORD = re.compile(r"[^\W_]+")
+
+
+def tokenize(text: Optional[str]) -> List[Tuple[str, bool]]:
+    """切分为 (词, 是否中日韩) 列表：中日韩连续文字取二元组（单字保留原字），其他按单词小写"""
+    tokens: List[Tuple[str, bool]] = []
+    if not text:
+        return tokens
+    for word in _WORD.findall(text.lower()):
+        for part in _CJK_RUN.split(word):
+            if not part:
+                continue
+            if _CJK_RUN.fullmatch(part):
+                if len(part) == 1:
+                    tokens.append((part, True))
+                else:
+                    tokens.extend((part[i:i + 2], True) for i in range(len(part) - 1))
+            else:
+                tokens.append((part, False))
+    return tokens
+
+
+def index_terms(text: Optional[str], max_chars: Optional[int] = None) -> str:
+    """生成写入索引的词串（空格分隔）"""
+    if text and max_chars:
+        text = text[:max_chars]
+    return " ".join(token for token, _ in tokenize(text))
+
+
+def _query_terms(query: str, max_terms: int = 32) -> List[Tuple[str, bool]]:
+    """查询词切分：去重；单个汉字和非中日韩单词按前缀匹配"""
+    seen = set()
+    terms = []
+    for token, is_cjk in tokenize(query):
+        if token in seen:
+            continue
+        seen.add(token)
+        terms.append((token, not is_cjk or len(token) == 1))
+        if len(terms) >= max_terms:
+            break
+    return terms
+
+
+def _file_fields(file_record) -> Dict[str, str]:
+    """文件记录中参与检索的名称和元数据文本"""
+    tags = file_record.tags or []
+    if isinstance(tags, (list, tuple)):
+        tags = " ".join(str(tag) for tag in tags)
+    names = " ".join(filter(None, [
+        file_record.display_name, file_record.original_filename, file_record.keywords
+    ]))
+    meta = " ".join(filter(None, [file_record.description, file_record.category, str(tags or "")]))
+    return {"names": names, "meta": meta}
+
+
+def extract_analysis_text(analysis_result: Optional[Dict[str, Any]]) -> Optional[str]:
+    """从 smart_document_analysis 的结果中取出 Docling 提取的正文"""
+    if not analysis_result:
+        return None
+    extraction = (analysis_result.get("results") or analysis_result).get("text_extraction_result") or {}
+    return extraction.get("text") or (extraction.get("extracted_content") or {}).get("text") or None
+
+
+class FileSearchIndex:
+    """managed_files 的全文检索索引（SQLite FTS5 / PostgreSQL tsvector + pg_trgm）"""
+
+    def __init__(self, max_content_chars: int = 100000, max_candidates: int = 1000):
+        self.max_content_chars = max_content_chars
+        self.max_candidates = max_candidates
+
+        self._dialect: Optional[str] = None
+        self._ready = False
+        self._trigram = False
+
+        # 指标
+        self._indexed = 0
+        self._searches = 0
+        self._index_errors = 0
+
+    # ---------- 建表 ----------
+
+    def prepare(self, engine) -> bool:
+        """创建索引表（启动时调用，可重复调用）"""
+        from sqlalchemy import text
+
+        dialect = engine.dialect.name
+        try:
+            with engine.begin() as conn:
+                if dialect == "sqlite":
+                    conn.execute(text(
+                        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_TABLE} "
+                        f"USING fts5(names, meta, content, tokenize='unicode61')"
+                    ))
+                elif dialect == "postgresql":
+                    conn.execute(text(
+                        f"CREATE TABLE IF NOT EXISTS {POSTGRES_TABLE} ("
+                        f"file_id INTEGER PRIMARY KEY, names TEXT, name_terms TEXT, meta_terms TEXT, "
+                        f"content_terms TEXT, document TSVECTOR)"
+                    ))
+                    conn.execute(text(
+                        f"CREATE INDEX IF NOT EXISTS ix_{POSTGRES_TABLE}_document "
+                        f"ON {POSTGRES_TABLE} USING GIN (document)"
+                    ))
+                else:
+                    logger.info(f"数据库 {dialect} 不支持全文索引，文件搜索使用LIKE查询")
+                    return False
+        except Exception as e:
+            logger.warning(f"创建全文索引表失败，文件搜索使用LIKE查询: {e}")
+            return False
+
+        if dialect == "postgresql":
+            # pg_trgm 需要扩展权限，不可用时只用 tsvector
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                    conn.execute(text(
+                        f"CREATE INDEX IF NOT EXISTS ix_{POSTGRES_TABLE}_names_trgm "
+                        f"ON {POSTGRES_TABLE} USING GIN (names gin_trgm_ops)"
+                    ))
+                self._trigram = True
+            except Exception as e:
+                logger.info(f"pg_trgm 不可用，名称子串检索仅使用分词索引: {e}")
+
+        self._dialect = dialect
+        self._ready = True
+        return True
+
+    @property
+    def available(self) -> bool:
+        return self._ready
+
+    # ---------- 增量维护 ----------
+
+    def index_file(self, db, file_record, content: Optional[str] = None):
+        """写入或更新一个文件的索引（在调用方事务中执行，由调用方提交）
+
+        content 为 None 时保留已索引的正文，只更新名称和元数据。
+        """
+        if not self._ready or file_record is None or file_record.id is None:
+            return
+        from sqlalchemy import text
+
+        fields = _file_fields(file_record)
+        params = {
+            "file_id": file_record.id,
+            "name_terms": index_terms(fields["names"]),
+            "meta_terms": index_terms(fields["meta"]),
+            "content_terms": index_terms(content, self.max_content_chars) if content is not None else None,
+        }
+        try:
+            # 保存点：索引写入失败不影响调用方的事务
+            with db.begin_nested():
+                if self._dialect == "sqlite":
+                    if params["content_terms"] is None:
+                        params["content_terms"] = db.execute(
+                            text(f"SELECT content FROM {SQLITE_TABLE} WHERE rowid = :file_id"),
+                            {"file_id": file_record.id}
+                        ).scalar() or ""
+                    db.execute(text(f"DELETE FROM {SQLITE_TABLE} WHERE rowid = :file_id"), {"file_id": file_record.id})
+                    db.execute(text(
+                        f"INSERT INTO {SQLITE_TABLE} (rowid, names, meta, content) "
+                        f"VALUES (:file_id, :name_terms, :meta_terms, :content_terms)"
+                    ), params)
+                else:
+                    params["names"] = fields["names"]
+                    db.execute(text(
+                        f"INSERT INTO {POSTGRES_TABLE} (file_id, names, name_terms, meta_terms, content_terms, document) "
+                        f"VALUES (:file_id, :names, :name_terms, :meta_terms, COALESCE(CAST(:content_terms AS TEXT), ''), "
+                        f"setweight(to_tsvector('simple', :name_terms), 'A') || "
+                        f"setweight(to_tsvector('simple', :meta_terms), 'B') || "
+                        f"setweight(to_tsvector('simple', COALESCE(CAST(:content_terms AS TEXT), '')), 'C')) "
+                        f"ON CONFLICT (file_id) DO UPDATE SET "
+                        f"names = EXCLUDED.names, name_terms = EXCLUDED.name_terms, meta_terms = EXCLUDED.meta_terms, "
+                        f"content_terms = COALESCE(CAST(:content_terms AS TEXT), {POSTGRES_TABLE}.content_terms), "
+                        f"document = setweight(to_tsvector('simple', EXCLUDED.name_terms), 'A') || "
+                        f"setweight(to_tsvector('simple', EXCLUDED.meta_terms), 'B') || "
+                        f"setweight(to_tsvector('simple', COALESCE(CAST(:content_terms AS TEXT), "
+                        f"{POSTGRES_TABLE}.content_terms, '')), 'C')"
+                    ), params)
+            self._indexed += 1
+        except Exception as e:
+            self._index_errors += 1
+            logger.warning(f"更新文件 {file_record.id} 的全文索引失败: {e}")
+
+    def remove_file(self, db, file_id: int):
+        """从索引中删除文件（在调用方事务中执行）"""
+        if not self._ready:
+            return
+        from sqlalchemy import text
+
+        sql = f"DELETE FROM {SQLITE_TABLE} WHERE rowid = :file_id" if self._dialect == "sqlite" \
+            else f"DELETE FROM {POSTGRES_TABLE} WHERE file_id = :file_id"
+        try:
+            with db.begin_nested():
+                db.execute(text(sql), {"file_id": file_id})
+        except Exception as e:
+            self._index_errors += 1
+            logger.warning(f"删除文件 {file_id} 的全文索引失败: {e}")
+
+    def rebuild(self, db, batch_size: int = 500) -> Dict[str, Any]:
+        """按主键分批重建名称和元数据索引（保留已索引的正文），并删除已不存在文件的索引"""
+        if not self._ready:
+            return {"success": False, "error": "全文索引不可用"}
+        from sqlalchemy import text
+        from models import ManagedFile
+
+        indexed = 0
+        last_id = 0
+        while True:
+            files = db.query(ManagedFile).filter(ManagedFile.id > last_id).order_by(ManagedFile.id).limit(batch_size).all()
+            if not files:
+                break
+            for file_record in files:
+                self.index_file(db, file_record)
+            db.commit()
+            indexed += len(files)
+            last_id = files[-1].id
+
+        if self._dialect == "sqlite":
+            removed = db.execute(text(
+                f"DELETE FROM {SQLITE_TABLE} WHERE rowid NOT IN (SELECT id FROM managed_files)"
+            )).rowcount
+        else:
+            removed = db.execute(text(
+                f"DELETE FROM {POSTGRES_TABLE} WHERE file_id NOT IN (SELECT id FROM managed_files)"
+            )).rowcount
+        db.commit()
+        logger.info(f"文件全文索引重建完成: {indexed} 个文件, 清理 {removed} 条失效索引")
+        return {"success": True, "indexed": indexed, "removed": removed}
+
+    def rebuild_if_empty(self):
+        """索引为空而已有文件时（首次启用）建立索引，供启动时在后台线程调用"""
+        if not self._ready:
+            return
+        from sqlalchemy import text
+        from database import SessionLocal
+        from models import ManagedFile
+
+        db = SessionLocal()
+        try:
+            table = SQLITE_TABLE if self._dialect == "sqlite" else POSTGRES_TABLE
+            if db.execute(text(f"SELECT 1 FROM {table} LIMIT 1")).first() is None and \
+                    db.query(ManagedFile.id).first() is not None:
+                self.rebuild(db)
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"建立文件全文索引失败: {e}")
+        finally:
+            db.close()
+
+    # ---------- 检索 ----------
+
+    def search(self, db, query: str, limit: Optional[int] = None) -> Optional[List[Tuple[int, float]]]:
+        """返回按相关度排序的 [(文件ID, 得分)]；索引不可用或查询无可检索词时返回 None"""
+        if not self._ready or not query:
+            return None
+        terms = _query_terms(query)
+        if not terms:
+            return None
+        from sqlalchemy import text
+
+        limit = limit or self.max_candidates
+        try:
+            if self._dialect == "sqlite":
+                match = " ".join(f'"{token}"' + ("*" if prefix else "") for token, prefix in terms)
+                rows = db.execute(text(
+                    f"SELECT rowid, -bm25({SQLITE_TABLE}, 10.0, 4.0, 1.0) AS score FROM {SQLITE_TABLE} "
+                    f"WHERE {SQLITE_TABLE} MATCH :match ORDER BY score DESC LIMIT :limit"
+                ), {"match": match, "limit": limit}).fetchall()
+            else:
+                tsquery = " & ".join(f"{token}:*" if prefix else token for token, prefix in terms)
+                params = {"tsquery": tsquery, "limit": limit}
+                if self._trigram:
+                    params["raw"] = query.strip()
+                    params["like"] = "%" + re.sub(r"([\\%_])", r"\\\1", query.strip()) + "%"
+                    sql = (
+                        f"SELECT file_id, ts_rank_cd(document, q) + similarity(names, :raw) AS score "
+                        f"FROM {POSTGRES_TABLE}, to_tsquery('simple', :tsquery) q "
+                        f"WHERE document @@ q OR names ILIKE :like "
+                        f"ORDER BY score DESC LIMIT :limit"
+                    )
+                else:
+                    sql = (
+                        f"SELECT file_id, ts_rank_cd(document, q) AS score "
+                        f"FROM {POSTGRES_TABLE}, to_tsquery('simple', :tsquery) q "
+                        f"WHERE document @@ q ORDER BY score DESC LIMIT :limit"
+                    )
+                rows = db.execute(text(sql), params).fetchall()
+            self._searches += 1
+            return [(int(file_id), float(score or 0.0)) for file_id, score in rows]
+        except Exception as e:
+            logger.warning(f"全文检索失败，退回LIKE查询: {e}")
+            db.rollback()
+            return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "available": self._ready,
+            "dialect": self._dialect,
+            "trigram": self._trigram,
+            "indexed": self._indexed,
+            "searches": self._searches,
+            "index_errors": self._index_errors,
+            "max_candidates": self.max_candidates,
+        }
+
+
+# 全局文件检索索引实例
+file_search_index = FileSearchIndex()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+系统设置快照缓存模块
+
+一次查询加载整张 system_settings 表到进程内字典，读取设置只做字典查找。
+设置变更时递增数据库中的版本号（settings_version），各进程按固定间隔
+检查版本号，发现变化后整体重新加载并通知已注册的监听者（如AI服务、Docling
+重新读取配置），保证多进程在有限延迟内获得并应用新配置。监听者在事件循环的后台任务中
+执行（耗时的在线程池中执行），读取设置本身不会被重新加载配置阻塞。
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from typing import Dict, Any, Optional, Callable, List, Tuple
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+# 保存设置版本号的保留键
+SETTINGS_VERSION_KEY = "settings_version"
+
+
+class SettingsSnapshot:
+    """system_settings 表的进程内快照"""
+
+    def __init__(self, check_interval: float = 5.0):
+        self.check_interval = check_interval
+
+        self._values: Dict[str, str] = {}
+        self._version: Optional[str] = None
+        self._loaded = False
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._reloads = 0
+        self._version_checks = 0
+        self._listeners: List[Tuple[Callable[[], Any], bool]] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._reload_task: Optional[asyncio.Task] = None
+        self._reload_pending = False
+
+    def get(self, key: str) -> Optional[str]:
+        """获取设置值，不存在或为空时返回None"""
+        self._refresh_if_needed()
+        value = self._values.get(key)
+        return value if value else None
+
+    def invalidate(self):
+        """使本进程快照立即过期（下次读取时检查版本号）"""
+        with self._lock:
+            self._checked_at = 0.0
+
+    def refresh(self):
+        """立即检查版本号，变化时重新加载并通知监听者（本进程修改设置并提交后调用）"""
+        self.invalidate()
+        self._refresh_if_needed()
+
+    def add_listener(self, callback: Callable[[], Any], blocking: bool = False):
+        """注册设置变更监听者：检测到版本号变化（包括其他进程的修改）并重新加载后调用
+
+        在事件循环中注册时，监听者由该循环的后台任务调用；blocking=True 的监听者
+        （如重建Docling转换器）在线程池中执行，避免阻塞事件循环。
+        """
+        if all(registered is not callback for registered, _ in self._listeners):
+            self._listeners.append((callback, blocking))
+        if self._loop is None:
+            try:
+                self._loop = asyncio.get_running_loop()
+            except RuntimeError:
+                pass
+
+    def _refresh_if_needed(self):
+        if self._loaded and time.monotonic() - self._checked_at < self.check_interval:
+            return
+
+        changed = False
+        with self._lock:
+            # 等锁期间可能已被其他线程刷新
+            if self._loaded and time.monotonic() - self._checked_at < self.check_interval:
+                return
+
+            try:
+                from database import SessionLocal
+                from models import SystemSettings
+
+                db = SessionLocal()
+                try:
+                    row = db.query(SystemSettings.setting_value).filter(
+                        SystemSettings.setting_key == SETTINGS_VERSION_KEY
+                    ).first()
+                    self._version_checks += 1
+                    version = row[0] if row else None
+
+                    if not self._loaded or version != self._version:
+                        changed = self._loaded
+                        rows = db.query(SystemSettings.setting_key, SystemSettings.setting_value).all()
+                        self._values = {setting_key: setting_value for setting_key, setting_value in rows}
+                        self._version = version
+                        self._loaded = True
+                        self._reloads += 1
+                        logger.info(f"系统设置快照已加载: {len(self._values)} 项 (版本 {version})")
+                finally:
+                    db.close()
+
+            except Exception as e:
+                # 数据库不可用时保留旧快照，避免每次读取都重试
+                logger.warning(f"刷新系统设置快照失败: {e}")
+
+            self._checked_at = time.monotonic()
+
+        # 在锁外通知，监听者重新加载配置时会再次读取设置
+        if changed:
+            self._notify_listeners()
+
+    def _notify_listeners(self):
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            # 没有事件循环（脚本、测试）时直接调用
+            for callback, _ in list(self._listeners):
+                self._call_listener(callback)
+            return
+        # 可能在线程池中读取设置时发现变化，统一交给事件循环调度
+        loop.call_soon_threadsafe(self._schedule_reload)
+
+    def _schedule_reload(self):
+        # 同一时间只执行一次重新加载，执行期间又有变化时结束后再执行一次
+        if self._reload_task is not None and not self._reload_task.done():
+            self._reload_pending = True
+            return
+        self._reload_task = asyncio.ensure_future(self._run_listeners())
+
+    async def _run_listeners(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._reload_pending = False
+            for callback, blocking in list(self._listeners):
+                if blocking:
+                    await loop.run_in_executor(None, self._call_listener, callback)
+                else:
+                    self._call_listener(callback)
+            if not self._reload_pending:
+                break
+
+    @staticmethod
+    def _call_listener(callback: Callable[[], Any]):
+        try:
+            callback()
+        except Exception as e:
+            logger.warning(f"设置变更监听者执行失败: {e}")
+
+    @staticmethod
+    def bump_version(db) -> int:
+        """在调用方的会话中递增设置版本号（由调用方提交事务，提交后再调用 refresh 或 invalidate）
+
+        使用单条 UPDATE ... SET value = value + 1 原子递增，并发修改不会写入相同的版本号。
+        """
+        from sqlalchemy import cast, Integer, String
+        from sqlalchemy.exc import IntegrityError
+        from models import SystemSettings
+
+        version_filter = SystemSettings.setting_key == SETTINGS_VERSION_KEY
+
+        def _increment() -> int:
+            return db.query(SystemSettings).filter(version_filter).update(
+                {SystemSettings.setting_value: cast(cast(SystemSettings.setting_value, Integer) + 1, String)},
+                synchronize_session=False
+            )
+
+        if not _increment():
+            # 首次写入版本号；并发插入冲突时改为递增对方写入的行
+            try:
+                with db.begin_nested():
+                    db.add(SystemSettings(
+                        setting_key=SETTINGS_VERSION_KEY,
+                        setting_value="1",
+                        setting_type="number",
+                        category="system",
+                        description="设置版本号（设置变更时递增，用于多进程设置缓存失效）",
+                        is_editable=False
+                    ))
+            except IntegrityError:
+                _increment()
+
+        version = db.query(SystemSettings.setting_value).filter(version_filter).scalar()
+        return int(version or 0)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取快照统计"""
+        return {
+            "loaded": self._loaded,
+            "version": self._version,
+            "entries": len(self._values),
+            "reloads": self._reloads,
+            "version_checks": self._version_checks,
+            "check_interval": self.check_interval,
+        }
+
+
+# 全局实例
+settings_snapshot = SettingsSnapshot(
+    check_interval=float(os.getenv("SETTINGS_CACHE_CHECK_INTERVAL", "5"))
+)
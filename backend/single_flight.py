@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+并发请求合并模块（single-flight）
+
+相同键的请求同时到达时只执行一次，其余调用方等待同一个结果。
+用于同一文件被重复上传或前端重试时，避免并行执行完整的Docling/视觉/LLM分析链。
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Dict, Any, Callable, Awaitable
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+
+def make_flight_key(file_hash: str, **options: Any) -> str:
+    """由文件内容哈希和分析选项生成合并键"""
+    payload = json.dumps(options, sort_keys=True, ensure_ascii=False, default=str)
+    return f"{file_hash}_{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]}"
+
+
+def _plain_copy(value: Any) -> Any:
+    """只复制字典/列表容器，其他对象（如 ConversionResult、DoclingDocument）按引用共享"""
+    if isinstance(value, dict):
+        return {k: _plain_copy(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_plain_copy(v) for v in value]
+    return value
+
+
+class _Flight:
+    """一次进行中的调用及其等待方"""
+
+    __slots__ = ("task", "waiters", "snapshot")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+        self.snapshot: Any = None
+
+
+class SingleFlight:
+    """按键合并进行中的异步调用"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._in_flight: Dict[str, _Flight] = {}
+        self._executions = 0
+        self._coalesced = 0
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """执行 factory()；相同键已在执行时等待其结果
+
+        发起方拿到原始结果；合并进来的等待方各拿一份结果快照的容器拷贝，
+        修改嵌套的 results / text_extraction_result 不会互相影响。
+        """
+        flight = self._in_flight.get(key)
+        if flight is not None:
+            self._coalesced += 1
+            flight.waiters += 1
+            logger.info(f"{self.name} 合并重复请求: {key[:16]}... (等待中 {self._coalesced} 次)")
+            await asyncio.shield(flight.task)
+            return _plain_copy(flight.snapshot)
+
+        task = asyncio.ensure_future(factory())
+        flight = _Flight(task)
+        self._in_flight[key] = flight
+        self._executions += 1
+        task.add_done_callback(lambda finished: self._on_done(key, flight))
+
+        # shield: 发起方被取消时不影响其他等待方
+        return await asyncio.shield(task)
+
+    def _on_done(self, key: str, flight: _Flight):
+        if self._in_flight.get(key) is flight:
+            del self._in_flight[key]
+        task = flight.task
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            # 所有调用方都已取消时，避免“异常未被获取”的警告
+            logger.debug(f"{self.name} 执行失败: {task.exception()}")
+            return
+        # 在任何调用方恢复执行之前留下快照，发起方之后修改结果不会影响等待方
+        if flight.waiters:
+            flight.snapshot = _plain_copy(task.result())
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._in_flight),
+            "executions": self._executions,
+            "coalesced": self._coalesced,
+        }
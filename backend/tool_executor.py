@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+AI工具并发执行模块
+
+同一请求中的多个工具调用（网页读取、数据库查询等，多为I/O密集且互不依赖）并发执行：
+限制并发数，按工具设置超时，可选地在同一请求内对相同参数的调用只执行一次，
+结果按原始顺序返回并附带每次调用的耗时。
+"""
+
+import json
+import time
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+ToolCallable = Callable[[str, Dict[str, Any]], Awaitable[Any]]
+
+
+class ToolCallSession:
+    """一次请求内的工具调用（共享并发上限和记忆化结果）"""
+
+    def __init__(self, executor: "ToolExecutor", execute: ToolCallable, memoize: bool):
+        self._executor = executor
+        self._execute = execute
+        self._memoize = memoize
+        self._semaphore = asyncio.Semaphore(executor.max_concurrency)
+        self._memo: Dict[str, asyncio.Task] = {}
+
+    async def _invoke(self, tool_name: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """受并发上限和超时约束地执行一次工具"""
+        timeout = self._executor.timeout_for(tool_name)
+        async with self._semaphore:
+            started = time.monotonic()
+            try:
+                result = await asyncio.wait_for(self._execute(tool_name, parameters), timeout)
+                outcome = {"success": True, "result": result}
+                # 工具自身返回 {"success": False, "error": ...} 时按失败计
+                if isinstance(result, dict) and result.get("success") is False:
+                    outcome["success"] = False
+                    outcome["error"] = result.get("error") or "工具执行失败"
+            except asyncio.TimeoutError:
+                logger.warning(f"工具 {tool_name} 执行超时 ({timeout:g}s)")
+                outcome = {"success": False, "error": f"工具执行超时（{timeout:g}秒）", "timed_out": True}
+            except Exception as e:
+                logger.warning(f"工具 {tool_name} 执行失败: {e}")
+                outcome = {"success": False, "error": str(e)}
+            outcome["elapsed_ms"] = round((time.monotonic() - started) * 1000, 1)
+            return outcome
+
+    async def call(self, index: int, tool_name: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """执行一个工具调用，返回 {index, tool_name, parameters, success, result|error, elapsed_ms, memoized}"""
+        parameters = parameters or {}
+        started = time.monotonic()
+        memoized = False
+
+        if self._memoize:
+            key = f"{tool_name}:{json.dumps(parameters, sort_keys=True, ensure_ascii=False, default=str)}"
+            task = self._memo.get(key)
+            if task is None:
+                task = asyncio.ensure_future(self._invoke(tool_name, parameters))
+                self._memo[key] = task
+            else:
+                memoized = True
+            outcome = dict(await asyncio.shield(task))
+        else:
+            outcome = await self._invoke(tool_name, parameters)
+
+        record = {"index": index, "tool_name": tool_name, "parameters": parameters, **outcome, "memoized": memoized}
+        if memoized:
+            # 复用的调用只记录等待时间
+            record["elapsed_ms"] = round((time.monotonic() - started) * 1000, 1)
+        self._executor.record(record)
+        return record
+
+    async def cancel(self):
+        """取消会话中仍在执行的工具调用（如客户端断开），等待其结束"""
+        unfinished = [task for task in self._memo.values() if not task.done()]
+        for task in unfinished:
+            task.cancel()
+        if unfinished:
+            await asyncio.gather(*unfinished, return_exceptions=True)
+
+    async def run_all(self, calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """并发执行 [{tool_name, parameters}]，按原始顺序返回记录"""
+        return list(await asyncio.gather(*(
+            self.call(index, call.get("tool_name"), call.get("parameters", {}))
+            for index, call in enumerate(calls)
+        )))
+
+
+class ToolExecutor:
+    """工具并发执行器（并发上限、按工具超时、调用统计）"""
+
+    def __init__(self, max_concurrency: int = 4, default_timeout: float = 30.0,
+                 timeouts: Optional[Dict[str, float]] = None):
+        self.max_concurrency = max(1, max_concurrency)
+        self.default_timeout = default_timeout
+        self.timeouts: Dict[str, float] = timeouts or {}
+
+        # 指标
+        self._calls = 0
+        self._memoized = 0
+        self._timed_out = 0
+        self._failed = 0
+        self._total_ms: Dict[str, float] = {}
+        self._count: Dict[str, int] = {}
+
+    def configure(self, max_concurrency: int, default_timeout: float, timeouts: Optional[Dict[str, float]] = None):
+        self.max_concurrency = max(1, max_concurrency)
+        self.default_timeout = default_timeout
+        self.timeouts = timeouts or {}
+
+    def timeout_for(self, tool_name: str) -> float:
+        return float(self.timeouts.get(tool_name, self.default_timeout))
+
+    def session(self, execute: ToolCallable, memoize: bool = True) -> ToolCallSession:
+        """为一次请求创建调用会话"""
+        return ToolCallSession(self, execute, memoize)
+
+    def record(self, record: Dict[str, Any]):
+        self._calls += 1
+        if record.get("memoized"):
+            self._memoized += 1
+            return
+        if record.get("timed_out"):
+            self._timed_out += 1
+        elif not record.get("success"):
+            self._failed += 1
+        name = record.get("tool_name") or ""
+        self._total_ms[name] = self._total_ms.get(name, 0.0) + record.get("elapsed_ms", 0.0)
+        self._count[name] = self._count.get(name, 0) + 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "default_timeout": self.default_timeout,
+            "timeouts": self.timeouts,
+            "calls": self._calls,
+            "memoized": self._memoized,
+            "timed_out": self._timed_out,
+            "failed": self._failed,
+            "avg_ms": {
+                name: round(total / self._count[name], 1)
+                for name, total in self._total_ms.items()
+            },
+        }
+
+
+# 全局工具执行器实例
+tool_executor = ToolExecutor()
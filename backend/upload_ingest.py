@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+上传文件流式接收模块
+
+按块读取上传文件，边写入目标目录下的临时文件边计算哈希和大小，
+超过大小限制时立即中止；确认后原子地重命名到最终路径。
+无论文件多大，内存占用只有一个块。
+"""
+
+import os
+import hashlib
+import asyncio
+import logging
+import tempfile
+from typing import Optional, Union, BinaryIO
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+# 每次读取的块大小
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+def _current_umask() -> int:
+    # os.umask 只能通过设置来读取，导入时读取一次（此时尚无其他线程创建文件）
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+# 普通文件按进程umask应有的权限（mkstemp 创建的临时文件固定为0600，提交时恢复）
+FILE_MODE = 0o666 & ~_current_umask()
+
+
+class UploadTooLargeError(ValueError):
+    """上传文件超过大小限制"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        super().__init__(f"文件大小超过限制({max_size // (1024 * 1024)}MB)")
+
+
+class IngestedUpload:
+    """已写入临时文件的上传（commit 后移动到最终路径，否则 discard 删除）"""
+
+    def __init__(self, filename: Optional[str], temp_path: str, file_hash: str, file_size: int):
+        self.filename = filename
+        self.temp_path = temp_path
+        self.file_hash = file_hash
+        self.file_size = file_size
+        self.path: Optional[str] = None
+
+    def commit(self, final_path: Union[str, os.PathLike]) -> str:
+        """原子地移动到最终路径（与临时文件在同一目录/文件系统），权限与直接 open() 创建的文件一致"""
+        final_path = str(final_path)
+        os.chmod(self.temp_path, FILE_MODE)
+        os.replace(self.temp_path, final_path)
+        self.path = final_path
+        return final_path
+
+    def discard(self):
+        """删除未提交的临时文件（已提交时不做任何事）"""
+        if self.path is None and os.path.exists(self.temp_path):
+            try:
+                os.remove(self.temp_path)
+            except OSError as e:
+                logger.warning(f"删除上传临时文件失败 {self.temp_path}: {e}")
+
+    def __enter__(self) -> "IngestedUpload":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.discard()
+        return False
+
+
+def _write_chunk(output: BinaryIO, hasher, chunk: bytes):
+    output.write(chunk)
+    hasher.update(chunk)
+
+
+async def ingest_upload(
+    upload,
+    target_dir: Union[str, os.PathLike],
+    max_size: Optional[int] = None,
+    hash_algorithm: str = "md5",
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> IngestedUpload:
+    """把 UploadFile 流式写入 target_dir 下的临时文件，返回哈希、大小和临时路径
+
+    超过 max_size 时删除临时文件并抛出 UploadTooLargeError。
+    """
+    # 客户端声明了大小时，在读取前就拒绝
+    declared_size = getattr(upload, "size", None)
+    if max_size is not None and declared_size is not None and declared_size > max_size:
+        raise UploadTooLargeError(max_size)
+
+    os.makedirs(target_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=str(target_dir), prefix=".upload-", suffix=".part")
+    hasher = hashlib.new(hash_algorithm)
+    file_size = 0
+    loop = asyncio.get_event_loop()
+
+    try:
+        with os.fdopen(fd, "wb") as output:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                file_size += len(chunk)
+                if max_size is not None and file_size > max_size:
+                    raise UploadTooLargeError(max_size)
+                await loop.run_in_executor(None, _write_chunk, output, hasher, chunk)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+    return IngestedUpload(upload.filename, temp_path, hasher.hexdigest(), file_size)
+
+
+async def save_upload(
+    upload,
+    final_path: Union[str, os.PathLike],
+    max_size: Optional[int] = None,
+    hash_algorithm: str = "md5"
+) -> IngestedUpload:
+    """流式保存 UploadFile 到 final_path（先写同目录临时文件再原子重命名）"""
+    ingested = await ingest_upload(upload, os.path.dirname(str(final_path)) or ".", max_size, hash_algorithm)
+    with ingested:
+        ingested.commit(final_path)
+    return ingested
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+视觉分析图片预处理模块
+
+在内存中用PyMuPDF栅格化PDF页面（不落盘），按模型有效分辨率缩放，
+并用Pillow重新编码为真实的JPEG/WebP，返回可直接放入请求的base64数据。
+"""
+
+import io
+import base64
+import logging
+from typing import List, Tuple
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+SUPPORTED_IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp']
+
+_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg"),
+    "jpg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+}
+
+
+def _encode(image: Image.Image, image_format: str, quality: int) -> Tuple[str, str]:
+    """编码为JPEG/WebP，返回 (mime类型, base64数据)"""
+    pil_format, mime_type = _FORMATS.get(image_format.lower(), _FORMATS["jpeg"])
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format=pil_format, quality=quality, optimize=pil_format == "JPEG")
+    return mime_type, base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+def rasterize_pdf_pages(
+    pdf_path: str,
+    max_pages: int,
+    max_side: int,
+    image_format: str = "jpeg",
+    quality: int = 80
+) -> Tuple[List[Tuple[str, str]], int]:
+    """栅格化PDF前 max_pages 页，返回 ([(mime类型, base64数据)], 总页数)"""
+    images: List[Tuple[str, str]] = []
+    with fitz.open(pdf_path) as pdf_document:
+        page_count = pdf_document.page_count
+        for page_index in range(min(max_pages, page_count)):
+            page = pdf_document.load_page(page_index)
+            # 直接按目标分辨率渲染，最长边不超过 max_side
+            zoom = min(4.0, max_side / max(page.rect.width, page.rect.height, 1))
+            pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+            image = Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+            images.append(_encode(image, image_format, quality))
+    return images, page_count
+
+
+def encode_image_file(
+    image_path: str,
+    max_side: int,
+    image_format: str = "jpeg",
+    quality: int = 80
+) -> Tuple[str, str]:
+    """读取图片文件，缩放到最长边不超过 max_side 并重新编码"""
+    with Image.open(image_path) as image:
+        image.thumbnail((max_side, max_side))
+        return _encode(image, image_format, quality)
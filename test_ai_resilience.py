@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+测试AI调用重试与熔断
+
+启动一个本地桩服务注入故障（503、带Retry-After的429、400），通过 AIService._call_ai_api
+的真实调用链（请求构建、调度器、重试与熔断）验证：
+退避重试后成功、4xx不重试、连续失败后熔断快速失败、探测请求被取消后释放探测名额、冷却后探测恢复；
+以及后台任务在重试耗尽后由 BackgroundRetryQueue 重新排队、成功后队列清空、超过上限后放弃。
+"""
+import asyncio
+import sys
+import os
+import time
+import tempfile
+
+# 添加backend目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+
+# 导入ai_service会创建全局实例并读取设置，使用临时数据库避免影响本地数据
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_ai_resilience.db')}")
+
+from aiohttp import web, ClientSession
+
+MESSAGES = [{"role": "user", "content": "测试"}]
+
+
+def create_stub_app(faults):
+    """按顺序返回 faults 中的故障，用完后返回200"""
+    async def chat_completions(request):
+        fault = faults.pop(0) if faults else "ok"
+        if fault == "slow":
+            await asyncio.sleep(5)
+        if fault == "503":
+            return web.Response(status=503, text="service unavailable")
+        if fault == "429":
+            return web.Response(status=429, text="rate limited", headers={"Retry-After": "0.2"})
+        if fault == "400":
+            return web.Response(status=400, text="bad request")
+        return web.json_response({"choices": [{"message": {"content": "测试成功"}}]})
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    return app
+
+
+class StubHttpPool:
+    """替代共享HTTP连接池：所有提供商使用同一个会话"""
+
+    def __init__(self, session):
+        self.session = session
+
+    async def get_session(self, provider):
+        return self.session
+
+
+def create_service(base_url, session):
+    """构造只包含调用链所需组件的AIService（不连接数据库、不读取系统设置）"""
+    from ai_service import AIService
+    from ai_scheduler import AIRequestScheduler
+    from ai_resilience import AIResilience, BackgroundRetryQueue
+    from llm_cache import LLMResponseCache
+
+    service = AIService.__new__(AIService)
+    service.ai_provider = "custom"
+    service.ai_api_key = "test-key"
+    service.ai_base_url = base_url
+    service.http_pool = StubHttpPool(session)
+    service.scheduler = AIRequestScheduler()
+    service.resilience = AIResilience()
+    service.resilience.configure(max_attempts=3, base_delay=0.05, max_delay=1.0, failure_threshold=3, reset_timeout=0.5)
+    # configure() 限制最小延迟为1秒，测试中直接构造以缩短等待
+    service.background_retries = BackgroundRetryQueue(max_requeues=2, base_delay=0.05)
+    service.response_cache = LLMResponseCache(
+        os.path.join(tempfile.mkdtemp(), "responses.db"), max_size_bytes=0, ttl_seconds=0, enabled=False
+    )
+    return service
+
+
+async def run_requeued_job(service, job_key, outcomes, finished, attempt=0):
+    """模拟后台分析任务：调用可重试失败时交给重新排队队列，与业绩/文件后台分析的处理方式相同"""
+    result = await service._call_ai_api(MESSAGES, "test-model", use_cache=False)
+    outcomes.append(result["success"])
+    if result["success"] or not result.get("retryable"):
+        finished.set()
+        return
+    delay = service.background_retries.requeue(
+        job_key,
+        lambda: run_requeued_job(service, job_key, outcomes, finished, attempt + 1),
+        attempt,
+        retry_after=result.get("retry_after")
+    )
+    if delay is None:
+        finished.set()
+
+
+async def test_ai_resilience():
+    """测试重试、Retry-After、熔断和后台重新排队"""
+    from ai_resilience import CircuitBreaker
+
+    faults = []
+    runner = web.AppRunner(create_stub_app(faults))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    try:
+        async with ClientSession() as session:
+            service = create_service(f"http://127.0.0.1:{port}/v1", session)
+            call = lambda: service._call_ai_api(MESSAGES, "test-model", use_cache=False)
+
+            print("🔍 503 → 429(Retry-After) → 成功")
+            faults[:] = ["503", "429"]
+            started = time.monotonic()
+            result = await call()
+            assert result["success"], result
+            assert result["response"]["choices"][0]["message"]["content"] == "测试成功"
+            assert time.monotonic() - started >= 0.2, "未遵循Retry-After"
+            print("✅ 重试后成功，并遵循了Retry-After")
+
+            print("🔍 400 不重试")
+            faults[:] = ["400", "ok"]
+            result = await call()
+            assert not result["success"] and not result.get("retryable"), result
+            assert faults == ["ok"], "4xx不应重试"
+            faults.clear()
+            print("✅ 4xx直接返回")
+
+            print("🔍 重试耗尽")
+            faults[:] = ["503"] * 3
+            result = await call()
+            assert not result["success"] and result["retryable"] and result["attempts"] == 3, result
+            assert service.resilience.breaker("custom").state == CircuitBreaker.OPEN
+            print("✅ 重试耗尽返回retryable错误，熔断器已打开")
+
+            print("🔍 熔断期间快速失败")
+            result = await call()
+            assert result.get("circuit_open"), result
+            print("✅ 熔断期间不请求提供商")
+
+            print("🔍 探测请求被取消")
+            await asyncio.sleep(0.6)
+            faults[:] = ["slow"]
+            probe = asyncio.ensure_future(call())
+            await asyncio.sleep(0.1)
+            probe.cancel()
+            try:
+                await probe
+            except asyncio.CancelledError:
+                pass
+            breaker = service.resilience.breaker("custom")
+            assert breaker.state == CircuitBreaker.HALF_OPEN and not breaker._probe_in_flight, breaker.get_stats()
+            print("✅ 取消后释放探测名额，不会一直熔断")
+
+            print("🔍 冷却后探测恢复")
+            result = await call()
+            assert result["success"], result
+            assert service.resilience.breaker("custom").state == CircuitBreaker.CLOSED
+            print("✅ 探测成功，熔断器关闭")
+
+            # 后台重新排队：熔断阈值调高，只验证重新排队本身
+            service.resilience.configure(max_attempts=3, base_delay=0.05, max_delay=1.0, failure_threshold=100, reset_timeout=0.5)
+
+            print("🔍 重试耗尽后重新排队，再次执行成功")
+            faults[:] = ["503"] * 3
+            outcomes, finished = [], asyncio.Event()
+            await run_requeued_job(service, "job:1", outcomes, finished)
+            assert service.background_retries.get_stats()["pending"] == ["job:1"], "任务应在等待重新执行"
+            await asyncio.wait_for(finished.wait(), 5)
+            stats = service.background_retries.get_stats()
+            assert outcomes == [False, True], outcomes
+            assert stats["requeued"] == 1 and stats["pending"] == [], stats
+            print("✅ 任务重新排队一次后成功，队列已清空")
+
+            print("🔍 超过重新排队上限后放弃")
+            faults[:] = ["503"] * 9
+            outcomes, finished = [], asyncio.Event()
+            await run_requeued_job(service, "job:2", outcomes, finished)
+            await asyncio.wait_for(finished.wait(), 5)
+            stats = service.background_retries.get_stats()
+            assert outcomes == [False, False, False], outcomes
+            assert stats["requeued"] == 3 and stats["abandoned"] == 1 and stats["pending"] == [], stats
+            assert not faults, "每次执行都应重试到上限"
+            print("✅ 重新排队2次后放弃，不再占用队列")
+
+        print(f"\n📊 统计: {service.resilience.get_stats()}")
+        print(f"📊 重新排队: {service.background_retries.get_stats()}")
+        print("\n🎉 所有测试完成！")
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(test_ai_resilience())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+测试列表游标分页
+
+在临时SQLite数据库中写入奖项记录（created_at 由 func.now() 生成，精度到秒，多条记录同一秒；
+另有部分 created_at 为空），分别用游标和页码逐页取完，验证：
+每条记录恰好出现一次、顺序与整表排序一致、NULL记录排在最后、两种模式结果相同。
+"""
+import sys
+import os
+import tempfile
+
+# 添加backend目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+
+# 使用临时数据库，避免影响本地数据
+_db_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test_pagination.db')}"
+
+from sqlalchemy import nulls_last
+
+
+def walk_with_cursor(db, descending, page_size):
+    """从第一页开始沿 next_cursor 取完所有页"""
+    from models import Award
+    from pagination import paginate_query
+
+    sort_key = f"created_at:{'desc' if descending else 'asc'}"
+    ids, cursor, pages = [], None, 0
+    while True:
+        items, cursor = paginate_query(
+            db.query(Award), Award.created_at, Award.id, descending, sort_key,
+            lambda item: item.created_at, page_size, cursor=cursor
+        )
+        ids.extend(item.id for item in items)
+        pages += 1
+        if cursor is None:
+            return ids
+        if pages > 100:
+            raise AssertionError("游标分页没有结束")
+
+
+def walk_with_pages(db, descending, page_size):
+    """按页码逐页取完"""
+    from models import Award
+    from pagination import paginate_query
+
+    sort_key = f"created_at:{'desc' if descending else 'asc'}"
+    ids, page = [], 1
+    while True:
+        items, cursor = paginate_query(
+            db.query(Award), Award.created_at, Award.id, descending, sort_key,
+            lambda item: item.created_at, page_size, page=page
+        )
+        ids.extend(item.id for item in items)
+        if cursor is None:
+            return ids
+        page += 1
+
+
+def test_pagination():
+    """测试游标分页与页码分页"""
+    from database import init_db, SessionLocal
+    from models import Award
+
+    init_db()
+    db = SessionLocal()
+    try:
+        # 同一秒内写入的记录 created_at 完全相同，只能靠 id 区分
+        for i in range(7):
+            db.add(Award(title=f"奖项{i}", brand="测试", year=2024, business_type="测试"))
+        db.commit()
+        for i in range(3):
+            award = Award(title=f"无时间奖项{i}", brand="测试", year=2024, business_type="测试")
+            db.add(award)
+            db.flush()
+            award.created_at = None
+        db.commit()
+
+        total = db.query(Award).count()
+        print(f"📊 共写入 {total} 条记录")
+
+        for descending in (True, False):
+            column = Award.created_at.desc() if descending else Award.created_at.asc()
+            id_order = Award.id.desc() if descending else Award.id.asc()
+            expected = [row.id for row in db.query(Award.id).order_by(nulls_last(column), id_order)]
+
+            for page_size in (1, 3, 4, 10, 20):
+                by_cursor = walk_with_cursor(db, descending, page_size)
+                by_page = walk_with_pages(db, descending, page_size)
+                label = f"{'倒序' if descending else '正序'} page_size={page_size}"
+                assert by_cursor == expected and by_page == expected, \
+                    f"{label}: 期望 {expected}, 游标 {by_cursor}, 页码 {by_page}"
+                print(f"✅ {label}: {by_cursor}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    print("🚀 开始测试游标分页...")
+    test_pagination()
+    print("\n🎉 游标分页测试通过!")